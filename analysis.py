@@ -1,13 +1,87 @@
 import ast
 import copy
+import threading
+import time
+from symbols import ModuleIndex
 
 
-class Analysis:
-    def __init__(self, functionTable):
-        self.functionTable = functionTable
+"""
+Limits on the analysis of a single function, including the callees it
+expands. None disables a limit
+
+@param seconds: wall time
+@param iterations: passes over loop bodies while looking for fixpoints
+@param tableSize: definitions and dependencies kept in a reference table
+"""
+class AnalysisBudget:
+    def __init__(self, seconds=None, iterations=None, tableSize=None):
+        self.seconds = seconds
+        self.iterations = iterations
+        self.tableSize = tableSize
+
+
+"""
+Raised when the analysis of a function goes over its AnalysisBudget, the
+results of the function are not known and must be treated conservatively
+"""
+class BudgetExceeded(Exception):
+    pass
+
+
+"""
+Reference table of a function, mapping each variable to its definitions
+by line. It keeps the number of definitions and dependencies in it for
+the table size budget, so entries are set through Analysis.setDefinition
+"""
+class ReferenceTable(dict):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.size = sum(1 + len(deps) for var in self for deps in self[var].values())
+
+
+"""
+State of one analysis of a function, shared with the callees it expands
+
+@param budget: AnalysisBudget of the function, None for no limits
+"""
+class AnalysisContext:
+    def __init__(self, budget=None):
         self.currentScope = []
         self.updateToScoop = {}
+        self.loopWrites = []
+        self.readsCache = {}
+        self.callStack = []
+        self.iterations = 0
+        self.deadline = None
+        if budget is not None and budget.seconds is not None:
+            self.deadline = time.monotonic() + budget.seconds
+
+
+"""
+Reaching-definition analysis over the functions of a module. The instance
+only holds data about the module, every call of processFunction from
+outside the analysis runs in a new AnalysisContext kept per thread, so one
+instance can analyze several functions at the same time from different
+threads and the work for a function does not depend on earlier calls
+
+@param functionTable: mapping from function names to definitions
+@param modules: ModuleScope resolving calls to imported functions, None to not resolve them
+@param budget: AnalysisBudget of each analyzed function, None for no limits
+"""
+class Analysis:
+    def __init__(self, functionTable, modules=None, budget=None):
+        self.functionTable = functionTable
+        self.modules = modules
+        self.budget = budget
         self.processCallees = True
+        self.local = threading.local()
+
+    """
+    Context of the analysis running in the current thread
+    """
+    @property
+    def context(self):
+        return self.local.context
 
     """
     Check whether the current if condition has else clause by
@@ -35,7 +109,12 @@ class Analysis:
 
     """
     Keep interpreting the loop body until the interpretation
-    does not result in new state
+    does not result in new state. Every definition made while interpreting
+    the body is logged, after each pass the definitions of a variable are
+    merged into its entry at the loop line. Only variables whose merged
+    entry grew are marked as changed, and the next pass re-interprets
+    only the statements reading a changed variable. The fixpoint is
+    reached when no variable changed
 
     @param node: AST node representing the loop we are in
     @param body: List of statements in the loop body
@@ -45,40 +124,213 @@ class Analysis:
     @param use_table: mapping from each variable to its use locations
     """
     def loopFixpoint(self, node, body, reference_table, l_update, use_table):
-        beforeLoop = copy.deepcopy(reference_table)
+        self.context.loopWrites.append({})
+        heads = {}
+        self.checkBudget(reference_table, 1)
         for nd in body:
             self.processNode(nd, reference_table, l_update, use_table)
-        
-        while True:
-            flag = True
-            for var in beforeLoop:
-                combined = []
-                for elem in reference_table[var]:
-                    if elem not in beforeLoop[var]:
-                        combined += reference_table[var][elem]
-                if len(combined) > 0:
-                    combined = list(set(combined))
-                    reference_table[var][node.lineno] = combined
-                    l_update[var] = node.lineno
-                    self.updateToScoop[var][node.lineno] = self.currentScope[:]
-                    flag = False
-                    for use in combined:
-                        if use in use_table:
-                            use_table[use].append(node.lineno)
-                        else:
-                            use_table[use] = [node.lineno]
-            if flag:
-                break
-            beforeLoop = copy.deepcopy(reference_table)
-            self.processNode(nd, reference_table, l_update, use_table)
-        
-        self.currentScope.pop(-1)
+        changed = self.mergeLoopWrites(node, heads, reference_table, l_update, use_table)
+
+        while changed:
+            self.checkBudget(reference_table, 1)
+            writes = self.context.loopWrites[-1]
+            for nd in body:
+                if self.statementReads(nd).isdisjoint(changed):
+                    continue
+                self.processNode(nd, reference_table, l_update, use_table)
+                # Statements after this one see the new definitions
+                changed = changed | writes.keys()
+            changed = self.mergeLoopWrites(node, heads, reference_table, l_update, use_table)
+
+        # Definitions in the loop are also definitions in the enclosing loop
+        writes = self.context.loopWrites.pop(-1)
+        if self.context.loopWrites:
+            for var in writes:
+                self.recordWrite(var, node.lineno)
+
+        self.context.currentScope.pop(-1)
         # Add the data coming out of for block to an non-existing line
         for var in reference_table:
             if node.lineno in reference_table[var]:
-                reference_table[var][node.end_lineno + 0.5] = reference_table[var][node.lineno]
+                self.setDefinition(reference_table, var, node.end_lineno + 0.5, reference_table[var][node.lineno])
                 l_update[var] = node.end_lineno + 0.5
-                self.updateToScoop[var][node.end_lineno + 0.5] = self.currentScope[:]
+                self.setScope(var, node.end_lineno + 0.5)
+                self.recordWrite(var, node.end_lineno + 0.5)
+
+    """
+    Merge the definitions logged during the last pass over a loop body
+    into the entries at the loop line and clear the log. Returns the
+    variables whose entry at the loop line grew
+
+    @param node: AST node representing the loop we are in
+    @param heads: mapping from each variable to its merged dependencies
+                  at the loop line, kept across passes
+    """
+    def mergeLoopWrites(self, node, heads, reference_table, l_update, use_table):
+        writes = self.context.loopWrites[-1]
+        changed = set()
+        for var in writes:
+            # Variables first defined in an else branch are not merged
+            # into the table by processIfStmt
+            if var in self.functionTable or var not in reference_table:
+                continue
+            if var not in heads:
+                heads[var] = set(reference_table[var].get(node.lineno, []))
+            combined = heads[var].copy()
+            for line in writes[var]:
+                # Entries can also be dropped when a nested loop resets its target
+                if line != node.lineno and line in reference_table[var]:
+                    combined.update(reference_table[var][line])
+            added = combined - heads[var]
+            if added:
+                heads[var] = combined
+                changed.add(var)
+                for use in added:
+                    if use in use_table:
+                        use_table[use].append(node.lineno)
+                    else:
+                        use_table[use] = [node.lineno]
+            if combined and (added or node.lineno not in reference_table[var]):
+                self.setDefinition(reference_table, var, node.lineno, list(combined))
+                l_update[var] = node.lineno
+                self.setScope(var, node.lineno)
+        writes.clear()
+        return changed
+
+    """
+    Log a definition made while interpreting a loop body
+    """
+    def recordWrite(self, var, line):
+        if self.context.loopWrites:
+            writes = self.context.loopWrites[-1]
+            if var in writes:
+                writes[var].add(line)
+            else:
+                writes[var] = {line}
+
+    """
+    Set the dependencies of a variable at a line, keeping the size of the
+    table up to date
+
+    @param reference_table: mapping from each variable to their definitions
+    @param var: defined variable
+    @param line: line of the definition
+    @param deps: dependencies of the definition
+    """
+    def setDefinition(self, reference_table, var, line, deps):
+        entries = reference_table.setdefault(var, {})
+        old = entries.get(line)
+        entries[line] = deps
+        if isinstance(reference_table, ReferenceTable):
+            reference_table.size += len(deps) + (1 if old is None else -len(old))
+
+    """
+    Drop every definition of a variable from a table
+
+    @param reference_table: mapping from each variable to their definitions
+    @param var: variable to drop
+    """
+    def dropDefinitions(self, reference_table, var):
+        entries = reference_table.pop(var, {})
+        if isinstance(reference_table, ReferenceTable):
+            reference_table.size -= sum(1 + len(deps) for deps in entries.values())
+
+    """
+    Add the variables a method call passes to the object it is called on to
+    the dependencies of the variable holding the object. The definition the
+    variable has at the call is extended, so the call is not a new
+    definition that could be found unused
+
+    @param func: called expression, an attribute of the object
+    @param variables: variables the arguments of the call depend on
+    @param reference_table: mapping from each variable to their definitions
+    @param l_update: mapping from each variable to their last updated location
+    """
+    def recordMutation(self, func, variables, reference_table, l_update):
+        base = func
+        while isinstance(base, (ast.Attribute, ast.Subscript)):
+            base = base.value
+        if isinstance(base, ast.Name):
+            var = base.id
+            if var in reference_table and var in l_update and l_update[var] in reference_table[var]:
+                merged = list(set(reference_table[var][l_update[var]] + variables))
+                if len(merged) != len(set(reference_table[var][l_update[var]])):
+                    self.recordWrite(var, l_update[var])
+                self.setDefinition(reference_table, var, l_update[var], merged)
+
+    """
+    Process a store into an item or an attribute of an object, such as
+    a[i] = x or a.b += x. The object the base variable holds changes in
+    place, so like for a method call the stored value and the indexes are
+    added to the definition the variable has and the store is not a new
+    definition. The variable is used at the store, attribute names are not
+    variables
+
+    @param target: subscript or attribute the value is stored into
+    @param value: stored value
+    @param reference_table: mapping from each variable to their definitions
+    @param l_update: mapping from each variable to their last updated location
+    @param use_table: mapping from each variable to its use locations
+    """
+    def processStore(self, target, value, reference_table, l_update, use_table):
+        keys = []
+        base = target
+        while isinstance(base, (ast.Subscript, ast.Attribute)):
+            if isinstance(base, ast.Subscript):
+                keys.append(base.slice)
+            base = base.value
+        dependency = self.processNode(ast.Tuple([value] + keys, ast.Load()), reference_table, l_update, use_table)
+        used = self.processNode(base, reference_table, l_update, use_table)
+        self.recordMutation(target, dependency, reference_table, l_update)
+        for i in dependency + used:
+            if i in use_table:
+                use_table[i].append(target.lineno)
+            else:
+                use_table[i] = [target.lineno]
+
+    """
+    Variables the value of a comprehension depends on. The variables of the
+    comprehension are local to it, only the first iterable is evaluated
+    outside of them
+
+    @param values: element expressions of the comprehension
+    @param generators: for clauses of the comprehension
+    @param reference_table: mapping from each variable to their definitions
+    @param l_update: mapping from each variable to their last updated location
+    @param use_table: mapping from each variable to its use locations
+    """
+    def processComprehension(self, values, generators, reference_table, l_update, use_table):
+        outer = self.processNode(generators[0].iter, reference_table, l_update, use_table)
+        local = set()
+        inner = []
+        for idx, generator in enumerate(generators):
+            local |= set(nd.id for nd in ast.walk(generator.target) if isinstance(nd, ast.Name))
+            if idx > 0:
+                inner += self.processNode(generator.iter, reference_table, l_update, use_table)
+            for test in generator.ifs:
+                inner += self.processNode(test, reference_table, l_update, use_table)
+        for value in values:
+            inner += self.processNode(value, reference_table, l_update, use_table)
+        return outer + [i for i in inner if i not in local]
+
+    def setScope(self, var, line):
+        if var in self.context.updateToScoop:
+            self.context.updateToScoop[var][line] = self.context.currentScope[:]
+        else:
+            self.context.updateToScoop[var] = {line: self.context.currentScope[:]}
+
+    """
+    Names read anywhere in a statement, cached since loop bodies are
+    checked against the changed variables on every pass
+    """
+    def statementReads(self, node):
+        if node not in self.context.readsCache:
+            reads = set()
+            for nd in ast.walk(node):
+                if isinstance(nd, ast.Name):
+                    reads.add(nd.id)
+            self.context.readsCache[node] = reads
+        return self.context.readsCache[node]
     
     """
     Update variable-definition mapping
@@ -107,19 +359,21 @@ class Analysis:
             else:
                 dependency_aug = dependency
             if res in reference_table:
-                reference_table[res][target.lineno] = reference_table[res][l_update[res]] + dependency_aug
+                self.setDefinition(reference_table, res, target.lineno, reference_table[res][l_update[res]] + dependency_aug)
                 l_update[res] = target.lineno
-                if res in self.updateToScoop:
-                    self.updateToScoop[res][target.lineno] = self.currentScope[:]
+                self.recordWrite(res, target.lineno)
+                if res in self.context.updateToScoop:
+                    self.context.updateToScoop[res][target.lineno] = self.context.currentScope[:]
                 else:
-                    self.updateToScoop[res]= {target.lineno: self.currentScope[:]}
+                    self.context.updateToScoop[res]= {target.lineno: self.context.currentScope[:]}
             else:
-                reference_table[res] = {target.lineno: dependency_aug}
+                self.setDefinition(reference_table, res, target.lineno, dependency_aug)
                 l_update[res] = target.lineno
-                if res in self.updateToScoop:
-                    self.updateToScoop[res][target.lineno] = self.currentScope[:]
+                self.recordWrite(res, target.lineno)
+                if res in self.context.updateToScoop:
+                    self.context.updateToScoop[res][target.lineno] = self.context.currentScope[:]
                 else:
-                    self.updateToScoop[res]= {target.lineno: self.currentScope[:]}
+                    self.context.updateToScoop[res]= {target.lineno: self.context.currentScope[:]}
 
     """
     Similar to updateReferences with added check to see if used variables contain
@@ -141,21 +395,24 @@ class Analysis:
                 use_table[i] = [target.lineno]
         for i in res:
             if i not in reference_table:
-                reference_table[i] = {target.lineno: dependency}
+                self.setDefinition(reference_table, i, target.lineno, dependency)
                 l_update[i] = target.lineno
-                if i in self.updateToScoop:
-                    self.updateToScoop[i][target.lineno] = self.currentScope[:]
+                self.recordWrite(i, target.lineno)
+                if i in self.context.updateToScoop:
+                    self.context.updateToScoop[i][target.lineno] = self.context.currentScope[:]
                 else:
-                    self.updateToScoop[i]= {target.lineno: self.currentScope[:]}
+                    self.context.updateToScoop[i]= {target.lineno: self.context.currentScope[:]}
             else:
                 if i in dependency:
-                    reference_table[i][target.lineno] = reference_table[i][l_update[i]] + dependency
+                    self.setDefinition(reference_table, i, target.lineno, reference_table[i][l_update[i]] + dependency)
                     l_update[i] = target.lineno
-                    self.updateToScoop[i][target.lineno] = self.currentScope[:]
+                    self.recordWrite(i, target.lineno)
+                    self.context.updateToScoop[i][target.lineno] = self.context.currentScope[:]
                 else:
-                    reference_table[i][target.lineno] = dependency
+                    self.setDefinition(reference_table, i, target.lineno, dependency)
                     l_update[i] = target.lineno
-                    self.updateToScoop[i][target.lineno] = self.currentScope[:]
+                    self.recordWrite(i, target.lineno)
+                    self.context.updateToScoop[i][target.lineno] = self.context.currentScope[:]
     
     """
     Process the if statement by interpreting both if and orelse
@@ -168,48 +425,69 @@ class Analysis:
     @param use_table: mapping from each variable to its use locations
     """
     def processIfStmt(self, node, reference_table, l_update, use_table):
+        self.checkBudget(reference_table)
         variables = self.processNode(node.test, reference_table, l_update, use_table)
         for i in variables:
             if i in use_table:
                 use_table[i].append(node.test.lineno)
             else:
                 use_table[i] = [node.test.lineno]
-        copy1 = copy.deepcopy(reference_table)
-        l_update_copy1 = copy.deepcopy(l_update)
-        copy2 = copy.deepcopy(reference_table)
-        l_update_copy = copy.deepcopy(l_update)
+        copy1 = self.copyTable(reference_table)
+        l_update_copy1 = dict(l_update)
+        copy2 = self.copyTable(reference_table)
+        l_update_copy = dict(l_update)
         for i in node.body:
             self.processNode(i, reference_table, l_update, use_table)
-        self.currentScope.pop(-1)
+        self.context.currentScope.pop(-1)
         addedFlag = False
         if node.orelse and not isinstance(node.orelse[0], ast.If):
-            self.currentScope.append(ast.If(node.test, node.orelse, []))
+            self.context.currentScope.append(ast.If(node.test, node.orelse, []))
             addedFlag = True
         for i in node.orelse:
             self.processNode(i, copy2, l_update_copy, use_table)
         if addedFlag:
-            self.currentScope.pop(-1)
+            self.context.currentScope.pop(-1)
         for i in reference_table:
             if i in copy2 and reference_table[i] != copy2[i]:
                 if i in self.functionTable:
                     continue
                 for j in copy2[i]:
-                    reference_table[i][j] = copy2[i][j]
-                reference_table[i][node.end_lineno+0.5] = list(set(reference_table[i][l_update[i]] + copy2[i][l_update_copy[i]]))
+                    self.setDefinition(reference_table, i, j, copy2[i][j])
+                self.setDefinition(reference_table, i, node.end_lineno+0.5, list(set(reference_table[i][l_update[i]] + copy2[i][l_update_copy[i]])))
                 l_update[i] = node.end_lineno+0.5
-                self.updateToScoop[i][node.end_lineno+0.5] = self.currentScope[:]
+                self.recordWrite(i, node.end_lineno+0.5)
+                self.context.updateToScoop[i][node.end_lineno+0.5] = self.context.currentScope[:]
             if (i not in self.functionTable) and i in l_update_copy and l_update[i] != l_update_copy[i]:
+                if node.end_lineno+0.5 not in reference_table[i]:
+                    # Branches only redefined the variable at lines already in
+                    # the table, as when a loop body is interpreted again
+                    self.setDefinition(reference_table, i, node.end_lineno+0.5, list(set(reference_table[i][l_update[i]] + copy2[i][l_update_copy[i]])))
                 l_update[i] = node.end_lineno+0.5
-                self.updateToScoop[i][node.end_lineno+0.5] = self.currentScope[:]
+                self.context.updateToScoop[i][node.end_lineno+0.5] = self.context.currentScope[:]
         
         # If there are no else case for this if statement
         # variable should be able to keep its dependencies
         # before if.
         for i in copy1:
             if not self.checkIfhasElse(node):
-                reference_table[i][l_update[i]] = list(set(reference_table[i][l_update[i]] + copy1[i][l_update_copy1[i]]))
+                merged = list(set(reference_table[i][l_update[i]] + copy1[i][l_update_copy1[i]]))
+                if len(merged) != len(set(reference_table[i][l_update[i]])):
+                    self.recordWrite(i, l_update[i])
+                self.setDefinition(reference_table, i, l_update[i], merged)
 
     
+    """
+    Copy the variable and line levels of a reference table. Dependency lists
+    are never modified in place, so they are shared with the original, and
+    constant nodes in them keep their identity across branches and loop passes
+    """
+    def copyTable(self, reference_table):
+        copy = ReferenceTable()
+        for var in reference_table:
+            copy[var] = dict(reference_table[var])
+        copy.size = reference_table.size if isinstance(reference_table, ReferenceTable) else ReferenceTable(copy).size
+        return copy
+
     """
     Process each ast node, this is the main function that processes
     each node in the AST. Its return is the list of variables that are part of the
@@ -226,12 +504,13 @@ class Analysis:
             case ast.Return(value):
                 res = self.processNode(value, reference_table, l_update, use_table)
                 # Multiple return statements in a function
-                if 'return' in reference_table:
-                    reference_table['return'][node.lineno] = res
-                    self.updateToScoop['return'][node.lineno] = self.currentScope[:]
-                else:
-                    reference_table['return'] = {node.lineno: res}
-                    self.updateToScoop['return'] = {node.lineno: self.currentScope[:]}
+                self.setDefinition(reference_table, 'return', node.lineno, res)
+                # The copy of the table an else branch is processed with does
+                # not have the returns of the if branch, their scopes are kept
+                self.context.updateToScoop.setdefault('return', {})[node.lineno] = self.context.currentScope[:]
+                # Branches returning in an if statement are merged like variables
+                l_update['return'] = node.lineno
+                self.recordWrite('return', node.lineno)
                 
                 for i in res:
                     if i in use_table:
@@ -285,12 +564,30 @@ class Analysis:
                     initial += self.processNode(i, reference_table, l_update, use_table)
                 return initial
             case ast.Call(func, args, keywords):
+                # Functions imported from modules under the source root
+                summary = self.modules.summaryFor(func) if self.modules is not None else None
+                if summary is not None:
+                    return self.processSummaryCall(node, summary, reference_table, l_update, use_table)
                 # Do only in the interactive analysis
                 if (self.processCallees):
                     match func:
                         # User defined function
                         
                         case ast.Name(id, _):
+                            if id in self.context.callStack:
+                                # Recursive call, the returned value of the function
+                                # is not known yet and may depend on every argument
+                                initial = []
+                                for i in args:
+                                    initial += self.processNode(i, reference_table, l_update, use_table)
+
+                                for i in initial:
+                                    if i in use_table:
+                                        use_table[i].append(node.lineno)
+                                    else:
+                                        use_table[i] = [node.lineno]
+
+                                return initial
                             if id in self.functionTable:
                                 returnVars = []
                                 arg_list = []
@@ -306,12 +603,10 @@ class Analysis:
                                         else:
                                             use_table[i] = [node.lineno]
                                 
+                                self.checkBudget(reference_table)
                                 res = self.processFunction(self.functionTable[id], arg_list)
                                 # Add function name as dependence
-                                if id in reference_table:
-                                    reference_table[id][node.lineno] = res[0]
-                                else:
-                                    reference_table[id] = {node.lineno: res[0]}
+                                self.setDefinition(reference_table, id, node.lineno, res[0])
                                 
                                 return [id] + returnVars
                     # Other functions, assume every function input is affecting
@@ -320,6 +615,7 @@ class Analysis:
                             initial = []
                             for i in args:
                                 initial += self.processNode(i, reference_table, l_update, use_table)
+                            self.recordMutation(func, initial, reference_table, l_update)
                             
                             for i in initial:
                                 if i in use_table:
@@ -343,6 +639,29 @@ class Analysis:
                                     use_table[i] = [node.lineno]
                     
                             return initial
+                        case _:
+                            # Methods such as append, the object they are called
+                            # on is used and may keep the arguments
+                            initial = self.processNode(func, reference_table, l_update, use_table)
+                            arguments = []
+                            for i in args:
+                                arguments += self.processNode(i, reference_table, l_update, use_table)
+                            for i in keywords:
+                                arguments += self.processNode(i.value, reference_table, l_update, use_table)
+                            self.recordMutation(func, arguments, reference_table, l_update)
+                            initial += arguments
+
+                            for i in initial:
+                                if i in use_table:
+                                    use_table[i].append(node.lineno)
+                                else:
+                                    use_table[i] = [node.lineno]
+
+                            return initial
+            case ast.ListComp(elt, generators) | ast.SetComp(elt, generators) | ast.GeneratorExp(elt, generators):
+                return self.processComprehension([elt], generators, reference_table, l_update, use_table)
+            case ast.DictComp(key, value, generators):
+                return self.processComprehension([key, value], generators, reference_table, l_update, use_table)
             case ast.IfExp(test, body, orelse):
                 return (self.processNode(test, reference_table, l_update, use_table) + 
                         self.processNode(body, reference_table, l_update, use_table) + 
@@ -362,9 +681,10 @@ class Analysis:
                         case ast.Tuple(elts1, ctx):
                             match value:
                                 # Special case where multiple variables are assigned to multiple
-                                # values
-                                case ast.Tuple(elts2, ctx):
-                                    assert len(elts1) == len(elts2)
+                                # values. Unpacking that fails or uses a starred target is
+                                # handled like any other value
+                                case ast.Tuple(elts2, ctx) if len(elts1) == len(elts2) and \
+                                        not any(isinstance(elt, ast.Starred) for elt in elts1 + elts2):
                                     for i in range(len(elts1)):
                                         new_node = ast.Assign([elts1[i]], elts2[i], type_comment)
                                         new_node.lineno = node.lineno
@@ -372,31 +692,26 @@ class Analysis:
                                 case _:
                                     self.updateReferencesCheckAugmentation(target, value, reference_table, l_update, use_table)
                         # If there is a expression with subscript, e.g a[b],
-                        # only update a
-                        case ast.Subscript(value1, slice, ctx):
-                            while isinstance(target, ast.Subscript):
-                                target = target.value
-                            self.updateReferences(target, value, reference_table, l_update, use_table, False)
+                        # only update a, the indexes decide where the value is kept
+                        case ast.Subscript() | ast.Attribute():
+                            self.processStore(target, value, reference_table, l_update, use_table)
                         case _:
                             self.updateReferencesCheckAugmentation(target, value, reference_table, l_update, use_table)
                 return []
             case ast.AugAssign(target, op, value):
                 match target:
-                    # In subscript, indexes do not change
-                    case ast.Subscript(value1, slice, ctx):
-                        while isinstance(target, ast.Subscript):
-                            target = target.value
-                        self.updateReferences(target, value, reference_table, l_update, use_table)
+                    case ast.Subscript() | ast.Attribute():
+                        self.processStore(target, value, reference_table, l_update, use_table)
                     case _:
                         self.updateReferences(target, value, reference_table, l_update, use_table)
                 
                 return []
             case ast.If(test, body, orelse):
-                self.currentScope.append(node)
+                self.context.currentScope.append(node)
                 self.processIfStmt(node, reference_table, l_update, use_table)
                 return []
             case ast.For(target, iter, body, orelse, type_comment):
-                self.currentScope.append(node)
+                self.context.currentScope.append(node)
                 targets = self.processNode(target, reference_table, l_update, use_table)
                 dependency = self.processNode(iter, reference_table, l_update, use_table)
                 for i in dependency:
@@ -405,13 +720,21 @@ class Analysis:
                     else:
                         use_table[i] = [node.lineno]
                 for elem in targets:
-                    reference_table[elem] = {node.lineno: dependency}
+                    self.dropDefinitions(reference_table, elem)
+                    self.setDefinition(reference_table, elem, node.lineno, dependency)
                     l_update[elem] = node.lineno
-                    self.updateToScoop[elem] = {node.lineno: self.currentScope[:]}
+                    self.context.updateToScoop[elem] = {node.lineno: self.context.currentScope[:]}
+                    self.recordWrite(elem, node.lineno)
                 self.loopFixpoint(node, body, reference_table, l_update, use_table)
                 return []
             case ast.While(test, body, orelse):
-                self.currentScope.append(node)
+                self.context.currentScope.append(node)
+                dependency = self.processNode(test, reference_table, l_update, use_table)
+                for i in dependency:
+                    if i in use_table:
+                        use_table[i].append(node.lineno)
+                    else:
+                        use_table[i] = [node.lineno]
                 self.loopFixpoint(node, body, reference_table, l_update, use_table)
                 return []
             case ast.Break:
@@ -420,6 +743,51 @@ class Analysis:
                 pass
         return []
 
+    """
+    Process a call to an imported function using the summary of the
+    function. Every argument is used at the call, only the arguments the
+    summary lets flow to the returned value are returned as dependencies
+
+    @param node: AST node of the call
+    @param summary: FunctionSummary of the called function
+    @param reference_table: mapping from each variable to their definitions
+    @param l_update: mapping from each variable to their last updated location
+    @param use_table: mapping from each variable to its use locations
+    """
+    def processSummaryCall(self, node, summary, reference_table, l_update, use_table):
+        initial = []
+        returnVars = []
+        for idx, arg in enumerate(node.args):
+            if isinstance(arg, ast.Starred):
+                # Positions of the unpacked values are unknown
+                cur = self.processNode(arg.value, reference_table, l_update, use_table)
+                flows = True
+            else:
+                cur = self.processNode(arg, reference_table, l_update, use_table)
+                flows = summary.positionalFlows(idx)
+            initial += cur
+            if flows:
+                returnVars += cur
+        for keyword in node.keywords:
+            cur = self.processNode(keyword.value, reference_table, l_update, use_table)
+            initial += cur
+            if summary.keywordFlows(keyword.arg):
+                returnVars += cur
+
+        if not self.processCallees:
+            # Same as other calls in code transformation, the called name or
+            # the names of an attribute such as module.function are always
+            # dependencies, so the call is never taken for a constant argument
+            callee = self.processNode(node.func, reference_table, l_update, use_table)
+            initial = callee + initial
+            returnVars = callee + returnVars
+        for i in initial:
+            if i in use_table:
+                use_table[i].append(node.lineno)
+            else:
+                use_table[i] = [node.lineno]
+        return returnVars
+
     """
     Process the given function with the given parameters
     and unify the states from each return statement at special location, line number 0
@@ -428,6 +796,42 @@ class Analysis:
     @param arg_list: List of arguments passed into the function
     """
     def processFunction(self, function, arg_list):
+        if getattr(self.local, "context", None) is not None:
+            # A callee, analyzed in the context and budget of its caller
+            return self.interpretFunction(function, arg_list)
+        self.local.context = AnalysisContext(self.budget)
+        try:
+            return self.interpretFunction(function, arg_list)
+        finally:
+            self.local.context = None
+
+    """
+    Raise BudgetExceeded when the function being analyzed went over the budget
+
+    @param reference_table: reference table of the function being interpreted
+    @param iterations: number of loop passes to count
+    """
+    def checkBudget(self, reference_table, iterations=0):
+        if self.budget is None:
+            return
+        context = self.context
+        context.iterations += iterations
+        if self.budget.iterations is not None and context.iterations > self.budget.iterations:
+            raise BudgetExceeded(f"more than {self.budget.iterations} loop iterations")
+        if context.deadline is not None and time.monotonic() > context.deadline:
+            raise BudgetExceeded(f"more than {self.budget.seconds:g} seconds")
+        if self.budget.tableSize is not None:
+            if isinstance(reference_table, ReferenceTable):
+                size = reference_table.size
+            else:
+                size = ReferenceTable(reference_table).size
+            if size > self.budget.tableSize:
+                raise BudgetExceeded(f"reference table larger than {self.budget.tableSize}")
+
+    """
+    Interpret the function for processFunction, the budget is handled by the caller
+    """
+    def interpretFunction(self, function, arg_list):
         nodes = []
         fArgs = []
         # Collect arguments
@@ -443,22 +847,28 @@ class Analysis:
                             match i:
                                 case ast.arg(name, _):
                                     fArgs.append(name)
-        referenceTable = {}
+        referenceTable = ReferenceTable()
         lastUpdated = {}
         use_table = {}
         # Create mapping from arguments to parameters
         for i in range(len(arg_list)):
-            referenceTable[fArgs[i]] = {function.lineno: arg_list[i]}
+            self.setDefinition(referenceTable, fArgs[i], function.lineno, arg_list[i])
             lastUpdated[fArgs[i]] = function.lineno
 
         if len(arg_list) == 0:
             for i in range(len(fArgs)):
-                referenceTable[fArgs[i]] = {function.lineno: []}
+                self.setDefinition(referenceTable, fArgs[i], function.lineno, [])
                 lastUpdated[fArgs[i]] = function.lineno
-                self.updateToScoop[fArgs[i]] = {function.lineno: []}
+                self.context.updateToScoop[fArgs[i]] = {function.lineno: []}
 
+        # Loops of the caller do not see definitions made in the callee
+        callerLoops = self.context.loopWrites
+        self.context.loopWrites = []
+        self.context.callStack.append(function.name)
         for node in nodes:
             self.processNode(node, referenceTable, lastUpdated, use_table)
+        self.context.callStack.pop(-1)
+        self.context.loopWrites = callerLoops
         
         collection = []
         
@@ -466,9 +876,10 @@ class Analysis:
         if 'return' in referenceTable:
             for i in referenceTable['return']:
                 collection += referenceTable['return'][i]
-        referenceTable['return'][0] = collection
+            self.setDefinition(referenceTable, 'return', 0, collection)
 
-        return (referenceTable, use_table, copy.deepcopy(self.updateToScoop))
+        # Scopes of this analysis only, the context is dropped afterwards
+        return (referenceTable, use_table, self.context.updateToScoop)
     
     """
     Process the analysis results and print out the dependencies. It starts from
@@ -532,27 +943,37 @@ class Analysis:
         return outside_variables
     
     def runInteractiveAnalysis(self):
+        functionName = self.pickFunction()
+        function = self.functionTable[functionName]
+        referenceTable = self.processFunction(function, [])
+        variableName = self.pickVariable(referenceTable[0])
+        line = self.pickLine(functionName)
+        self.getResults(referenceTable[0], variableName, line)
+
+    def pickFunction(self):
         functionName = ""
         functionName = input("Pick function to analyze: ")
         if functionName not in self.functionTable:
             while functionName not in self.functionTable:
                 print("Function does not exist")
                 functionName = input("Pick function to analyze: ")
-            
-        function = self.functionTable[functionName]
-        referenceTable = self.processFunction(function, [])
+        return functionName
+
+    def pickVariable(self, variables):
         variableName = input("Pick variable name to analyze: ")
-        if variableName not in referenceTable[0]:
-            while variableName not in referenceTable[0]:
+        if variableName not in variables:
+            while variableName not in variables:
                 print("Variable does not exist")
                 variableName = input("Pick variable name to analyze: ")
-        
+        return variableName
+
+    def pickLine(self, functionName):
         line = int(input("Pick line number to analyze: "))
         if line > self.functionTable[functionName].end_lineno:
             while line > self.functionTable[functionName].end_lineno:
                 print("Line is out of the function scope")
                 line = int(input("Pick line number to analyze: "))
-        self.getResults(referenceTable[0], variableName, line)
+        return line
     
     """
     Function for printing out everything
@@ -576,7 +997,7 @@ class Analysis:
                     self.printReferenceTable(refTable[i][j], n_indent)
             else:
                 print(indent + i, refTable[i])
-                # print(self.updateToScoop[i])
+                # print(self.context.updateToScoop[i])
 
 """
 Function for collection all function definitions in
@@ -585,27 +1006,49 @@ the target file
 @param root: root of the AST of the parsed program
 """
 def collectFunctions(root):
-    functionTable = {}
-
-    for node in ast.walk(root):
-        match node:
-            case ast.FunctionDef(name, args, body, decorator_list, returns, type_comment, type_params):
-                functionTable[name] = node
-
-    return functionTable
+    return ModuleIndex(root).functionTable
 
 """
 Run the interactive analysis
 
 @param filePath: file path to the tested program
+@param demand: analyze only the statements the queried variable depends on
+@param lazy: parse functions only when the analysis needs them
+@param sourceRoot: directory imports are resolved against, calls to
+                   imported functions use summaries of the functions
 """
-def runInteractive(filePath):
-    file = open(filePath, "r")
+def runInteractive(filePath, demand=False, lazy=False, sourceRoot=None):
+    loader = None
+    if sourceRoot is not None:
+        from modules import ModuleLoader
+        loader = ModuleLoader(sourceRoot)
+
+    if lazy:
+        from lazy import LazySource, LazyFunctionTable
+        source = LazySource(filePath)
+        table = LazyFunctionTable(source)
+        imports = []
+        if loader is not None:
+            for span in source.spans:
+                if span.kind == "import":
+                    imports += source.parseStatements(span)
+    else:
+        file = open(filePath, "r")
+
+        tree = ast.parse(file.read())
 
-    tree = ast.parse(file.read())
+        table = collectFunctions(tree)
+        imports = tree.body
 
-    table = collectFunctions(tree)
+    modules = None
+    if loader is not None:
+        from modules import moduleScopeFor
+        modules = moduleScopeFor(loader, filePath, imports)
 
-    analysis = Analysis(table)
+    if demand:
+        from demand import DemandAnalysis
+        analysis = DemandAnalysis(table, modules)
+    else:
+        analysis = Analysis(table, modules)
 
-    analysis.runInteractiveAnalysis()
\ No newline at end of file
+    analysis.runInteractiveAnalysis()
@@ -0,0 +1,147 @@
+import ast
+import operator
+from licm import storeCounts, readCounts
+from passes import RewriteRule
+
+
+# Operators evaluated on constants, only for numbers, strings, booleans and None
+UNARY_OPERATORS = {ast.Not: operator.not_, ast.USub: operator.neg, ast.UAdd: operator.pos}
+BINARY_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Mod: operator.mod,
+                    ast.FloorDiv: operator.floordiv, ast.Div: operator.truediv}
+COMPARE_OPERATORS = {ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+                     ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Is: operator.is_, ast.IsNot: operator.is_not}
+CONSTANT_TYPES = (int, float, str, bool, type(None))
+
+# Returned by constantValue for expressions whose value is not known
+UNKNOWN = object()
+
+
+"""
+Value of an expression built from constants, UNKNOWN when it is not
+built only from constants or evaluating it raises an error. Arithmetic is
+only evaluated on numbers, so no long string is built
+"""
+def constantValue(node):
+    match node:
+        case ast.Constant(value) if isinstance(value, CONSTANT_TYPES):
+            return value
+        case ast.UnaryOp(op, operand) if type(op) in UNARY_OPERATORS:
+            value = constantValue(operand)
+            if value is UNKNOWN or (not isinstance(op, ast.Not) and not isinstance(value, (int, float))):
+                return UNKNOWN
+            return UNARY_OPERATORS[type(op)](value)
+        case ast.BinOp(left, op, right) if type(op) in BINARY_OPERATORS:
+            values = (constantValue(left), constantValue(right))
+            if not all(isinstance(value, (int, float)) for value in values):
+                return UNKNOWN
+            try:
+                return BINARY_OPERATORS[type(op)](*values)
+            except ArithmeticError:
+                return UNKNOWN
+        case ast.BoolOp(op, values):
+            # Operands after the one deciding the result are not evaluated
+            for nd in values:
+                value = constantValue(nd)
+                if value is UNKNOWN:
+                    return UNKNOWN
+                if bool(value) == isinstance(op, ast.Or):
+                    return value
+            return value
+        case ast.Compare(left, ops, comparators):
+            value = constantValue(left)
+            result = True
+            for op, nd in zip(ops, comparators):
+                other = constantValue(nd)
+                if value is UNKNOWN or other is UNKNOWN or type(op) not in COMPARE_OPERATORS:
+                    return UNKNOWN
+                try:
+                    result = COMPARE_OPERATORS[type(op)](value, other)
+                except TypeError:
+                    return UNKNOWN
+                if not result:
+                    return False
+                value = other
+            return result
+    return UNKNOWN
+
+
+"""
+Rule removing the branches constant tests never take. An if statement
+with a constant test is replaced by the branch it takes, a while loop
+with a false test by its else block, and a conditional expression with a
+constant test by the value it takes. Tests become constant when the
+ConstantValuePropagation rule substitutes constants for variables, so
+this rule belongs to the same pass, after it.
+
+A branch is kept when removing it would change the scope of a name: it
+declares names global or nonlocal, yields or awaits, or binds a
+variable that is read in the function and bound nowhere else in it
+"""
+class DeadBranchElimination(RewriteRule):
+    def __init__(self, functionTable, edits=None) -> None:
+        super().__init__(functionTable, edits)
+        self.function = None
+
+    def startFunction(self, node):
+        self.function = node
+
+    def finishStatement(self, node):
+        self.rewriteExpressions(node)
+        match node:
+            case ast.If(test, body, orelse):
+                value = constantValue(test)
+                if value is UNKNOWN or not self.canRemove(orelse if value else body):
+                    return node
+                replacement = body if value else orelse
+            case ast.While(test, body, orelse):
+                value = constantValue(test)
+                if value is UNKNOWN or value or not self.canRemove(body):
+                    return node
+                replacement = orelse
+            case _:
+                return node
+        self.record(node, ast.Module(replacement, []) if replacement else None)
+        return replacement if replacement else None
+
+    """
+    Check whether statements that never run can be removed
+    """
+    def canRemove(self, body):
+        removed = ast.Module(body, [])
+        for nd in ast.walk(removed):
+            if isinstance(nd, (ast.Global, ast.Nonlocal, ast.Yield, ast.YieldFrom, ast.Await)):
+                return False
+        stores = storeCounts(removed)
+        allStores = storeCounts(ast.Module(self.function.body, []))
+        reads = readCounts(self.function.body)
+        for name in stores:
+            if stores[name] == allStores[name] and reads[name] > readCounts(body)[name]:
+                return False
+        return True
+
+    """
+    Replace conditional expressions with constant tests in the expressions
+    of a statement, statements in it were handled before
+    """
+    def rewriteExpressions(self, node):
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                for idx, item in enumerate(value):
+                    if isinstance(item, ast.expr):
+                        value[idx] = self.rewriteExpression(item)
+                    elif isinstance(item, (ast.keyword, ast.comprehension, ast.arguments, ast.withitem, ast.match_case)):
+                        self.rewriteExpressions(item)
+            elif isinstance(value, ast.expr):
+                setattr(node, field, self.rewriteExpression(value))
+
+    def rewriteExpression(self, node):
+        chosen = node
+        while isinstance(chosen, ast.IfExp):
+            value = constantValue(chosen.test)
+            if value is UNKNOWN:
+                break
+            chosen = chosen.body if value else chosen.orelse
+        self.rewriteExpressions(chosen)
+        if chosen is not node:
+            self.record(node, chosen)
+        return chosen
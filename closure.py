@@ -0,0 +1,240 @@
+import ast
+from analysis import Analysis, collectFunctions
+
+
+"""
+Directed graph whose transitive closure is kept as bit-packed rows, bit j
+of the row of node i is set when j can be reached from i. The closure is
+computed over the strongly connected components of the graph in reverse
+topological order, so every node and edge is handled once and merging the
+reachable sets of two nodes is a single integer or
+"""
+class BitClosure:
+    def __init__(self):
+        self.keys = []
+        self.index = {}
+        self.edges = []
+        self.rows = None
+
+    def node(self, key):
+        if key not in self.index:
+            self.index[key] = len(self.keys)
+            self.keys.append(key)
+            self.edges.append([])
+            self.rows = None
+        return self.index[key]
+
+    def addEdge(self, source, target):
+        self.edges[self.node(source)].append(self.node(target))
+        self.rows = None
+
+    """
+    Compute the reachable set of every node, nodes reach themselves
+    """
+    def close(self):
+        count = len(self.keys)
+        order = [0] * count
+        low = [0] * count
+        onStack = [False] * count
+        visited = [False] * count
+        rows = [0] * count
+        stack = []
+        counter = 1
+        for root in range(count):
+            if visited[root]:
+                continue
+            # Iterative Tarjan, work items are (node, next edge to follow)
+            work = [(root, 0)]
+            while work:
+                v, edge = work.pop(-1)
+                if edge == 0:
+                    visited[v] = True
+                    order[v] = low[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    onStack[v] = True
+                if edge < len(self.edges[v]):
+                    work.append((v, edge + 1))
+                    w = self.edges[v][edge]
+                    if not visited[w]:
+                        work.append((w, 0))
+                    elif onStack[w]:
+                        low[v] = min(low[v], order[w])
+                    continue
+                # Every edge of v is done, components reachable from v are closed
+                reach = 0
+                for w in self.edges[v]:
+                    if not onStack[w]:
+                        reach |= rows[w]
+                    else:
+                        low[v] = min(low[v], low[w])
+                rows[v] = reach
+                if low[v] == order[v]:
+                    members = []
+                    while True:
+                        w = stack.pop(-1)
+                        onStack[w] = False
+                        members.append(w)
+                        if w == v:
+                            break
+                    component = 0
+                    for w in members:
+                        component |= rows[w] | (1 << w)
+                    for w in members:
+                        rows[w] = component
+        self.rows = rows
+
+    """
+    Bit mask of the nodes reachable from any of the given keys
+    """
+    def reach(self, keys):
+        if self.rows is None:
+            self.close()
+        mask = 0
+        for key in keys:
+            if key in self.index:
+                mask |= self.rows[self.index[key]]
+        return mask
+
+    def keysOf(self, mask):
+        keys = []
+        while mask:
+            low = mask & -mask
+            keys.append(self.keys[low.bit_length() - 1])
+            mask ^= low
+        return keys
+
+
+"""
+Line of the definition of a variable that the dependency walk of
+findUnimportantVariables continues from, when the variable is reached
+from the given line
+"""
+def nextDefinitionLine(lines, line):
+    if len(lines) > 1 and lines[-1] > line:
+        return lines[-2]
+    return lines[-1]
+
+
+"""
+Batch dependency queries over the reference table of one function
+
+@param referenceTable: reference table of the function, see Analysis.processFunction
+@param functionTable: mapping from function names to definitions
+"""
+class DependencyMatrix:
+    def __init__(self, referenceTable, functionTable):
+        self.referenceTable = referenceTable
+        self.functionTable = functionTable
+        self.graph = None
+        self.returnGraph = None
+        self.lines = {}
+        for var in referenceTable:
+            if var not in functionTable:
+                self.lines[var] = sorted(referenceTable[var])
+
+    """
+    Graph with an edge from each variable to every name one of its
+    definitions reads, regardless of the line of the definition
+    """
+    def variableGraph(self):
+        if self.graph is None:
+            self.graph = BitClosure()
+            for var in self.lines:
+                self.graph.node(var)
+                for line in self.lines[var]:
+                    for dep in self.referenceTable[var][line]:
+                        if isinstance(dep, str):
+                            self.graph.addEdge(var, dep)
+        return self.graph
+
+    """
+    Mapping from every variable to all names it transitively depends on
+    """
+    def allDependencies(self):
+        graph = self.variableGraph()
+        matrix = {}
+        for var in self.lines:
+            if var == 'return':
+                continue
+            matrix[var] = [key for key in graph.keysOf(graph.reach([var])) if key != var]
+        return matrix
+
+    def dependencies(self, variableName):
+        graph = self.variableGraph()
+        return [key for key in graph.keysOf(graph.reach([variableName])) if key != variableName]
+
+    """
+    Graph over (variable, line) pairs following the same definitions as
+    the walk of findUnimportantVariables: from a use at some line, a
+    variable continues at the definition chosen by nextDefinitionLine
+    """
+    def definitionGraph(self):
+        if self.returnGraph is None:
+            self.returnGraph = BitClosure()
+            for var in self.lines:
+                if var == 'return':
+                    continue
+                lines = self.lines[var]
+                for line in set(lines[-2:]):
+                    self.returnGraph.node((var, line))
+                    for dep in self.referenceTable[var][line]:
+                        self.returnGraph.addEdge((var, line), self.defNode(dep, line))
+        return self.returnGraph
+
+    """
+    Node a name read at the given line continues from, names without
+    definitions in the function end the walk
+    """
+    def defNode(self, name, line):
+        if isinstance(name, str) and name in self.lines and name != 'return':
+            return (name, nextDefinitionLine(self.lines[name], line))
+        return (name, None)
+
+    """
+    Names the returned values of the function transitively depend on
+    """
+    def reachesReturn(self):
+        if 'return' not in self.referenceTable:
+            return set()
+        graph = self.definitionGraph()
+        starts = []
+        returns = self.referenceTable['return']
+        for line in returns:
+            if line == 0:
+                continue
+            for dep in returns[line]:
+                starts.append(self.defNode(dep, line))
+                graph.node(starts[-1])
+        return set(name for name, line in graph.keysOf(graph.reach(starts)))
+
+
+"""
+Print the full dependency matrix of every function and the variables
+that do not affect its return
+
+@param filePath: file path to the tested program
+@param sourceRoot: directory imports are resolved against, None to not resolve imports
+"""
+def printDependencyMatrix(filePath, sourceRoot=None):
+    file = open(filePath, "r")
+    tree = ast.parse(file.read())
+    file.close()
+
+    functionTable = collectFunctions(tree)
+    modules = None
+    if sourceRoot is not None:
+        from modules import ModuleLoader, moduleScopeFor
+        modules = moduleScopeFor(ModuleLoader(sourceRoot), filePath, tree.body)
+    analysis = Analysis(functionTable, modules)
+    analysis.processCallees = False
+    for func in functionTable:
+        referenceTable = analysis.processFunction(functionTable[func], [])[0]
+        matrix = DependencyMatrix(referenceTable, functionTable)
+        print("Function:", func)
+        for var, deps in matrix.allDependencies().items():
+            print("Variable", var, "depends on:", deps)
+        used = matrix.reachesReturn()
+        print("Variables that do not affect return:",
+              [var for var in referenceTable if var not in used and var != 'return' and var not in functionTable])
+        print()
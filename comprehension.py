@@ -0,0 +1,169 @@
+import ast
+from licm import storeCounts, readCounts
+from liveness import pinnedNames
+from passes import RewriteRule, hasSideEffects
+
+
+# Comprehensions built by the rule for each kind of accumulator
+COMPREHENSIONS = {"list": ast.ListComp, "set": ast.SetComp, "dict": ast.DictComp}
+
+
+"""
+Kind of container an assigned value creates empty, None for other values
+
+@param bound: names bound in the function, set() is not the builtin when set is one of them
+"""
+def emptyContainer(node, bound):
+    match node:
+        case ast.List([]):
+            return "list"
+        case ast.Dict([], []):
+            return "dict"
+        case ast.Call(ast.Name("set"), [], []) if "set" not in bound:
+            return "set"
+    return None
+
+
+"""
+Check whether a loop target only binds names
+"""
+def plainTarget(node):
+    return all(isinstance(nd, (ast.Name, ast.Tuple, ast.List, ast.Starred, ast.Store)) for nd in ast.walk(node))
+
+
+"""
+Rule rewriting loops that only fill an empty container into
+comprehensions. A variable assigned an empty list, set or dict that is
+followed by a for loop whose body only appends to it, adds to it or sets
+one of its keys, possibly under if statements without else and in nested
+for loops, is assigned the comprehension building the same container:
+
+    res = []
+    for x in xs:
+        if x:
+            res.append(f(x))
+
+becomes res = [f(x) for x in xs if x]. The container must not be read or
+assigned anywhere else in the loops, and the loop variables must not be
+read outside of them, since a comprehension does not leave them bound.
+Loops in try and with blocks are kept, an exception raised in a loop
+would leave the variable unbound instead of partly filled. Like
+TailCallElimination, the rule changes the whole function before its
+statements are visited and belongs to a pass after the analysis-based
+ones
+"""
+class AccumulationToComprehension(RewriteRule):
+    def __init__(self, functionTable, edits=None) -> None:
+        super().__init__(functionTable, edits)
+        self.function = None
+        self.bound = set()
+        self.pinned = set()
+
+    def startFunction(self, node):
+        self.function = node
+        args = node.args
+        self.bound = set(storeCounts(ast.Module(node.body, [])))
+        self.bound |= set(arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs)
+        self.bound |= set(arg.arg for arg in (args.vararg, args.kwarg) if arg is not None)
+        self.bound |= set(self.functionTable)
+        self.pinned = pinnedNames(node)
+        self.rewriteBody(node.body)
+
+    """
+    Rewrite the accumulating loops of a statement list and of the blocks
+    in it, nested functions are handled on their own
+    """
+    def rewriteBody(self, body, guarded=False):
+        idx = 0
+        while idx < len(body):
+            node = body[idx]
+            if idx + 1 < len(body) and not guarded:
+                replacement = self.comprehensionFor(node, body[idx + 1])
+                if replacement is not None:
+                    self.record(node, replacement)
+                    self.record(body[idx + 1], None)
+                    body[idx:idx + 2] = [replacement]
+                    idx += 1
+                    continue
+            match node:
+                case ast.FunctionDef() | ast.AsyncFunctionDef() | ast.ClassDef():
+                    pass
+                case ast.Try() | ast.TryStar() | ast.With() | ast.AsyncWith():
+                    for field in ("body", "orelse", "finalbody"):
+                        self.rewriteBody(getattr(node, field, []), True)
+                    for handler in getattr(node, "handlers", []):
+                        self.rewriteBody(handler.body, True)
+                case _:
+                    for field in ("body", "orelse"):
+                        if isinstance(getattr(node, field, None), list):
+                            self.rewriteBody(getattr(node, field), guarded)
+                    for matchCase in getattr(node, "cases", []):
+                        self.rewriteBody(matchCase.body, guarded)
+            idx += 1
+
+    """
+    Assignment of a comprehension replacing an assignment of an empty
+    container and the loop after it, None when they do not match
+    """
+    def comprehensionFor(self, assign, loop):
+        match assign:
+            case ast.Assign([ast.Name(name)], value):
+                kind = emptyContainer(value, self.bound)
+            case _:
+                return None
+        if kind is None or not isinstance(loop, ast.For) or name in self.pinned:
+            return None
+        generators = []
+        added = self.accumulated(loop, name, generators)
+        if added is None or added[0] != kind:
+            return None
+
+        values = list(added[1:])
+        if kind == "dict" and hasSideEffects(values[0]) and hasSideEffects(values[1]):
+            # The value of an assignment is evaluated before the key, the key
+            # of a dict comprehension first
+            return None
+        if readCounts([loop])[name] != 1 or storeCounts(loop)[name]:
+            return None
+        targets = set()
+        for generator in generators:
+            targets |= set(storeCounts(generator.target))
+        reads = readCounts(self.function.body)
+        loopReads = readCounts([loop])
+        if any(reads[target] != loopReads[target] or target in self.pinned for target in targets):
+            return None
+        for part in values + [nd for generator in generators for nd in [generator.iter] + generator.ifs]:
+            for nd in ast.walk(part):
+                if isinstance(nd, (ast.Yield, ast.YieldFrom, ast.Await, ast.NamedExpr, ast.Lambda)):
+                    return None
+
+        comprehension = COMPREHENSIONS[kind](*values, generators)
+        replacement = ast.Assign([ast.Name(name, ast.Store())], comprehension)
+        for nd in (replacement, replacement.targets[0], comprehension):
+            ast.copy_location(nd, assign)
+            nd.end_lineno = loop.end_lineno
+            nd.end_col_offset = loop.end_col_offset
+        replacement.targets[0].end_lineno = assign.targets[0].end_lineno
+        replacement.targets[0].end_col_offset = assign.targets[0].end_col_offset
+        return replacement
+
+    """
+    Kind of container a loop body fills and the expressions it adds, the
+    for clauses of the loops and their if statements are appended to
+    generators. None when the body does anything else
+    """
+    def accumulated(self, node, name, generators):
+        match node:
+            case ast.For(target, iter, body, []) if plainTarget(target) and len(body) == 1:
+                generators.append(ast.comprehension(target, iter, [], 0))
+                return self.accumulated(body[0], name, generators)
+            case ast.If(test, [body], []) if generators:
+                generators[-1].ifs.append(test)
+                return self.accumulated(body, name, generators)
+            case ast.Expr(ast.Call(ast.Attribute(ast.Name(id), "append"), [value], [])) if id == name and not isinstance(value, ast.Starred):
+                return ("list", value)
+            case ast.Expr(ast.Call(ast.Attribute(ast.Name(id), "add"), [value], [])) if id == name and not isinstance(value, ast.Starred):
+                return ("set", value)
+            case ast.Assign([ast.Subscript(ast.Name(id), key)], value) if id == name and not isinstance(key, ast.Slice):
+                return ("dict", key, value)
+        return None
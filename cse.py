@@ -0,0 +1,370 @@
+import ast
+import copy
+from analysis import Analysis
+from licm import storeCounts
+from liveness import namesRead, pinnedNames
+from passes import RewriteRule
+
+
+# Expressions worth computing once, when they repeat
+REUSABLE = (ast.BinOp, ast.UnaryOp, ast.Compare, ast.Subscript, ast.Attribute)
+
+
+"""
+Check whether an expression is built only from names, constants,
+operators, subscripts and attribute loads. Like the rest of the optimizer,
+operators are assumed to have no side effects
+"""
+def isReusable(node):
+    match node:
+        case ast.Constant() | ast.Name(_, ast.Load()):
+            return True
+        case ast.BinOp(left, _, right):
+            return isReusable(left) and isReusable(right)
+        case ast.UnaryOp(_, operand):
+            return isReusable(operand)
+        case ast.Compare(left, _, comparators):
+            return isReusable(left) and all(isReusable(nd) for nd in comparators)
+        case ast.Subscript(value, slice, ast.Load()):
+            return isReusable(value) and isReusable(slice)
+        case ast.Attribute(value, _, ast.Load()):
+            return isReusable(value)
+        case ast.Slice(lower, upper, step):
+            return all(nd is None or isReusable(nd) for nd in (lower, upper, step))
+        case ast.Tuple(elts, ast.Load()):
+            return all(isReusable(nd) for nd in elts)
+    return False
+
+
+"""
+Check whether a node can change objects. Calls, await and yield run other
+code, and stores through attributes and subscripts change the object
+they go through
+"""
+def hasMemoryEffects(node):
+    for nd in ast.walk(node):
+        match nd:
+            case ast.Call() | ast.Await() | ast.Yield() | ast.YieldFrom():
+                return True
+            case ast.Attribute(_, _, ast.Store() | ast.Del()) | ast.Subscript(_, _, ast.Store() | ast.Del()):
+                return True
+            case ast.With() | ast.AsyncWith() | ast.AsyncFor() | ast.Import() | ast.ImportFrom():
+                return True
+    return False
+
+
+"""
+Expression evaluated by an earlier statement
+
+@param node: first occurrence of the expression
+@param statement: statement evaluating the first occurrence
+@param names: variables whose stores make the value stale
+@param readsMemory: whether the expression reads subscripts or attributes
+@param holder: variable the statement assigned the value to, None if it has none
+"""
+class AvailableExpression:
+    def __init__(self, node, statement, names, readsMemory, holder=None):
+        self.node = node
+        self.statement = statement
+        self.names = names
+        self.readsMemory = readsMemory
+        self.holder = holder
+
+
+"""
+Rule computing repeated expressions once. Expressions are hash-consed by
+their dump while the statements of a function are walked in order, an
+expression evaluated by a statement stays available in the statements it
+dominates until one of its variables is stored to. Blocks under an if
+statement or a loop start with the expressions available before it minus
+the ones the whole statement kills, and the ones available after it are
+only those available before it that it does not kill. Statements that can
+change objects, such as calls, also kill the expressions reading
+subscripts or attributes.
+
+When an expression is found again, it reads the variable the first
+occurrence was assigned to, or a new variable assigned the expression in
+front of the statement that first evaluated it. Expressions only
+evaluated under a condition, for example on the right of an and, can
+reuse a variable but do not get one, and new variables are only assigned
+in front of statements without calls, so no call is skipped when the
+expression raises an error. Like the rest of the analysis, values are
+treated as scalars, two variables sharing a value are not an issue.
+
+The stores of the statements decide what is killed, since the
+definitions of the analysis are keyed by line and cannot tell apart two
+statements on one line. An expression is also only reused when the
+analysis has no definition of its variables between the line of the
+first occurrence and the line of the reuse, which covers the changes
+the analysis records for method calls such as append
+"""
+class CommonSubexpressionElimination(RewriteRule):
+    def __init__(self, functionTable, edits=None, modules=None, budget=None) -> None:
+        super().__init__(functionTable, edits)
+        self.analysis = Analysis(functionTable, modules, budget)
+        self.analysis.processCallees = False
+        self.definitions = {}
+        self.pinned = set()
+        self.names = set()
+        self.temps = {}
+        self.before = {}
+        self.lower = {}
+        self.rewritten = set()
+
+    def startFunction(self, node):
+        self.definitions = self.analysis.processFunction(self.functionTable[node.name], [])[0]
+        self.pinned = pinnedNames(node)
+        self.names = set(nd.id for nd in ast.walk(node) if isinstance(nd, ast.Name))
+        self.names |= set(nd.arg for nd in ast.walk(node) if isinstance(nd, ast.arg))
+        self.temps = {}
+        self.before = {}
+        self.lower = {}
+        self.rewritten = set()
+        self.availableBody(node.body, {}, node.lineno)
+
+    """
+    Walk a block with the given available expressions, returns the ones
+    available after it
+
+    @param available: mapping from expression dumps to AvailableExpression
+    @param lower: line the block starts after
+    """
+    def availableBody(self, body, available, lower):
+        for stmt in body:
+            available = self.availableStatement(stmt, available, lower)
+            lower = self.endLine(stmt, lower)
+        return available
+
+    def availableStatement(self, node, available, lower):
+        if getattr(node, "lineno", None) is None or node.lineno != int(node.lineno):
+            # Added or moved by an earlier pass, without lines or with dummy ones
+            return self.killed(available, node)
+        # New variables get dummy lines between the previous statement and
+        # this one, statements sharing a line with another one cannot get them
+        define = lower < node.lineno
+        self.lower[node] = lower
+        match node:
+            case ast.Assign(_, value) | ast.AnnAssign(_, _, value) | ast.AugAssign(_, _, value) | ast.Return(value) | ast.Expr(value):
+                if value is not None:
+                    self.visitStatement(value, node, available, define)
+                after = self.killed(available, node)
+                match node:
+                    case ast.Assign([ast.Name(id)], value) if isinstance(value, REUSABLE) and isReusable(value):
+                        self.addHolder(after, value, node, id)
+                return after
+            case ast.Assert() | ast.Raise():
+                for child in ast.iter_child_nodes(node):
+                    self.visitStatement(child, node, available, False)
+                return available
+            case ast.If(test, body, orelse):
+                self.visitStatement(test, node, available, define)
+                branch = self.killed(available, test)
+                self.availableBody(body, dict(branch), node.lineno)
+                self.availableBody(orelse, dict(branch), self.endLine(body[-1], node.lineno))
+                return self.killed(branch, node)
+            case ast.For(_, iter, body, orelse):
+                self.visitStatement(iter, node, available, define)
+                loop = self.killed(available, node)
+                self.availableBody(body, dict(loop), node.lineno)
+                self.availableBody(orelse, dict(loop), self.endLine(body[-1], node.lineno))
+                return loop
+            case ast.While(test, body, orelse):
+                loop = self.killed(available, node)
+                self.visitStatement(test, node, loop, False)
+                self.availableBody(body, dict(loop), node.lineno)
+                self.availableBody(orelse, dict(loop), self.endLine(body[-1], node.lineno))
+                return loop
+            case ast.Try(body) | ast.TryStar(body):
+                self.availableBody(body, dict(available), node.lineno)
+                after = self.killed(available, node)
+                for block, start in self.blocks(node)[1:]:
+                    self.availableBody(block, dict(after), start)
+                return after
+            case ast.FunctionDef() | ast.AsyncFunctionDef() | ast.ClassDef():
+                return self.killed(available, node)
+        # Blocks of other statements start with nothing available
+        for block, start in self.blocks(node):
+            self.availableBody(block, {}, start)
+        return self.killed(available, node)
+
+    """
+    Statement lists under a statement in source order, with the line each
+    one starts after
+    """
+    def blocks(self, node):
+        result = []
+        lower = node.lineno
+        for field in ("body", "handlers", "cases", "orelse", "finalbody"):
+            value = getattr(node, field, [])
+            if field == "handlers":
+                blocks = [(handler.body, handler.lineno) for handler in value]
+            elif field == "cases":
+                blocks = [(case.body, (case.guard or case.pattern).end_lineno) for case in value]
+            else:
+                blocks = [(value, lower)] if value else []
+            for block, start in blocks:
+                lower = max(lower, start)
+                result.append((block, lower))
+                lower = self.endLine(block[-1], lower)
+        return result
+
+    """
+    Last line of a statement, compound statements also define variables
+    at the line after their end
+
+    @param default: line returned for statements added without lines
+    """
+    def endLine(self, node, default):
+        if getattr(node, "end_lineno", None) is None:
+            return default
+        if hasattr(node, "body"):
+            return node.end_lineno + 0.5
+        return node.end_lineno
+
+    """
+    Available expressions left after a node is executed
+    """
+    def killed(self, available, node):
+        stored = storeCounts(node)
+        memory = hasMemoryEffects(node)
+        return {key: entry for key, entry in available.items()
+                if entry.names.isdisjoint(stored) and not (memory and entry.readsMemory)}
+
+    """
+    Make the value of an assignment available through its target, later
+    occurrences read the target instead of a new variable
+    """
+    def addHolder(self, available, value, statement, holder):
+        key = ast.dump(value)
+        names = namesRead(value)
+        if holder in self.pinned or holder in names or (key in available and available[key].node is not value):
+            return
+        readsMemory = any(isinstance(nd, (ast.Subscript, ast.Attribute)) for nd in ast.walk(value))
+        available[key] = AvailableExpression(value, statement, names | {holder}, readsMemory, holder)
+
+    """
+    Find reused expressions in an expression evaluated by a statement. In
+    a statement that can change objects the expressions reading memory
+    are not reused, and no expression gets a new variable
+
+    @param define: whether the expression is evaluated every time the statement is
+    """
+    def visitStatement(self, node, statement, available, define):
+        if node is None or any(isinstance(nd, ast.NamedExpr) for nd in ast.walk(node)):
+            # Variables stored in the middle of the statement
+            return
+        if hasMemoryEffects(node):
+            available = {key: entry for key, entry in available.items() if not entry.readsMemory}
+            define = False
+        self.visit(node, statement, available, define)
+
+    """
+    Find reused expressions in an expression and make the ones it evaluates
+    available
+
+    @param statement: statement the expression belongs to
+    @param define: whether the expression is evaluated every time the statement is
+    """
+    def visit(self, node, statement, available, define):
+        if isinstance(node, REUSABLE) and isReusable(node):
+            names = namesRead(node)
+            if names and names.isdisjoint(self.pinned):
+                key = ast.dump(node)
+                if key in available and self.sameDefinitions(available[key], statement):
+                    self.reuse(available[key], node, statement)
+                    return
+                if define:
+                    readsMemory = any(isinstance(nd, (ast.Subscript, ast.Attribute)) for nd in ast.walk(node))
+                    available[key] = AvailableExpression(node, statement, names, readsMemory)
+        match node:
+            case ast.Lambda() | ast.ListComp() | ast.SetComp() | ast.DictComp() | ast.GeneratorExp():
+                return
+            case ast.BoolOp(_, values):
+                self.visit(values[0], statement, available, define)
+                for value in values[1:]:
+                    self.visit(value, statement, available, False)
+            case ast.IfExp(test, body, orelse):
+                self.visit(test, statement, available, define)
+                self.visit(body, statement, available, False)
+                self.visit(orelse, statement, available, False)
+            case ast.Compare(left, _, comparators):
+                self.visit(left, statement, available, define)
+                self.visit(comparators[0], statement, available, define)
+                for comparator in comparators[1:]:
+                    self.visit(comparator, statement, available, False)
+            case _:
+                for child in ast.iter_child_nodes(node):
+                    if isinstance(child, ast.expr):
+                        self.visit(child, statement, available, define)
+
+    """
+    Check that the analysis has no definition of the variables of an
+    available expression between its first occurrence and a statement
+    """
+    def sameDefinitions(self, entry, statement):
+        start = entry.statement.lineno
+        end = statement.lineno
+        return not any(start < line < end for name in entry.names for line in self.definitions.get(name, {}))
+
+    def reuse(self, entry, node, statement):
+        if entry.holder is not None:
+            self.temps[node] = entry.holder
+        else:
+            if entry.node not in self.temps:
+                self.temps[entry.node] = self.newName()
+                self.before.setdefault(entry.statement, []).append(entry.node)
+                self.rewritten.add(entry.statement)
+            self.temps[node] = self.temps[entry.node]
+        self.rewritten.add(statement)
+
+    def finishStatement(self, node):
+        if node not in self.rewritten:
+            return node
+        self.substitute(node)
+        if node not in self.before:
+            return node
+        # Inner expressions end first and are assigned first
+        firsts = sorted(self.before[node], key=lambda nd: (nd.end_lineno, nd.end_col_offset, -nd.lineno, -nd.col_offset))
+        lower = self.lower[node]
+        assigns = []
+        for idx, first in enumerate(firsts):
+            self.substitute(first)
+            assign = ast.copy_location(ast.Assign([ast.Name(self.temps[first], ast.Store())], copy.deepcopy(first)), node)
+            line = lower + (node.lineno - lower) * (idx + 1) / (len(firsts) + 1)
+            for nd in ast.walk(assign):
+                if "lineno" in nd._attributes:
+                    nd.lineno = nd.end_lineno = line
+            assigns.append(assign)
+        replacement = assigns + [node]
+        self.record(node, ast.Module(replacement, []))
+        return replacement
+
+    """
+    Replace the reused expressions directly under a node with their
+    variables, statements under the node are finished on their own
+    """
+    def substitute(self, node):
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                for idx, item in enumerate(value):
+                    if isinstance(item, ast.expr):
+                        value[idx] = self.replace(item)
+                    elif isinstance(item, ast.AST) and not isinstance(item, (ast.stmt, ast.excepthandler, ast.match_case)):
+                        self.substitute(item)
+            elif isinstance(value, ast.expr):
+                setattr(node, field, self.replace(value))
+
+    def replace(self, node):
+        if node in self.temps:
+            name = ast.copy_location(ast.Name(self.temps[node], ast.Load()), node)
+            self.record(node, name)
+            return name
+        self.substitute(node)
+        return node
+
+    def newName(self):
+        idx = 0
+        while f"_cse{idx}" in self.names:
+            idx += 1
+        self.names.add(f"_cse{idx}")
+        return f"_cse{idx}"
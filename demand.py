@@ -0,0 +1,248 @@
+import ast
+import copy
+from analysis import Analysis
+
+
+"""
+Statement of a function as seen by the backward slicer. Compound
+statements are split so that only their header (test, iterator and
+target) is recorded here, their bodies are recorded separately
+
+@param node: statement node
+@param defs: names this statement defines, 'return' for return statements
+@param uses: names this statement reads
+@param ancestors: compound statements enclosing this statement, outermost first
+"""
+class SliceStatement:
+    def __init__(self, node, defs, uses, ancestors):
+        self.node = node
+        self.defs = defs
+        self.uses = uses
+        self.ancestors = ancestors
+
+
+"""
+Analysis that answers a single (variable, line) query by analyzing only
+the statements that can influence the variable. The statements of each
+function are indexed once by the names they define, a backward worklist
+over that index collects the slice, and only the slice is interpreted.
+Calls to user functions inside the slice are expanded with the callee
+sliced down to its return value
+"""
+class DemandAnalysis(Analysis):
+    def __init__(self, functionTable, modules=None):
+        super().__init__(functionTable, modules)
+        # Derived from the function table only, shared by every analysis
+        self.definitionIndex = {}
+        self.returnSlices = {}
+
+    """
+    Collect names read by a node, including user function names that
+    are called in it
+    """
+    def namesIn(self, node):
+        names = set()
+        if node is None:
+            return names
+        for nd in ast.walk(node):
+            match nd:
+                case ast.Name(id, _):
+                    names.add(id)
+                case ast.Attribute(value, attr, _):
+                    names.add(attr)
+        return names
+
+    """
+    Collect user function names called in a node, the analysis records
+    the callee results under these names at the call line
+    """
+    def calleesIn(self, node):
+        callees = set()
+        if node is None:
+            return callees
+        for nd in ast.walk(node):
+            match nd:
+                case ast.Call(ast.Name(id, _), _, _):
+                    if id in self.functionTable:
+                        callees.add(id)
+        return callees
+
+    """
+    Collect the names whose value a node may change in place: the objects
+    methods are called on and the objects whose items or attributes are
+    assigned. The analysis adds the values a method is passed, or an item
+    is assigned, to the definition of the name
+    """
+    def mutatedIn(self, node):
+        names = set()
+        if node is None:
+            return names
+        for nd in ast.walk(node):
+            match nd:
+                case ast.Call(ast.Attribute() | ast.Subscript() as func):
+                    base = func
+                case ast.Attribute(_, _, ast.Store() | ast.Del()) | ast.Subscript(_, _, ast.Store() | ast.Del()):
+                    base = nd
+                case _:
+                    continue
+            while isinstance(base, (ast.Attribute, ast.Subscript)):
+                base = base.value
+            if isinstance(base, ast.Name):
+                names.add(base.id)
+        return names
+
+    """
+    Index the statements of the given body by the names they define
+
+    @param body: list of statements
+    @param ancestors: compound statements enclosing the body
+    @param index: mapping from each name to the statements defining it
+    @param statements: list of every indexed statement
+    """
+    def indexBody(self, body, ancestors, index, statements):
+        for node in body:
+            records = []
+            match node:
+                case ast.Assign(targets, value, _):
+                    defs = set()
+                    for target in targets:
+                        defs |= self.namesIn(target)
+                    defs |= self.calleesIn(value) | self.mutatedIn(node)
+                    records.append(SliceStatement(node, defs, self.namesIn(node), ancestors))
+                case ast.AugAssign(target, _, value):
+                    defs = self.namesIn(target) | self.calleesIn(value) | self.mutatedIn(value)
+                    records.append(SliceStatement(node, defs, self.namesIn(node), ancestors))
+                case ast.Return(value):
+                    defs = {'return'} | self.calleesIn(value) | self.mutatedIn(value)
+                    records.append(SliceStatement(node, defs, self.namesIn(value), ancestors))
+                case ast.Expr(value):
+                    defs = self.calleesIn(value) | self.mutatedIn(value)
+                    records.append(SliceStatement(node, defs, self.namesIn(value), ancestors))
+                case ast.If(test, body, orelse):
+                    defs = self.calleesIn(test) | self.mutatedIn(test)
+                    records.append(SliceStatement(node, defs, self.namesIn(test), ancestors))
+                    self.indexBody(body, ancestors + (node,), index, statements)
+                    self.indexBody(orelse, ancestors + (node,), index, statements)
+                case ast.For(target, iter, body, orelse, _):
+                    defs = self.namesIn(target) | self.calleesIn(iter) | self.mutatedIn(iter)
+                    records.append(SliceStatement(node, defs, self.namesIn(iter), ancestors))
+                    self.indexBody(body, ancestors + (node,), index, statements)
+                case ast.While(test, body, orelse):
+                    defs = self.calleesIn(test) | self.mutatedIn(test)
+                    records.append(SliceStatement(node, defs, self.namesIn(test), ancestors))
+                    self.indexBody(body, ancestors + (node,), index, statements)
+            for record in records:
+                statements.append(record)
+                for name in record.defs:
+                    if name in index:
+                        index[name].append(record)
+                    else:
+                        index[name] = [record]
+
+    def getDefinitionIndex(self, function):
+        if function not in self.definitionIndex:
+            index = {}
+            self.indexBody(function.body, (), index, [])
+            self.definitionIndex[function] = index
+        return self.definitionIndex[function]
+
+    """
+    Compute the backward slice of a function for the given variables.
+    Returns a copy of the function keeping only the statements in the
+    slice and the compound statements enclosing them
+
+    @param function: AST node corresponding to function definition
+    @param variables: names the slice starts from
+    """
+    def sliceFunction(self, function, variables):
+        index = self.getDefinitionIndex(function)
+        stack = list(variables)
+        needed = set(variables)
+        kept = set()
+        while stack:
+            variable = stack.pop()
+            for record in index.get(variable, []):
+                if record.node in kept:
+                    continue
+                kept.add(record.node)
+                kept.update(record.ancestors)
+                for name in record.uses:
+                    if name not in needed:
+                        needed.add(name)
+                        stack.append(name)
+
+        pruned = copy.copy(function)
+        pruned.body = self.pruneBody(function.body, kept)
+        return pruned
+
+    """
+    Copy a statement list keeping only statements in the slice. A branch
+    or loop body that becomes empty gets a pass statement so if/else
+    structure, which the analysis relies on when merging branches, is preserved
+    """
+    def pruneBody(self, body, kept):
+        result = []
+        for node in body:
+            match node:
+                case ast.If():
+                    if node not in kept:
+                        continue
+                    result.append(self.pruneIf(node, kept))
+                case ast.For() | ast.While():
+                    if node not in kept:
+                        continue
+                    loop = copy.copy(node)
+                    loop.body = self.pruneBody(node.body, kept) or [ast.Pass()]
+                    loop.orelse = []
+                    result.append(loop)
+                case _:
+                    if node in kept:
+                        result.append(node)
+        return result
+
+    def pruneIf(self, node, kept):
+        pruned = copy.copy(node)
+        pruned.body = self.pruneBody(node.body, kept) or [ast.Pass()]
+        if node.orelse and isinstance(node.orelse[0], ast.If):
+            pruned.orelse = [self.pruneIf(node.orelse[0], kept)]
+        elif node.orelse:
+            pruned.orelse = self.pruneBody(node.orelse, kept) or [ast.Pass()]
+        return pruned
+
+    """
+    Callees are expanded with only the part of their body that affects
+    the returned value
+    """
+    def processFunction(self, function, arg_list):
+        if function not in self.returnSlices:
+            self.returnSlices[function] = self.sliceFunction(function, ['return'])
+        return super().processFunction(self.returnSlices[function], arg_list)
+
+    """
+    Names that can be queried in a function, the same names the full
+    analysis would put in its reference table
+    """
+    def queryableNames(self, function):
+        names = set(self.getDefinitionIndex(function))
+        for arg in function.args.args:
+            names.add(arg.arg)
+        return names
+
+    """
+    Answer a single dependency query, printing the same report as getResults
+
+    @param functionName: name of the function containing the variable
+    @param variableName: variable to find dependencies of
+    @param line: line the dependencies are computed at
+    """
+    def query(self, functionName, variableName, line):
+        function = self.functionTable[functionName]
+        pruned = self.sliceFunction(function, [variableName])
+        referenceTable = super().processFunction(pruned, [])
+        return self.getResults(referenceTable[0], variableName, line)
+
+    def runInteractiveAnalysis(self):
+        functionName = self.pickFunction()
+        variableName = self.pickVariable(self.queryableNames(self.functionTable[functionName]))
+        line = self.pickLine(functionName)
+        self.query(functionName, variableName, line)
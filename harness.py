@@ -0,0 +1,221 @@
+import ast
+import copy
+import io
+import os
+import random
+import signal
+import timeit
+from contextlib import redirect_stdout
+from symbols import ModuleIndex
+from transform import transformTree
+
+
+# Seconds a single checked call may take before it is given up on
+CALL_TIMEOUT = 2.0
+
+# Values of generated arguments, small enough for loops over them to end
+GENERATED_VALUES = range(-3, 10)
+
+
+"""
+Raised in a checked call that runs longer than CALL_TIMEOUT
+"""
+class CallTimeout(Exception):
+    pass
+
+
+"""
+Result of one call: whether it returned or raised, the returned value or
+the name of the raised exception, and what the call printed
+"""
+class CallResult:
+    def __init__(self, kind, value, output):
+        self.kind = kind
+        self.value = value
+        self.output = output
+
+    def same(self, other):
+        if self.kind != other.kind or self.output != other.output:
+            return False
+        try:
+            if bool(self.value == other.value):
+                return True
+        except Exception:
+            pass
+        # Values that are not equal to themselves, such as nan
+        return repr(self.value) == repr(other.value)
+
+    def describe(self):
+        if self.kind == "timeout":
+            return "did not finish"
+        if self.kind == "raise":
+            return "raised " + self.value
+        return "returned " + repr(self.value)
+
+
+"""
+Run the code of a module in a fresh namespace, what it prints is dropped
+"""
+def loadModule(code, filePath):
+    namespace = {"__name__": os.path.splitext(os.path.basename(filePath))[0], "__file__": filePath}
+    with redirect_stdout(io.StringIO()):
+        exec(compile(code, filePath, "exec"), namespace)
+    return namespace
+
+
+def onTimeout(signum, frame):
+    raise CallTimeout()
+
+
+"""
+Call a function on a copy of the arguments, a call running longer than
+CALL_TIMEOUT is stopped where the platform has SIGALRM
+
+@param arguments: tuple or list of positional arguments, or dict of keyword arguments
+"""
+def callFunction(function, arguments):
+    arguments = copy.deepcopy(arguments)
+    output = io.StringIO()
+    alarm = hasattr(signal, "SIGALRM")
+    if alarm:
+        previous = signal.signal(signal.SIGALRM, onTimeout)
+        signal.setitimer(signal.ITIMER_REAL, CALL_TIMEOUT)
+    try:
+        with redirect_stdout(output):
+            if isinstance(arguments, dict):
+                value = function(**arguments)
+            else:
+                value = function(*arguments)
+        return CallResult("return", value, output.getvalue())
+    except CallTimeout:
+        return CallResult("timeout", None, output.getvalue())
+    except Exception as e:
+        return CallResult("raise", type(e).__name__, output.getvalue())
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+"""
+Argument sets for the positional parameters of a function without
+defaults, drawn from GENERATED_VALUES. None when the function has
+required keyword-only parameters
+"""
+def generateArguments(node, samples, rng):
+    args = node.args
+    if any(default is None for default in args.kw_defaults):
+        return None
+    count = len(args.posonlyargs) + len(args.args) - len(args.defaults)
+    if count == 0:
+        return [()]
+    return [tuple(rng.choice(GENERATED_VALUES) for _ in range(count)) for _ in range(samples)]
+
+
+"""
+Best time of a single call of each function over the given argument
+sets. The number of calls per measurement is picked with timeit for the
+first function and used for all of them. Arguments are not copied between
+timed calls, so the time is the one of calling the function itself
+"""
+def timeFunctions(functions, argumentSets):
+    def runner(function):
+        def run():
+            with redirect_stdout(io.StringIO()):
+                for arguments in argumentSets:
+                    if isinstance(arguments, dict):
+                        function(**arguments)
+                    else:
+                        function(*arguments)
+        return run
+
+    number = timeit.Timer(runner(functions[0])).autorange()[0]
+    return [min(timeit.Timer(runner(function)).repeat(5, number)) / (number * len(argumentSets)) for function in functions]
+
+
+def formatTime(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+"""
+Transform a file, then call every top-level function of the original and
+of the transformed program on the same arguments and compare what they
+return, raise and print. Functions that agree on every argument set are
+timed with timeit on the sets both versions returned from, and a speedup
+is reported for each. Returns the number of functions whose results differ
+
+@param filePath: file path to the tested program
+@param options: TransformOptions, defaults are used when None
+@param inputsPath: file with a Python dict literal mapping function names
+                   to lists of argument sets, each a tuple of positional
+                   arguments or a dict of keyword arguments. Functions not
+                   in it get generated arguments
+@param samples: number of generated argument sets per function
+"""
+def compareTransformed(filePath, options=None, inputsPath=None, samples=20):
+    file = open(filePath, "r")
+    source = file.read()
+    file.close()
+
+    tree = ast.parse(source)
+    functions = [node for node in tree.body if isinstance(node, ast.FunctionDef)]
+    index = ModuleIndex(tree)
+    modules = options.moduleScope(filePath, tree.body) if options is not None else None
+    tree = transformTree(tree, index, options=options, modules=modules)
+
+    inputs = {}
+    if inputsPath is not None:
+        file = open(inputsPath, "r")
+        inputs = ast.literal_eval(file.read())
+        file.close()
+
+    original = loadModule(source, filePath)
+    transformed = loadModule(ast.unparse(tree), filePath)
+    rng = random.Random(0)
+    different = 0
+    for node in functions:
+        name = node.name
+        if not callable(original.get(name)) or not callable(transformed.get(name)):
+            continue
+        argumentSets = inputs[name] if name in inputs else generateArguments(node, samples, rng)
+        if argumentSets is None:
+            print(f"{name}: skipped, it has required keyword-only parameters")
+            continue
+
+        timed = []
+        mismatch = None
+        compared = 0
+        for arguments in argumentSets:
+            before = callFunction(original[name], arguments)
+            if before.kind == "timeout":
+                continue
+            compared += 1
+            after = callFunction(transformed[name], arguments)
+            if not before.same(after):
+                mismatch = (arguments, before, after)
+                break
+            if before.kind == "return":
+                timed.append(arguments)
+        if mismatch is not None:
+            different += 1
+            arguments, before, after = mismatch
+            print(f"{name}: different results for arguments {arguments!r}: "
+                  f"original {before.describe()}, transformed {after.describe()}")
+            if before.output != after.output:
+                print(f"{name}: printed {before.output!r} before and {after.output!r} after")
+            continue
+        if not timed:
+            print(f"{name}: same results on {compared} argument sets, no call returned to time")
+            continue
+
+        originalTime, transformedTime = timeFunctions([original[name], transformed[name]], timed)
+        print(f"{name}: same results on {compared} argument sets, "
+              f"original {formatTime(originalTime)}, transformed {formatTime(transformedTime)}, "
+              f"speedup {originalTime / transformedTime:.2f}x")
+
+    if different:
+        print("Functions with different results:", different)
+    return different
@@ -0,0 +1,275 @@
+import ast
+import builtins
+import copy
+from licm import storeCounts
+from liveness import pinnedNames
+from passes import RewriteRule
+
+
+# Statements whose expressions are evaluated once, in front of anything
+# else the statement does, a call in them can be replaced by the body of
+# the called function placed in front of the statement
+INLINE_STATEMENTS = (ast.Assign, ast.AugAssign, ast.AnnAssign, ast.Expr, ast.Return, ast.If)
+
+
+"""
+Check whether evaluating an expression always evaluates a node in it.
+Operands after the first of boolean operators and chained comparisons,
+the branches of conditional expressions and the bodies of lambdas and
+comprehensions are only evaluated sometimes
+"""
+def alwaysEvaluated(root, target):
+    if root is target:
+        return True
+    match root:
+        case ast.BoolOp(_, values):
+            children = values[:1]
+        case ast.Compare(left, _, comparators):
+            children = [left] + comparators[:1]
+        case ast.IfExp(test, _, _):
+            children = [test]
+        case ast.Lambda() | ast.ListComp() | ast.SetComp() | ast.DictComp() | ast.GeneratorExp():
+            return False
+        case _:
+            children = list(ast.iter_child_nodes(root))
+    return any(alwaysEvaluated(child, target) for child in children)
+
+
+"""
+Replace names of a copied function body, names mapped to expressions are
+replaced with a copy of the expression
+"""
+class RenameNames(ast.NodeTransformer):
+    def __init__(self, names) -> None:
+        self.names = names
+
+    def visit_Name(self, node):
+        if node.id not in self.names:
+            return node
+        replacement = self.names[node.id]
+        if isinstance(replacement, str):
+            return ast.copy_location(ast.Name(replacement, node.ctx), node)
+        return ast.copy_location(copy.deepcopy(replacement), node)
+
+
+"""
+Rule inlining calls of small functions. A call is replaced when it is the
+only call in the expressions of an assignment, expression statement,
+return or if test, and it is always evaluated. The assignments of the
+called function are placed in front of the statement with their
+variables renamed to new names, and the call is replaced by the returned
+expression. Arguments that are names or constants are used in place of
+the parameters they are passed to, other arguments are assigned to new
+variables first.
+
+Only functions defined at the top level of the module and bound by
+nothing but their definition are inlined, a bare name in the function
+table can be a method or a nested function. They must not be recursive,
+have no decorators, *args or **kwargs, end in their only return
+statement and only assign to names before it, and their body must have
+at most the given number of nodes. Names the function reads besides its
+own variables must be such functions or builtins the module does not
+bind, and the calling function must not bind them either. The analysis keys definitions by line, so the
+inlined assignments get dummy lines between the previous statement and
+the one containing the call, like moved statements of
+LoopInvariantCodeMotion, and the rule belongs to a pass in front of the
+analysis-based ones
+
+@param module: ModuleIndex or LazyFunctionTable of the module, called
+               names are resolved through its moduleFunctions
+@param limit: nodes the body of an inlined function may have
+"""
+class FunctionInlining(RewriteRule):
+    def __init__(self, functionTable, module, edits=None, limit=40) -> None:
+        super().__init__(functionTable, edits)
+        self.module = module
+        self.limit = limit
+        self.moduleFunctions = {}
+        self.function = None
+        self.bound = set()
+        self.names = set()
+        self.inlinable = {}
+        self.freeNames = {}
+
+    def startFunction(self, node):
+        self.function = node
+        # Functions inlined before may have been transformed since
+        self.inlinable = {}
+        self.freeNames = {}
+        self.moduleFunctions = self.module.moduleFunctions
+        args = node.args
+        self.bound = set(storeCounts(ast.Module(node.body, [])))
+        self.bound |= set(arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs)
+        self.bound |= set(arg.arg for arg in (args.vararg, args.kwarg) if arg is not None)
+        self.bound |= pinnedNames(node)
+        self.names = set(nd.id for nd in ast.walk(node) if isinstance(nd, ast.Name)) | self.bound
+
+    def finishStatement(self, node):
+        if not isinstance(node, INLINE_STATEMENTS):
+            return node
+        expressions = [node.test] if isinstance(node, ast.If) else [node.value]
+        if expressions[0] is None:
+            return node
+        calls = [nd for nd in ast.walk(expressions[0]) if isinstance(nd, (ast.Call, ast.Await, ast.Yield, ast.YieldFrom, ast.NamedExpr))]
+        if len(calls) != 1 or not isinstance(calls[0], ast.Call) or not alwaysEvaluated(expressions[0], calls[0]):
+            return node
+        call = calls[0]
+        if not isinstance(call.func, ast.Name) or call.func.id in self.bound or not self.isInlinable(call.func.id):
+            return node
+        callee = self.moduleFunctions[call.func.id]
+        if callee is self.function or not self.freeNames[callee.name].isdisjoint(self.bound):
+            return node
+        bindings = self.bindArguments(callee, call)
+        if bindings is None:
+            return node
+
+        prelude = []
+        names = {}
+        for param, value in bindings:
+            if isinstance(value, (ast.Name, ast.Constant)) and not storeCounts(ast.Module(callee.body, []))[param]:
+                names[param] = value
+            else:
+                names[param] = self.newName(callee.name, param)
+                prelude.append(ast.Assign([ast.Name(names[param], ast.Store())], value))
+        for name in storeCounts(ast.Module(callee.body, [])):
+            if name not in names:
+                names[name] = self.newName(callee.name, name)
+        renamer = RenameNames(names)
+        for stmt in callee.body[:-1]:
+            prelude.append(renamer.visit(copy.deepcopy(stmt)))
+        returned = callee.body[-1].value
+        returned = renamer.visit(copy.deepcopy(returned)) if returned is not None else ast.Constant(None)
+        for nd in ast.walk(returned):
+            if "lineno" in nd._attributes:
+                ast.copy_location(nd, call)
+        self.replaceNode(node, call, returned)
+
+        for idx, stmt in enumerate(prelude):
+            # Same dummy lines as statements moved in front of a loop
+            line = node.lineno - 0.5 + (idx + 1) / (2 * (len(prelude) + 1))
+            for nd in ast.walk(stmt):
+                if "lineno" in nd._attributes:
+                    nd.lineno = nd.end_lineno = line
+                    nd.col_offset = nd.end_col_offset = 0
+        replacement = prelude + [node]
+        self.record(node, ast.Module(replacement, []))
+        return replacement
+
+    """
+    Check whether the top-level function with the given name can be inlined
+    """
+    def isInlinable(self, name):
+        if name not in self.moduleFunctions:
+            return False
+        if name not in self.inlinable:
+            self.inlinable[name] = self.checkInlinable(self.moduleFunctions[name])
+        return self.inlinable[name]
+
+    def checkInlinable(self, callee):
+        args = callee.args
+        if callee.decorator_list or args.vararg is not None or args.kwarg is not None:
+            return False
+        if not callee.body or not isinstance(callee.body[-1], ast.Return):
+            return False
+        if sum(1 for stmt in callee.body for nd in ast.walk(stmt)) > self.limit:
+            return False
+        for stmt in callee.body[:-1]:
+            match stmt:
+                case ast.Assign(targets, _, _) if all(isinstance(nd, (ast.Name, ast.Tuple, ast.List, ast.Starred, ast.Load, ast.Store))
+                                                      for target in targets for nd in ast.walk(target)):
+                    pass
+                case ast.AugAssign(ast.Name()) | ast.AnnAssign(ast.Name(), _, ast.expr()):
+                    pass
+                case _:
+                    return False
+        for nd in ast.walk(ast.Module(callee.body, [])):
+            if isinstance(nd, (ast.Yield, ast.YieldFrom, ast.Await, ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+                # Names in nested scopes are not renamed consistently
+                return False
+        local = set(storeCounts(ast.Module(callee.body, []))) | set(arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs)
+        free = set(nd.id for nd in ast.walk(ast.Module(callee.body, [])) if isinstance(nd, ast.Name) and nd.id not in local)
+        for name in free:
+            if name not in self.moduleFunctions and not (hasattr(builtins, name) and not self.module.moduleStores[name]):
+                return False
+        self.freeNames[callee.name] = free
+        return not self.isRecursive(callee.name)
+
+    """
+    Check whether a top-level function can call itself, directly or
+    through other top-level functions
+    """
+    def isRecursive(self, name):
+        stack = [name]
+        visited = set()
+        while stack:
+            current = stack.pop()
+            for nd in ast.walk(self.moduleFunctions[current]):
+                if isinstance(nd, ast.Name) and nd.id in self.moduleFunctions:
+                    if nd.id == name:
+                        return True
+                    if nd.id not in visited:
+                        visited.add(nd.id)
+                        stack.append(nd.id)
+        return False
+
+    """
+    Pair the parameters of a function with the expressions a call passes to
+    them, parameters not passed get their default when it is a constant.
+    None when the call cannot be matched
+    """
+    def bindArguments(self, callee, call):
+        args = callee.args
+        positional = args.posonlyargs + args.args
+        if len(call.args) > len(positional) or any(isinstance(arg, ast.Starred) for arg in call.args):
+            return None
+        values = {}
+        for param, arg in zip(positional, call.args):
+            values[param.arg] = arg
+        keywordNames = set(arg.arg for arg in args.args + args.kwonlyargs)
+        for keyword in call.keywords:
+            if keyword.arg is None or keyword.arg not in keywordNames or keyword.arg in values:
+                return None
+            values[keyword.arg] = keyword.value
+        defaults = dict(zip([arg.arg for arg in positional[len(positional) - len(args.defaults):]], args.defaults))
+        for arg, default in zip(args.kwonlyargs, args.kw_defaults):
+            if default is not None:
+                defaults[arg.arg] = default
+        bindings = []
+        # Arguments keep the order they are evaluated in
+        for arg in call.args:
+            param = next(name for name in values if values[name] is arg)
+            bindings.append((param, arg))
+        for keyword in call.keywords:
+            bindings.append((keyword.arg, keyword.value))
+        for param in positional + args.kwonlyargs:
+            if param.arg in values:
+                continue
+            if not isinstance(defaults.get(param.arg), ast.Constant):
+                return None
+            bindings.append((param.arg, copy.deepcopy(defaults[param.arg])))
+        return bindings
+
+    """
+    Replace a node in the expressions of a statement
+    """
+    def replaceNode(self, root, target, replacement):
+        for parent in ast.walk(root):
+            for field, value in ast.iter_fields(parent):
+                if value is target:
+                    setattr(parent, field, replacement)
+                    return
+                if isinstance(value, list):
+                    for idx, item in enumerate(value):
+                        if item is target:
+                            value[idx] = replacement
+                            return
+
+    def newName(self, function, name):
+        base = f"_{function}_{name}"
+        idx = 0
+        result = base
+        while result in self.names:
+            idx += 1
+            result = f"{base}{idx}"
+        self.names.add(result)
+        return result
@@ -0,0 +1,238 @@
+import ast
+import mmap
+import tokenize
+from collections import Counter
+from collections.abc import Mapping
+from symbols import ModuleIndex, moduleStores
+
+
+"""
+Top-level statement of a lazily loaded file
+
+@param kind: 'def', 'class', 'import' or 'other'
+@param name: name of the defined function or class, None for other statements
+@param lineno: first line of the statement, including decorators
+@param end_lineno: last line of the statement
+"""
+class Span:
+    def __init__(self, kind, name, lineno, end_lineno):
+        self.kind = kind
+        self.name = name
+        self.lineno = lineno
+        self.end_lineno = end_lineno
+
+
+"""
+Source file split into top-level statement spans without parsing it.
+The file is read through mmap and tokenized once to find where each
+top-level statement starts and ends, only byte offsets of line starts are
+kept. A statement is parsed when it is first needed
+"""
+class LazySource:
+    def __init__(self, filePath):
+        self.file = open(filePath, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self.data = b""
+        self.lineStarts = [0]
+        self.encoding = "utf-8"
+        self.spans = []
+        self.nestedDefinitions = []
+        self.split()
+
+    def readline(self):
+        line = self.data.readline() if self.data else b""
+        if line:
+            self.lineStarts.append(self.lineStarts[-1] + len(line))
+        return line
+
+    """
+    Tokenize the file and record the span of every top-level statement.
+    A statement starts at the first token of a logical line at indentation
+    level zero and ends with the last logical line before the next one.
+    Decorator lines are joined with the definition that follows them.
+    Functions defined inside a top-level statement are recorded with the
+    statement containing them and their indentation depth
+    """
+    def split(self):
+        depth = 0
+        current = None
+        lastEnd = 0
+        header = None
+        lineStart = True
+        for token in tokenize.tokenize(self.readline):
+            match token.type:
+                case tokenize.ENCODING:
+                    self.encoding = token.string
+                case tokenize.INDENT:
+                    depth += 1
+                case tokenize.DEDENT:
+                    depth -= 1
+                case tokenize.NL | tokenize.COMMENT | tokenize.ENDMARKER:
+                    pass
+                case tokenize.NEWLINE:
+                    lastEnd = token.end[0]
+                    lineStart = True
+                    if header is not None:
+                        nested = Span("other", None, None, None)
+                        self.classify(current if depth == 0 else nested, header)
+                        if nested.kind == "def":
+                            self.nestedDefinitions.append((nested.name, depth, current))
+                        header = None
+                case _:
+                    if lineStart:
+                        lineStart = False
+                        header = []
+                        if depth == 0 and (current is None or current.kind != "decorator"):
+                            if current is not None:
+                                current.end_lineno = lastEnd
+                            current = Span("other", None, token.start[0], None)
+                            self.spans.append(current)
+                    if header is not None and len(header) < 3:
+                        header.append(token.string)
+        if current is not None:
+            current.end_lineno = lastEnd
+
+    """
+    Find the kind and name of a statement from the first tokens of its
+    first logical line
+    """
+    def classify(self, span, header):
+        header = header + [None] * (3 - len(header))
+        if header[0] == "@":
+            span.kind = "decorator"
+        elif header[0] in ("def", "class"):
+            span.kind = header[0]
+            span.name = header[1]
+        elif header[0] in ("import", "from"):
+            span.kind = "import"
+        elif header[0] == "async" and header[1] == "def":
+            # Not analyzed, like in collectFunctions
+            span.kind = "async"
+            span.name = header[2]
+        else:
+            span.kind = "other"
+
+    """
+    Parse the statement in the given span. Line numbers in the returned
+    nodes match the line numbers in the file
+    """
+    def parse(self, span):
+        return self.parseStatements(span)[0]
+
+    """
+    Same as parse, returning every statement of the span, a span holds
+    several statements when they share a line separated by semicolons
+    """
+    def parseStatements(self, span):
+        start = self.lineStarts[span.lineno - 1]
+        end = self.lineStarts[span.end_lineno] if span.end_lineno < len(self.lineStarts) else len(self.data)
+        text = self.data[start:end].decode(self.encoding)
+        tree = ast.parse(text)
+        ast.increment_lineno(tree, span.lineno - 1)
+        return tree.body
+
+    def close(self):
+        if self.data:
+            self.data.close()
+        self.file.close()
+
+
+"""
+Function table over a lazily loaded file, used in place of the table
+built by collectFunctions. Function names are known from the split of the
+file, a top-level statement is parsed the first time a function defined
+in it is looked up
+
+@param source: LazySource of the file
+"""
+class LazyFunctionTable(Mapping):
+    def __init__(self, source):
+        self.source = source
+        self.spans = {}
+        self.parsed = {}
+        self.stores = None
+        for span in source.spans:
+            if span.kind == "def":
+                self.spans[span.name] = (0, span)
+        # Top-level functions keep precedence over nested ones
+        for name, depth, span in source.nestedDefinitions:
+            if name not in self.spans or self.spans[name][0] >= depth:
+                self.spans[name] = (depth, span)
+
+    def parse(self, span):
+        if span.lineno not in self.parsed:
+            self.parsed[span.lineno] = ModuleIndex(self.source.parse(span))
+        return self.parsed[span.lineno]
+
+    def __getitem__(self, name):
+        depth, span = self.spans[name]
+        index = self.parse(span)
+        if name not in index.functionTable:
+            raise KeyError(name)
+        return index.functionTable[name]
+
+    def __contains__(self, name):
+        return name in self.spans
+
+    def __iter__(self):
+        return iter(self.spans)
+
+    def __len__(self):
+        return len(self.spans)
+
+    """
+    Number of stores to each name at the top level of the file, like the
+    moduleStores of ModuleIndex. Definitions count from the split of the
+    file, the other top-level statements are parsed the first time the
+    counts are needed and not kept
+    """
+    @property
+    def moduleStores(self):
+        if self.stores is None:
+            self.stores = Counter()
+            for span in self.source.spans:
+                if span.kind in ("def", "class", "async"):
+                    self.stores[span.name] += 1
+                else:
+                    self.stores.update(moduleStores(ast.Module(self.source.parseStatements(span), [])))
+        return self.stores
+
+    """
+    Top-level functions the file binds by nothing but their definition,
+    like the moduleFunctions of ModuleIndex. They are parsed when looked up
+    """
+    @property
+    def moduleFunctions(self):
+        stores = self.moduleStores
+        return LazyModuleFunctions(self, [name for name, (depth, span) in self.spans.items()
+                                          if depth == 0 and span.kind == "def" and stores[name] == 1])
+
+
+"""
+Mapping from the names of the top-level functions of a lazily loaded file
+to their definitions, a view of the function table of the file
+
+@param table: LazyFunctionTable of the file
+@param names: names of the functions in the view
+"""
+class LazyModuleFunctions(Mapping):
+    def __init__(self, table, names):
+        self.table = table
+        self.names = set(names)
+
+    def __getitem__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+        return self.table[name]
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
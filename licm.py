@@ -0,0 +1,404 @@
+import ast
+from collections import Counter
+from passes import RewriteRule, hasSideEffects
+from liveness import namesRead, pinnedNames
+
+
+# Operators moved out of loops. Division, modulo, power and shifts are
+# left in place since they can fail for some values of their operands,
+# moving them could raise an error in a loop that never runs. The other
+# operators are only moved when their operands are known to be ints
+SAFE_BINARY = (ast.Add, ast.Sub, ast.Mult, ast.BitAnd, ast.BitOr, ast.BitXor)
+SAFE_UNARY = (ast.UAdd, ast.USub, ast.Not, ast.Invert)
+SAFE_COMPARE = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Is, ast.IsNot)
+
+
+# Operators whose result is an int when both operands are
+INT_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.FloorDiv, ast.Mod, ast.BitAnd, ast.BitOr, ast.BitXor, ast.LShift, ast.RShift)
+INT_UNARY = (ast.UAdd, ast.USub, ast.Invert)
+
+
+def isIntConstant(node, value=None):
+    return isinstance(node, ast.Constant) and type(node.value) is int and (value is None or node.value == value)
+
+
+"""
+Check whether an expression always evaluates to an int, given the names
+known to hold ints. Bools are ints but not kept by the identities, so
+only int constants count
+"""
+def isInt(node, names):
+    match node:
+        case ast.Constant():
+            return isIntConstant(node)
+        case ast.Name(id, ast.Load()):
+            return id in names
+        case ast.BinOp(left, op, right):
+            return isinstance(op, INT_OPERATORS) and isInt(left, names) and isInt(right, names)
+        case ast.UnaryOp(op, operand):
+            return isinstance(op, INT_UNARY) and isInt(operand, names)
+    return False
+
+
+"""
+Names of a function that only ever hold ints: every store to them
+assigns an int expression, adds an int to them or is the variable of a
+for loop over range. Parameters and names used by nested functions or
+declared global or nonlocal are never known. The names are found as a
+greatest fixpoint, so variables incremented in loops are known
+
+@param function: AST node corresponding to function definition
+@param bound: names bound in the function or the table, range is not the builtin when bound
+"""
+def intNames(function, bound):
+    sources = {}
+    for nd in ast.walk(ast.Module(function.body, [])):
+        match nd:
+            case ast.Assign([ast.Name(id)], value) | ast.AnnAssign(ast.Name(id), _, value) if value is not None:
+                sources.setdefault(id, []).append(value)
+            case ast.AugAssign(ast.Name(id), op, value):
+                sources.setdefault(id, []).append(ast.BinOp(ast.Name(id, ast.Load()), op, value))
+            case ast.For(ast.Name(id), ast.Call(ast.Name("range"), args, [])) if "range" not in bound and 1 <= len(args) <= 3:
+                sources.setdefault(id, []).append(ast.Constant(0))
+    stores = storeCounts(ast.Module(function.body, []))
+    args = function.args
+    excluded = pinnedNames(function) | set(arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs)
+    names = set(name for name in sources if len(sources[name]) == stores[name] and name not in excluded)
+    changed = True
+    while changed:
+        changed = False
+        for name in list(names):
+            if not all(isInt(value, names) for value in sources[name]):
+                names.discard(name)
+                changed = True
+    return names
+
+
+"""
+Check whether an expression only reads plain names and constants through
+operators that can be evaluated early. Like the rest of the optimizer,
+operators are assumed to have no side effects
+"""
+def isMovable(node):
+    match node:
+        case ast.Constant():
+            return True
+        case ast.Name(_, ast.Load()):
+            return True
+        case ast.BinOp(left, op, right):
+            return isinstance(op, SAFE_BINARY) and isMovable(left) and isMovable(right)
+        case ast.UnaryOp(op, operand):
+            return isinstance(op, SAFE_UNARY) and isMovable(operand)
+        case ast.Compare(left, ops, comparators):
+            return all(isinstance(op, SAFE_COMPARE) for op in ops) and isMovable(left) and all(isMovable(nd) for nd in comparators)
+        case ast.BoolOp(_, values):
+            return all(isMovable(nd) for nd in values)
+        case ast.IfExp(test, body, orelse):
+            return isMovable(test) and isMovable(body) and isMovable(orelse)
+    return False
+
+
+"""
+Number of stores to each name in a node, deletions count as stores
+"""
+def storeCounts(node):
+    counts = Counter()
+    for nd in ast.walk(node):
+        match nd:
+            case ast.Name(id, ast.Store() | ast.Del()):
+                counts[id] += 1
+            case ast.FunctionDef(name) | ast.AsyncFunctionDef(name) | ast.ClassDef(name):
+                counts[name] += 1
+            case ast.ExceptHandler(_, name) if name is not None:
+                counts[name] += 1
+            case ast.alias(name, asname):
+                counts[asname or name.split(".")[0]] += 1
+            case ast.MatchAs(_, name) | ast.MatchStar(name) if name is not None:
+                counts[name] += 1
+            case ast.MatchMapping(_, _, rest) if rest is not None:
+                counts[rest] += 1
+    return counts
+
+
+"""
+Check whether evaluating an expression only involves ints, so it cannot
+raise an error whatever values its names hold. Comparisons, boolean
+operators and conditional expressions of ints are accepted as well
+"""
+def isIntExpression(node, names):
+    match node:
+        case ast.UnaryOp(ast.Not(), operand):
+            return isIntExpression(operand, names)
+        case ast.Compare(left, _, comparators):
+            return all(isIntExpression(nd, names) for nd in [left] + comparators)
+        case ast.BoolOp(_, values):
+            return all(isIntExpression(nd, names) for nd in values)
+        case ast.IfExp(test, body, orelse):
+            return isIntExpression(test, names) and isIntExpression(body, names) and isIntExpression(orelse, names)
+    return isInt(node, names)
+
+
+"""
+Names whose value may be changed in place in a node: receivers of method
+calls and names whose attributes or items are assigned or deleted
+"""
+def mutatedNames(node):
+    counts = Counter()
+    for nd in ast.walk(node):
+        match nd:
+            case ast.Call(ast.Attribute(value)):
+                base = value
+            case ast.Attribute(value, _, ast.Store() | ast.Del()) | ast.Subscript(value, _, ast.Store() | ast.Del()):
+                base = value
+            case _:
+                continue
+        while isinstance(base, (ast.Attribute, ast.Subscript)):
+            base = base.value
+        if isinstance(base, ast.Name):
+            counts[base.id] += 1
+    return counts
+
+
+"""
+Number of reads of each name in a list of nodes, deletions and augmented
+assignments count as reads
+"""
+def readCounts(nodes):
+    counts = Counter()
+    for node in nodes:
+        if node is None:
+            continue
+        for nd in ast.walk(node):
+            if isinstance(nd, ast.Name) and not isinstance(nd.ctx, ast.Store):
+                counts[nd.id] += 1
+            elif isinstance(nd, ast.AugAssign) and isinstance(nd.target, ast.Name):
+                counts[nd.target.id] += 1
+    return counts
+
+
+"""
+Names that are assigned on every path reaching each loop of a function,
+reading them before the loop cannot fail. Paths leaving a block early
+are not followed, which only makes the sets smaller
+
+@param function: AST node corresponding to function definition
+"""
+class DefiniteAssignment:
+    def __init__(self, function):
+        self.entry = {}
+        args = function.args
+        assigned = set(arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs)
+        for arg in (args.vararg, args.kwarg):
+            if arg is not None:
+                assigned.add(arg.arg)
+        self.assignedBody(function.body, assigned)
+
+    def assignedBody(self, body, assigned):
+        assigned = set(assigned)
+        for node in body:
+            assigned = self.assignedStatement(node, assigned)
+        return assigned
+
+    def assignedStatement(self, node, assigned):
+        match node:
+            case ast.Assign(targets, _, _):
+                for target in targets:
+                    assigned = assigned | self.targetNames(target)
+            case ast.AnnAssign(ast.Name(id), _, value, _) if value is not None:
+                assigned = assigned | {id}
+            case ast.If(_, body, orelse):
+                assigned = self.assignedBody(body, assigned) & self.assignedBody(orelse, assigned)
+            case ast.For(target, _, body, orelse, _):
+                self.entry[node] = set(assigned)
+                self.assignedBody(body, assigned | self.targetNames(target))
+                self.assignedBody(orelse, assigned)
+            case ast.While(_, body, orelse):
+                self.entry[node] = set(assigned)
+                self.assignedBody(body, assigned)
+                self.assignedBody(orelse, assigned)
+            case ast.With(items, body, _):
+                for item in items:
+                    if item.optional_vars is not None:
+                        assigned = assigned | self.targetNames(item.optional_vars)
+                assigned = self.assignedBody(body, assigned)
+            case ast.Try(body, handlers, orelse, finalbody) | ast.TryStar(body, handlers, orelse, finalbody):
+                self.assignedBody(self.assignedBody(body, assigned), orelse)
+                for handler in handlers:
+                    self.assignedBody(handler.body, assigned)
+                assigned = self.assignedBody(finalbody, assigned)
+            case ast.Match(_, cases):
+                for case in cases:
+                    self.assignedBody(case.body, assigned)
+            case ast.FunctionDef(name) | ast.AsyncFunctionDef(name) | ast.ClassDef(name):
+                assigned = assigned | {name}
+            case ast.Import(names) | ast.ImportFrom(_, names, _):
+                assigned = assigned | set(alias.asname or alias.name.split(".")[0] for alias in names)
+            case ast.Delete(targets):
+                for target in targets:
+                    assigned = assigned - self.targetNames(target)
+            case ast.AsyncFor(_, _, body) | ast.AsyncWith(_, body):
+                # Only looked into for the loops they contain
+                self.assignedBody(body, assigned)
+        return assigned
+
+    def targetNames(self, target):
+        return set(nd.id for nd in ast.walk(target) if isinstance(nd, ast.Name))
+
+
+"""
+Rule moving loop-invariant code in front of loops. Loops are handled
+innermost first, so code can move out of several loops.
+
+An assignment at the top of a loop body moves when its value is
+invariant, it is the only store to its variable in the loop, and the
+variable is read only in the loop body after it. Every other invariant
+subexpression with an operator is computed once into a new variable
+before the loop. An expression is invariant when it is built by
+isMovable from variables that are assigned before the loop on every path
+and are not changed in the loop or by nested functions. Operators are
+only moved when evaluating them involves ints alone, a list addition
+would see stale values once the list changes in the loop, and an
+addition of a str and an int would raise in front of a loop that never
+runs
+"""
+class LoopInvariantCodeMotion(RewriteRule):
+    def __init__(self, functionTable, edits=None) -> None:
+        super().__init__(functionTable, edits)
+        self.function = None
+        self.pinned = set()
+        self.assignment = None
+        self.names = set()
+        self.ints = set()
+
+    def startFunction(self, node):
+        self.function = node
+        self.pinned = pinnedNames(node)
+        self.assignment = DefiniteAssignment(node)
+        self.names = set(nd.id for nd in ast.walk(node) if isinstance(nd, ast.Name))
+        self.names |= set(nd.arg for nd in ast.walk(node) if isinstance(nd, ast.arg))
+        bound = set(storeCounts(ast.Module(node.body, []))) | set(nd.arg for nd in ast.walk(node.args) if isinstance(nd, ast.arg))
+        self.ints = intNames(node, bound | set(self.functionTable))
+
+    def finishStatement(self, node):
+        if not isinstance(node, (ast.For, ast.While)) or node not in self.assignment.entry:
+            return node
+        hoisted = self.hoistAssignments(node)
+        hoisted += self.hoistExpressions(node, set(stmt.targets[0].id for stmt in hoisted))
+        if not hoisted:
+            return node
+        for idx, stmt in enumerate(hoisted):
+            # The analysis keys definitions by line, and an entry at the line
+            # of a loop stands for the state at its head. Moved statements get
+            # their own dummy lines between the previous statement and the
+            # loop, after the line a previous block ends at plus 0.5
+            line = node.lineno - 0.5 + (idx + 1) / (2 * (len(hoisted) + 1))
+            for nd in ast.walk(stmt):
+                if "lineno" in nd._attributes:
+                    nd.lineno = nd.end_lineno = line
+        if not node.body:
+            node.body.append(ast.copy_location(ast.Pass(), node))
+        replacement = hoisted + [node]
+        self.record(node, ast.Module(replacement, []))
+        return replacement
+
+    def isInvariant(self, node, stored, assigned):
+        if not isMovable(node):
+            return False
+        if not isinstance(node, (ast.Name, ast.Constant)) and not isIntExpression(node, self.ints):
+            return False
+        for name in namesRead(node):
+            if stored[name] or name not in assigned or name in self.pinned:
+                return False
+        return True
+
+    """
+    Move invariant assignments at the top level of the loop body in front
+    of the loop, returns the moved statements
+    """
+    def hoistAssignments(self, loop):
+        stored = storeCounts(loop) + mutatedNames(loop)
+        assigned = set(self.assignment.entry[loop])
+        reads = readCounts([self.function])
+        inside = readCounts(loop.body + ([loop.test] if isinstance(loop, ast.While) else []))
+        # Names read before a statement of the body in some iteration
+        readBefore = namesRead(loop.test) if isinstance(loop, ast.While) else namesRead(loop.iter)
+        hoisted = []
+        body = []
+        for stmt in loop.body:
+            match stmt:
+                case ast.Assign([ast.Name(id)], value, _) if (
+                        stored[id] == 1 and id not in self.pinned and id not in readBefore
+                        and reads[id] == inside[id] and self.isInvariant(value, stored, assigned)):
+                    hoisted.append(stmt)
+                    stored[id] = 0
+                    assigned.add(id)
+                    continue
+            readBefore |= namesRead(stmt)
+            body.append(stmt)
+        loop.body = body
+        return hoisted
+
+    """
+    Replace invariant subexpressions in the loop with new variables
+    assigned in front of the loop, returns the new assignments
+
+    @param hoistedNames: variables assigned by statements moved in front of the loop
+    """
+    def hoistExpressions(self, loop, hoistedNames):
+        stored = storeCounts(loop) + mutatedNames(loop)
+        assigned = self.assignment.entry[loop] | hoistedNames
+        temps = {}
+        hoisted = []
+
+        def replace(expr):
+            if isinstance(expr, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+                return expr
+            if self.isWorthMoving(expr) and self.isInvariant(expr, stored, assigned):
+                key = ast.dump(expr)
+                if key not in temps:
+                    temps[key] = self.newName()
+                    assign = ast.Assign([ast.Name(temps[key], ast.Store())], expr)
+                    hoisted.append(ast.copy_location(assign, loop))
+                return ast.copy_location(ast.Name(temps[key], ast.Load()), expr)
+            self.rewriteExpressions(expr, replace)
+            return expr
+
+        if isinstance(loop, ast.While):
+            loop.test = replace(loop.test)
+        for stmt in loop.body:
+            self.rewriteExpressions(stmt, replace)
+        return hoisted
+
+    """
+    Apply a function to every expression directly under a node, statements
+    under the node are visited except for nested definitions
+    """
+    def rewriteExpressions(self, node, replace):
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                for idx, item in enumerate(value):
+                    if isinstance(item, ast.expr):
+                        value[idx] = replace(item)
+                    elif isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                        continue
+                    elif isinstance(item, ast.AST):
+                        self.rewriteExpressions(item, replace)
+            elif isinstance(value, ast.expr):
+                setattr(node, field, replace(value))
+            elif isinstance(value, ast.AST):
+                self.rewriteExpressions(value, replace)
+
+    """
+    Only expressions computing something from variables are moved
+    """
+    def isWorthMoving(self, node):
+        if isinstance(node, (ast.Constant, ast.Name)) or hasSideEffects(node):
+            return False
+        return any(isinstance(nd, ast.Name) for nd in ast.walk(node))
+
+    def newName(self):
+        idx = 0
+        while f"_inv{idx}" in self.names:
+            idx += 1
+        self.names.add(f"_inv{idx}")
+        return f"_inv{idx}"
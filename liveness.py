@@ -0,0 +1,215 @@
+import ast
+from passes import RewriteRule, hasSideEffects
+
+
+"""
+Names read in a node, including names read by functions and lambdas
+defined in it
+"""
+def namesRead(node):
+    names = set()
+    if node is None:
+        return names
+    for nd in ast.walk(node):
+        if isinstance(nd, ast.Name) and not isinstance(nd.ctx, ast.Store):
+            names.add(nd.id)
+    return names
+
+
+"""
+Names of a function whose value can be seen or changed from outside its
+body: names used by nested functions and lambdas and names declared
+global or nonlocal
+"""
+def pinnedNames(function):
+    pinned = set()
+    for nd in ast.walk(function):
+        match nd:
+            case ast.FunctionDef() | ast.AsyncFunctionDef() | ast.Lambda() if nd is not function:
+                for child in ast.walk(nd):
+                    if isinstance(child, ast.Name):
+                        pinned.add(child.id)
+            case ast.Global(names) | ast.Nonlocal(names):
+                pinned |= set(names)
+    return pinned
+
+
+"""
+Backward liveness analysis over the statements of a function. Liveness
+is strong: the operands of a store are only live when the stored variable
+is live afterwards, so a store feeding only dead stores is dead as well,
+and cascades of dead stores are found in one computation. Loops are
+iterated until the set of variables live at the loop head is stable.
+
+Like the rest of the analysis, stores to plain names are treated as
+scalar definitions. Stores through subscripts and attributes, names used
+by nested functions and names declared global or nonlocal are always
+kept live. Augmented assignments can change the value of their target in
+place, seen through other names bound to it, so they are always kept and
+read their target
+
+@param function: AST node corresponding to function definition
+"""
+class LivenessAnalysis:
+    def __init__(self, function):
+        self.function = function
+        self.liveOut = {}
+        self.pinned = pinnedNames(function)
+        self.loops = []
+        self.liveBody(function.body, set())
+
+    """
+    Compute the variables live before a list of statements
+
+    @param body: list of statements
+    @param live: variables live after the statements
+    """
+    def liveBody(self, body, live):
+        for node in reversed(body):
+            live = self.liveStatement(node, live)
+        return live
+
+    def liveStatement(self, node, live):
+        self.liveOut[node] = live
+        match node:
+            case ast.Assign(targets, value, _):
+                if self.isDead(node, live):
+                    return live
+                result = set(live)
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        result.discard(target.id)
+                for target in targets:
+                    if not isinstance(target, ast.Name):
+                        result |= namesRead(target)
+                return result | namesRead(value)
+            case ast.AugAssign(target, _, value):
+                return live | namesRead(target) | self.storedNames(target) | namesRead(value)
+            case ast.AnnAssign(target, _, value, _):
+                if value is None:
+                    return live
+                if isinstance(target, ast.Name):
+                    return (live - {target.id}) | namesRead(value)
+                return live | namesRead(target) | namesRead(value)
+            case ast.Return(value):
+                return namesRead(value) | self.pinned
+            case ast.Raise(exc, cause):
+                return namesRead(exc) | namesRead(cause) | self.pinned
+            case ast.Break():
+                return set(self.loops[-1][0]) if self.loops else live
+            case ast.Continue():
+                return set(self.loops[-1][1]) if self.loops else live
+            case ast.If(test, body, orelse):
+                return namesRead(test) | self.liveBody(body, live) | self.liveBody(orelse, live)
+            case ast.For(target, iter, body, orelse, _):
+                exitLive = self.liveBody(orelse, live)
+                targets = self.storedNames(target)
+                head = set(exitLive)
+                while True:
+                    self.loops.append((live, head))
+                    bodyLive = self.liveBody(body, head)
+                    self.loops.pop(-1)
+                    newHead = exitLive | (bodyLive - targets) | (namesRead(target) - targets)
+                    if newHead == head:
+                        break
+                    head = newHead
+                self.liveOut[target] = bodyLive
+                return head | namesRead(iter)
+            case ast.While(test, body, orelse):
+                exitLive = self.liveBody(orelse, live)
+                head = exitLive | namesRead(test)
+                while True:
+                    self.loops.append((live, head))
+                    bodyLive = self.liveBody(body, head)
+                    self.loops.pop(-1)
+                    newHead = head | bodyLive
+                    if newHead == head:
+                        break
+                    head = newHead
+                return head
+            case ast.FunctionDef() | ast.AsyncFunctionDef() | ast.ClassDef():
+                return live - {node.name} | namesRead(node)
+            case ast.Pass():
+                return live
+        # Statements the analysis does not model keep everything they read
+        # live and kill nothing
+        return live | namesRead(node) | self.storedNames(node)
+
+    def storedNames(self, node):
+        names = set()
+        for nd in ast.walk(node):
+            if isinstance(nd, ast.Name) and isinstance(nd.ctx, ast.Store):
+                names.add(nd.id)
+        return names
+
+    """
+    Check whether a plain name is dead at a store with the given live-out set
+    """
+    def isDeadName(self, name, live):
+        return name not in live and name not in self.pinned
+
+    """
+    Check whether a statement stores only to dead names
+    """
+    def isDead(self, node, live):
+        match node:
+            case ast.Assign(targets, value, _):
+                for target in targets:
+                    if not isinstance(target, ast.Name) or not self.isDeadName(target.id, live):
+                        return False
+                return not hasSideEffects(value)
+        return False
+
+    """
+    Targets of an assignment that are dead, the statement itself may still
+    be needed for its other targets or for side effects of its value
+    """
+    def deadTargets(self, node):
+        live = self.liveOut.get(node)
+        if live is None:
+            return []
+        return [target for target in node.targets if isinstance(target, ast.Name) and self.isDeadName(target.id, live)]
+
+    """
+    Check whether the target of a for loop is never read
+    """
+    def isDeadLoopTarget(self, node):
+        live = self.liveOut.get(node.target)
+        return isinstance(node.target, ast.Name) and live is not None and self.isDeadName(node.target.id, live)
+
+
+"""
+Rule removing every dead store found by LivenessAnalysis. Dead stores
+whose value has side effects keep the value as an expression statement
+and dead loop targets are replaced with underscore
+"""
+class DeadStoreElimination(RewriteRule):
+    def __init__(self, functionTable, edits=None) -> None:
+        super().__init__(functionTable, edits)
+        self.liveness = None
+
+    def startFunction(self, node):
+        self.liveness = LivenessAnalysis(node)
+
+    def rewriteStatement(self, node):
+        match node:
+            case ast.For(ast.Name(id), _, _, _, _) if id != "_" and self.liveness.isDeadLoopTarget(node):
+                node.target.id = "_"
+                self.record(node.target, node.target)
+            case ast.Assign():
+                dead = self.liveness.deadTargets(node)
+                if len(dead) == len(node.targets):
+                    return self.removeStore(node)
+                if dead:
+                    node.targets = [target for target in node.targets if target not in dead]
+                    self.record(node, node)
+        return node
+
+    def removeStore(self, node):
+        if hasSideEffects(node.value):
+            expr = ast.Expr(node.value)
+            ast.copy_location(expr, node)
+            self.record(node, expr)
+            return expr
+        self.record(node, None)
+        return None
@@ -0,0 +1,140 @@
+import ast
+import builtins
+from licm import storeCounts
+from liveness import pinnedNames
+from symbols import moduleStores
+
+
+# Builtins that look at the frame calling them or that the compiler treats
+# specially by name, they keep their name
+FRAME_BUILTINS = frozenset(["dir", "eval", "exec", "globals", "locals", "super", "vars"])
+
+
+"""
+Names read in the loops of a statement list, the iterables of for loops
+are evaluated once and do not count. Nested functions are not looked into
+"""
+def loopReads(body, inLoop=False):
+    names = set()
+    for node in body:
+        match node:
+            case ast.FunctionDef() | ast.AsyncFunctionDef() | ast.ClassDef():
+                continue
+            case ast.For(target, iter, body, orelse) | ast.AsyncFor(target, iter, body, orelse):
+                names |= loopReads([ast.Expr(target), ast.Expr(iter)], inLoop)
+                names |= loopReads(body, True)
+                names |= loopReads(orelse, inLoop)
+                continue
+            case ast.While(test, body, orelse):
+                names |= loopReads([ast.Expr(test)] + body, True)
+                names |= loopReads(orelse, inLoop)
+                continue
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.stmt):
+                names |= loopReads([child], inLoop)
+            elif isinstance(child, (ast.excepthandler, ast.match_case)):
+                names |= loopReads(child.body, inLoop)
+            elif inLoop:
+                names |= set(nd.id for nd in ast.walk(child) if isinstance(nd, ast.Name) and isinstance(nd.ctx, ast.Load))
+    return names
+
+
+"""
+Bind the builtins and functions of the module that the top-level
+functions of a tree read in their loops to local variables at the start
+of the functions, so the loops load them from fast locals instead of
+looking them up in the module and the builtins on every iteration.
+
+A name is localized when the function neither binds it nor declares it
+global or nonlocal, it is not used by nested functions, nothing in the
+module declares it global, and it is either a builtin the module does not
+bind or a function of the table bound only by its definition at the top
+level of the module in front of the function. A function defined after
+it may not be bound yet when the function is called while the module is
+imported, and the binding at its start would raise where a loop that
+never runs reads nothing. Every read of the name in the function is replaced
+by a new variable such as _len, assigned at the start of the function
+after the docstring. Like memoizePureFunctions, this runs after the other
+passes, which recognize builtins by name. Returns the changed function
+definitions
+
+@param tree: module to transform, modified in place
+@param functionTable: mapping from function names to definitions
+@param edits: if given, the changed functions are recorded in it, see recordEdit
+"""
+def localizeGlobals(tree, functionTable, edits=None):
+    stores = moduleStores(tree)
+    declared = set(name for nd in ast.walk(tree) if isinstance(nd, ast.Global) for name in nd.names)
+    changed = []
+    for node in tree.body:
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        args = node.args
+        bound = set(storeCounts(ast.Module(node.body, [])))
+        bound |= set(arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs)
+        bound |= set(arg.arg for arg in (args.vararg, args.kwarg) if arg is not None)
+        bound |= pinnedNames(node)
+        localized = []
+        for name in sorted(loopReads(node.body)):
+            if name in bound or name in declared or name.startswith("__") or name in FRAME_BUILTINS:
+                continue
+            isFunction = name in functionTable and functionTable[name] in tree.body and stores[name] == 1 \
+                and tree.body.index(functionTable[name]) < tree.body.index(node)
+            isBuiltin = hasattr(builtins, name) and not stores[name]
+            if isFunction or isBuiltin:
+                localized.append(name)
+        if not localized:
+            continue
+
+        names = set(nd.id for nd in ast.walk(node) if isinstance(nd, ast.Name)) | bound | set(stores)
+        renamed = {}
+        for name in localized:
+            renamed[name] = newName(name, names)
+        renameReads(node.body, renamed)
+
+        start = 0
+        if node.body and isinstance(node.body[0], ast.Expr) and isinstance(node.body[0].value, ast.Constant) \
+                and isinstance(node.body[0].value.value, str):
+            start = 1
+        first = node.body[start] if start < len(node.body) else node.body[-1]
+        bindings = []
+        for idx, name in enumerate(localized):
+            binding = ast.Assign([ast.Name(renamed[name], ast.Store())], ast.Name(name, ast.Load()))
+            # Same dummy lines as statements moved in front of a loop
+            line = first.lineno - 0.5 + (idx + 1) / (2 * (len(localized) + 1))
+            for nd in ast.walk(binding):
+                nd.lineno = nd.end_lineno = line
+                nd.col_offset = nd.end_col_offset = 0
+            bindings.append(binding)
+        node.body[start:start] = bindings
+        if edits is not None and node not in edits:
+            # A function memoized before is written with its new body
+            edits[node] = node
+        changed.append(node)
+    return changed
+
+
+"""
+Replace the reads of names by other names in a statement list, nested
+functions and classes are not looked into
+"""
+def renameReads(body, renamed):
+    stack = list(body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            continue
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id in renamed:
+            node.id = renamed[node.id]
+        stack += ast.iter_child_nodes(node)
+
+
+def newName(name, names):
+    base = f"_{name}"
+    idx = 0
+    result = base
+    while result in names:
+        idx += 1
+        result = f"{base}{idx}"
+    names.add(result)
+    return result
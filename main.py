@@ -1,14 +1,108 @@
+import argparse
 import sys
 from analysis import runInteractive
-from transform import transformLoop
+from transform import transformLoop, TransformOptions
+from watch import watchTransform
+from patch import transformPatch
+from closure import printDependencyMatrix
+from stream import transformStreaming
+from repoindex import runRepositoryIndex
+from modules import ModuleLoader
+from analysis import AnalysisBudget
+from harness import compareTransformed
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Arguments invalid")
-        exit()
-    filePath = sys.argv[1]
-    modeOfOperation = sys.argv[2]
-    if modeOfOperation == '0':
-        runInteractive(filePath)
-    elif modeOfOperation == '1':
-        transformLoop(filePath)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filePath", help="path to the file to examine, transform, or the directory to index")
+    parser.add_argument("modeOfOperation", choices=["0", "1", "2", "3"],
+                        help="0: analyze, 1: apply optimizations, 2: index a directory and query the index, "
+                             "3: check that optimized functions return the same results and time them")
+    parser.add_argument("--demand", action="store_true",
+                        help="mode 0: analyze only the statements the queried variable depends on")
+    parser.add_argument("--lazy", action="store_true",
+                        help="mode 0: parse functions only when the analysis needs them")
+    parser.add_argument("--matrix", action="store_true",
+                        help="mode 0: print the dependencies of every variable in every function at once")
+    parser.add_argument("--patch", action="store_true",
+                        help="mode 1: print the original file with only the transformed parts changed")
+    parser.add_argument("--diff", action="store_true",
+                        help="mode 1: print a unified diff of the transformation")
+    parser.add_argument("--write", action="store_true",
+                        help="mode 1: write the transformed file back in place, changing only the transformed parts")
+    parser.add_argument("--liveness", action="store_true",
+                        help="modes 1 and 3: remove dead stores with a single backward liveness pass")
+    parser.add_argument("--branches", action="store_true",
+                        help="modes 1 and 3: remove branches that constant tests never take")
+    parser.add_argument("--inline", type=int, metavar="NODES",
+                        help="modes 1 and 3: inline calls of straight-line functions whose body has at most this many nodes")
+    parser.add_argument("--tail-calls", action="store_true",
+                        help="modes 1 and 3: turn functions returning calls of themselves into loops")
+    parser.add_argument("--localize", action="store_true",
+                        help="modes 1 and 3: bind builtins and functions read in loops to local variables")
+    parser.add_argument("--comprehensions", action="store_true",
+                        help="modes 1 and 3: rewrite loops filling empty lists, sets and dicts into comprehensions")
+    parser.add_argument("--peephole", action="store_true",
+                        help="modes 1 and 3: simplify arithmetic and turn products of loop variables into additions")
+    parser.add_argument("--licm", action="store_true",
+                        help="modes 1 and 3: move loop-invariant assignments and expressions in front of loops")
+    parser.add_argument("--cse", action="store_true",
+                        help="modes 1 and 3: compute repeated expressions once")
+    parser.add_argument("--unroll", type=int, metavar="STATEMENTS",
+                        help="modes 1 and 3: unroll for loops over constant ranges whose copies have at most this many statements")
+    parser.add_argument("--memoize", type=int, metavar="ENTRIES",
+                        help="modes 1 and 3: cache the results of pure functions, keeping at most this many per function")
+    parser.add_argument("--stream", action="store_true",
+                        help="mode 1: transform one top-level statement at a time to keep memory use flat")
+    parser.add_argument("--watch", action="store_true",
+                        help="mode 1: keep running and print new results whenever the file changes")
+    parser.add_argument("--interval", type=float, default=0.5,
+                        help="seconds between checks of the file in watch mode")
+    parser.add_argument("--source-root", dest="sourceRoot",
+                        help="modes 0, 1 and 3: directory imports are resolved against, calls to functions "
+                             "imported from modules under it use summaries of the functions")
+    parser.add_argument("--time-budget", dest="timeBudget", type=float,
+                        help="modes 1, 2 and 3: seconds the analysis of a single function may take")
+    parser.add_argument("--iteration-budget", dest="iterationBudget", type=int,
+                        help="modes 1, 2 and 3: loop fixpoint iterations the analysis of a single function may take")
+    parser.add_argument("--table-budget", dest="tableBudget", type=int,
+                        help="modes 1, 2 and 3: definitions and dependencies the analysis of a single function may keep")
+    parser.add_argument("--inputs", help="mode 3: file with a dict literal mapping function names to lists of argument sets")
+    parser.add_argument("--samples", type=int, default=20,
+                        help="mode 3: argument sets generated for each function not in the inputs file")
+    parser.add_argument("--db", help="mode 2: database file, .dataflow.sqlite in the directory by default")
+    parser.add_argument("--query", choices=["dead-stores", "unused", "no-return-effect", "return-feeds", "dependencies", "errors"],
+                        help="mode 2: query to answer after updating the index")
+    parser.add_argument("--function", help="mode 2: function for the return-feeds and dependencies queries")
+    parser.add_argument("--variable", help="mode 2: variable for the dependencies query")
+    args = parser.parse_args()
+    if (args.stream or args.watch) and args.memoize is not None:
+        # Purity and the functools import are decided for the whole module
+        parser.error("--memoize cannot be used with --stream or --watch")
+    if (args.stream or args.watch) and args.localize:
+        # So are the names the module binds or declares global
+        parser.error("--localize cannot be used with --stream or --watch")
+    budget = None
+    if args.timeBudget is not None or args.iterationBudget is not None or args.tableBudget is not None:
+        budget = AnalysisBudget(args.timeBudget, args.iterationBudget, args.tableBudget)
+    if args.modeOfOperation == '0' and args.matrix:
+        printDependencyMatrix(args.filePath, args.sourceRoot)
+    elif args.modeOfOperation == '0':
+        runInteractive(args.filePath, args.demand, args.lazy, args.sourceRoot)
+    elif args.modeOfOperation in ('1', '3'):
+        loader = ModuleLoader(args.sourceRoot, budget) if args.sourceRoot is not None else None
+        options = TransformOptions(args.liveness, loader, budget, args.licm, args.cse, args.unroll, args.memoize, args.branches,
+                                   args.inline, args.tail_calls, args.localize,
+                                   args.comprehensions, args.peephole)
+        if args.modeOfOperation == '3':
+            if compareTransformed(args.filePath, options, args.inputs, args.samples):
+                sys.exit(1)
+        elif args.watch:
+            watchTransform(args.filePath, args.interval, options)
+        elif args.stream:
+            transformStreaming(args.filePath, options)
+        elif args.patch or args.diff or args.write:
+            transformPatch(args.filePath, args.diff, args.write, options)
+        else:
+            transformLoop(args.filePath, options)
+    elif args.modeOfOperation == '2':
+        runRepositoryIndex(args.filePath, args.db, args.query, args.function, args.variable, budget)
@@ -0,0 +1,253 @@
+import ast
+import os
+from analysis import Analysis
+from closure import DependencyMatrix
+from symbols import ModuleIndex
+
+
+"""
+Which arguments of a function can flow to its returned value
+
+@param params: names of the positional parameters, in order
+@param flowing: names of the parameters the returned value depends on
+@param vararg: name of the *args parameter, None if there is none
+@param kwarg: name of the **kwargs parameter, None if there is none
+"""
+class FunctionSummary:
+    def __init__(self, params, flowing, vararg=None, kwarg=None):
+        self.params = params
+        self.flowing = flowing
+        self.vararg = vararg
+        self.kwarg = kwarg
+
+    """
+    Check whether the positional argument at the given index flows to the result
+    """
+    def positionalFlows(self, idx):
+        if idx < len(self.params):
+            return self.params[idx] in self.flowing
+        return self.vararg is None or self.vararg in self.flowing
+
+    """
+    Check whether the keyword argument with the given name flows to the
+    result, None stands for **mapping arguments
+    """
+    def keywordFlows(self, name):
+        if name is not None and name in self.params:
+            return name in self.flowing
+        return self.kwarg is None or self.kwarg in self.flowing
+
+
+# Summary of imported functions that cannot be analyzed, every argument
+# may flow to the returned value
+UNKNOWN_FUNCTION = FunctionSummary([], {"args", "kwargs"}, "args", "kwargs")
+
+
+"""
+Module found under the source root, parsed and indexed when first needed
+
+@param loader: ModuleLoader the module belongs to
+@param name: dotted module name
+@param path: path of the source file
+"""
+class LoadedModule:
+    def __init__(self, loader, name, path):
+        file = open(path, "r")
+        tree = ast.parse(file.read())
+        file.close()
+        self.name = name
+        self.index = ModuleIndex(tree)
+        self.scope = ModuleScope(loader, name, os.path.basename(path) == "__init__.py")
+        self.scope.addImports(tree.body)
+
+
+"""
+Resolves imports against a local source root. Modules are parsed the
+first time a function defined in them is called, and the summary of each
+function is computed once and shared by every module importing it
+
+@param sourceRoot: directory module names are resolved against
+@param budget: AnalysisBudget of each summarized function, None for no limits
+"""
+class ModuleLoader:
+    def __init__(self, sourceRoot, budget=None):
+        self.sourceRoot = sourceRoot
+        self.budget = budget
+        self.modules = {}
+        self.summaries = {}
+
+    """
+    Path of the source file of a module, None when the module is not under
+    the source root, for example standard library modules
+    """
+    def modulePath(self, moduleName):
+        base = os.path.join(self.sourceRoot, *moduleName.split("."))
+        if os.path.isfile(base + ".py"):
+            return base + ".py"
+        if os.path.isfile(os.path.join(base, "__init__.py")):
+            return os.path.join(base, "__init__.py")
+        return None
+
+    def load(self, moduleName):
+        if moduleName not in self.modules:
+            path = self.modulePath(moduleName)
+            self.modules[moduleName] = None if path is None else LoadedModule(self, moduleName, path)
+        return self.modules[moduleName]
+
+    """
+    Dotted name of the module in the given file, None when the file is
+    not under the source root
+    """
+    def moduleName(self, filePath):
+        relative = os.path.relpath(os.path.abspath(filePath), os.path.abspath(self.sourceRoot))
+        if relative.startswith(".."):
+            return None
+        parts = relative[:-len(".py")].split(os.sep)
+        if parts[-1] == "__init__":
+            parts.pop(-1)
+        return ".".join(parts)
+
+    """
+    Summary of a function defined in a module under the source root, None
+    when the function cannot be found or analyzed. Only top-level functions
+    the module binds once are summarized, a method or a name bound to
+    another value gets None. Functions a package imports are found through
+    the package. While a summary is computed, recursive requests for it get None
+    """
+    def summary(self, moduleName, functionName):
+        key = (moduleName, functionName)
+        if key in self.summaries:
+            return self.summaries[key]
+        self.summaries[key] = None
+        module = self.load(moduleName)
+        if module is None:
+            return None
+        if functionName not in module.index.moduleFunctions:
+            if functionName in module.scope.functions and module.index.moduleStores[functionName] == 1:
+                self.summaries[key] = self.summary(*module.scope.functions[functionName])
+            return self.summaries[key]
+        # A new analysis for each summary, summaries of other functions
+        # of the module can be needed while this one is computed
+        analysis = Analysis(module.index.functionTable, module.scope, self.budget)
+        function = module.index.moduleFunctions[functionName]
+        try:
+            referenceTable = analysis.processFunction(function, [])[0]
+        except Exception:
+            # Calls of functions that cannot be analyzed keep the conservative handling
+            return None
+        flowing = set(DependencyMatrix(referenceTable, module.index.functionTable).dependencies('return'))
+        args = function.args
+        params = [arg.arg for arg in args.posonlyargs + args.args]
+        self.summaries[key] = FunctionSummary(params, flowing,
+                                              args.vararg.arg if args.vararg else None,
+                                              args.kwarg.arg if args.kwarg else None)
+        return self.summaries[key]
+
+
+"""
+Names a module binds through its imports, used to find the summary of
+the function a call refers to
+
+@param loader: ModuleLoader resolving the imported modules
+@param moduleName: dotted name of the module, None if it is not under the source root
+@param isPackage: whether the module is the __init__ of a package
+"""
+class ModuleScope:
+    def __init__(self, loader, moduleName, isPackage=False):
+        self.loader = loader
+        self.moduleName = moduleName
+        self.isPackage = isPackage
+        self.modules = {}
+        self.functions = {}
+
+    """
+    Record the bindings of the import statements in a statement list
+    """
+    def addImports(self, body):
+        for node in body:
+            match node:
+                case ast.Import(names):
+                    for alias in names:
+                        if alias.asname is not None:
+                            self.modules[alias.asname] = alias.name
+                        else:
+                            top = alias.name.split(".")[0]
+                            self.modules[top] = top
+                case ast.ImportFrom(module, names, level):
+                    base = self.resolveRelative(module, level)
+                    if base is None:
+                        continue
+                    for alias in names:
+                        bound = alias.asname or alias.name
+                        submodule = base + "." + alias.name if base else alias.name
+                        if self.loader.modulePath(submodule) is not None:
+                            self.modules[bound] = submodule
+                        else:
+                            self.functions[bound] = (base, alias.name)
+
+    """
+    Absolute name of the module of a from-import
+    """
+    def resolveRelative(self, module, level):
+        if level == 0:
+            return module
+        if self.moduleName is None:
+            return None
+        parts = self.moduleName.split(".") if self.moduleName else []
+        if not self.isPackage:
+            parts = parts[:-1]
+        if level - 1 > len(parts):
+            return None
+        parts = parts[:len(parts) - (level - 1)]
+        if module:
+            parts.append(module)
+        return ".".join(parts)
+
+    """
+    Summary of the imported function a call expression refers to, None
+    for calls to anything else. Imported functions without a summary, such
+    as functions of modules outside the source root, get UNKNOWN_FUNCTION
+    """
+    def summaryFor(self, func):
+        summary = None
+        match func:
+            case ast.Name(id, _):
+                if id not in self.functions:
+                    return None
+                summary = self.loader.summary(*self.functions[id])
+            case ast.Attribute(value, attr, _):
+                moduleName = self.attributeModule(value)
+                if moduleName is None:
+                    return None
+                summary = self.loader.summary(moduleName, attr)
+            case _:
+                return None
+        return summary if summary is not None else UNKNOWN_FUNCTION
+
+    """
+    Module an expression such as pkg.mod refers to, None if it is not an imported module
+    """
+    def attributeModule(self, node):
+        match node:
+            case ast.Name(id, _):
+                return self.modules.get(id)
+            case ast.Attribute(value, attr, _):
+                base = self.attributeModule(value)
+                if base is not None:
+                    return base + "." + attr
+        return None
+
+
+"""
+Scope of the imports of a file for the given loader
+
+@param loader: ModuleLoader, None when imports are not resolved
+@param filePath: path of the file
+@param body: top-level statements of the file
+"""
+def moduleScopeFor(loader, filePath, body):
+    if loader is None:
+        return None
+    scope = ModuleScope(loader, loader.moduleName(filePath), os.path.basename(filePath) == "__init__.py")
+    scope.addImports(body)
+    return scope
@@ -0,0 +1,212 @@
+import ast
+from analysis import BudgetExceeded
+
+
+"""
+Check whether evaluating an expression can have side effects. Calls,
+await, yield and assignment expressions are assumed to have them
+"""
+def hasSideEffects(node):
+    for nd in ast.walk(node):
+        if isinstance(nd, (ast.Call, ast.Await, ast.Yield, ast.YieldFrom, ast.NamedExpr)):
+            return True
+    return False
+
+
+"""
+Rewrite rule run by PassManager. In a pass every statement of a function
+is offered to the rules of the pass in order before its children are
+visited, then every name in the statement, and once its children are
+done the statement is offered again through finishStatement. A rule
+returns the node to keep, a replacement, or None to delete the statement.
+A statement can also be replaced by a list of statements, the rules after
+it in the pass do not see the list
+Rules of one pass see the function as it was when the pass started, so a
+rule that needs the results of another rule belongs to a later pass
+
+@param functionTable: mapping from function names to definitions
+@param edits: if given, replaced and deleted nodes are recorded in it, see recordEdit
+"""
+class RewriteRule:
+    def __init__(self, functionTable, edits=None):
+        self.functionTable = functionTable
+        self.edits = edits
+        self.changed = False
+
+    """
+    Called before the statements of a function are visited, analyses the
+    rule depends on are computed here
+    """
+    def startFunction(self, node):
+        pass
+
+    def rewriteStatement(self, node):
+        return node
+
+    def rewriteName(self, node):
+        return node
+
+    def finishStatement(self, node):
+        return node
+
+    def record(self, node, replacement):
+        self.changed = True
+        if self.edits is not None:
+            self.edits[node] = replacement
+
+
+"""
+Removes blocks emptied by other rules. An if statement with both branches
+empty is dropped when its test has no side effects, every other emptied
+body gets a pass statement. Loops are kept, iterating may have effects
+and the loop variable stays bound after the loop
+"""
+class BlockCleanup(RewriteRule):
+    def finishStatement(self, node):
+        if isinstance(node, ast.If) and not node.body and not node.orelse and not hasSideEffects(node.test):
+            self.record(node, None)
+            return None
+        emptied = False
+        if getattr(node, "body", None) == []:
+            node.body.append(ast.Pass())
+            emptied = True
+        for handler in getattr(node, "handlers", []):
+            if not handler.body:
+                handler.body.append(ast.Pass())
+                emptied = True
+        if isinstance(node, ast.Try) and not node.handlers and not node.finalbody:
+            node.finalbody.append(ast.Pass())
+            emptied = True
+        if emptied:
+            self.record(node, node)
+        return node
+
+
+"""
+Passes run on a function only when a rule of an earlier pass changed it,
+so the analyses of these passes are only computed again for the
+functions the rule simplified
+
+@param trigger: RewriteRule whose changes make the passes run
+@param passes: list of passes, each a list of RewriteRule
+"""
+class Rerun:
+    def __init__(self, trigger, passes):
+        self.trigger = trigger
+        self.passes = passes
+
+
+"""
+Runs rewrite rules over the functions of a tree. The passes are an
+ordered list of rule lists, each pass visits the statements of a function
+once and offers them to its rules in order. Functions are processed one at
+a time, all passes run on a function before the next one is visited.
+Nested functions are processed after the function containing them, with
+their own analyses
+
+@param functionTable: mapping from function names to definitions
+@param passes: list of passes, each a list of RewriteRule or a Rerun
+"""
+class PassManager:
+    def __init__(self, functionTable, passes):
+        self.functionTable = functionTable
+        self.passes = passes
+        self.changedFunctions = set()
+        self.degraded = {}
+
+    def run(self, tree):
+        for node in self.functionsIn(tree.body):
+            self.runFunction(node)
+        return tree
+
+    """
+    Function definitions in a statement list, not looking inside functions
+    """
+    def functionsIn(self, body):
+        for node in body:
+            if isinstance(node, ast.FunctionDef):
+                yield node
+                continue
+            if isinstance(node, ast.AsyncFunctionDef):
+                continue
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, ast.stmt):
+                    yield from self.functionsIn([child])
+                elif isinstance(child, (ast.excepthandler, ast.match_case)):
+                    yield from self.functionsIn(child.body)
+
+    def runFunction(self, node):
+        # Functions that are not the definition the table knows under their
+        # name are shadowed, their analysis results would belong to another node
+        if node.name in self.functionTable and self.functionTable[node.name] is node:
+            try:
+                self.runPasses(node, self.passes)
+            except BudgetExceeded as e:
+                # Passes that already ran are sound on their own, the
+                # remaining ones are skipped for this function
+                self.degraded[node.name] = str(e)
+        for nested in self.functionsIn(node.body):
+            self.runFunction(nested)
+
+    def runPasses(self, node, passes):
+        for rules in passes:
+            if isinstance(rules, Rerun):
+                if rules.trigger.changed:
+                    self.runPasses(node, rules.passes)
+                continue
+            for rule in rules:
+                rule.changed = False
+                rule.startFunction(node)
+            node.body = self.rewriteBody(rules, node.body)
+            if any(rule.changed for rule in rules):
+                self.changedFunctions.add(node)
+
+    def rewriteBody(self, rules, body):
+        result = []
+        for stmt in body:
+            stmt = self.rewriteStatement(rules, stmt)
+            if isinstance(stmt, list):
+                result += stmt
+            elif stmt is not None:
+                result.append(stmt)
+        return result
+
+    def rewriteStatement(self, rules, stmt):
+        for rule in rules:
+            stmt = rule.rewriteStatement(stmt)
+            if stmt is None or isinstance(stmt, list):
+                return stmt
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            return stmt
+        self.rewriteFields(rules, stmt)
+        for rule in rules:
+            stmt = rule.finishStatement(stmt)
+            if stmt is None or isinstance(stmt, list):
+                return stmt
+        return stmt
+
+    """
+    Visit the children of a node, statement lists are rewritten with
+    rewriteBody and names are offered to rewriteName
+    """
+    def rewriteFields(self, rules, node):
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                if value and isinstance(value[0], ast.stmt):
+                    setattr(node, field, self.rewriteBody(rules, value))
+                else:
+                    for idx, item in enumerate(value):
+                        if isinstance(item, ast.AST):
+                            value[idx] = self.rewriteNode(rules, item)
+            elif isinstance(value, ast.AST):
+                setattr(node, field, self.rewriteNode(rules, value))
+
+    def rewriteNode(self, rules, node):
+        if isinstance(node, ast.Name):
+            for rule in rules:
+                node = rule.rewriteName(node)
+                if not isinstance(node, ast.Name):
+                    break
+            return node
+        self.rewriteFields(rules, node)
+        return node
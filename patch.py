@@ -0,0 +1,175 @@
+import ast
+import difflib
+import sys
+from contextlib import redirect_stdout
+from symbols import ModuleIndex
+from transform import transformTree, collectUnimportantVariables, printUnimportantVariables, printDegradedFunctions
+
+
+"""
+Applies the edits recorded while transforming a tree to the original
+source text. Comments and formatting outside the edited spans are kept.
+Every top-level statement containing an edit is parsed again after the
+edits are applied and compared with the transformed tree, when they do
+not match, for example when a substituted constant needs parentheses, or
+when a deleted statement shares its line with another one, the statement
+is replaced by its unparsed text instead. A top-level statement replaced
+by several statements is written with the statements added in front of it
+
+@param source: original source text
+@param tree: transformed tree of the source
+@param edits: mapping from original nodes to their replacement, see recordEdit
+"""
+class SourcePatcher:
+    def __init__(self, source, tree, edits):
+        self.source = source
+        self.tree = tree
+        self.edits = edits
+        self.lines = source.encode("utf-8").splitlines(keepends=True)
+        # Top-level statements added by edits have no text in the source
+        added = set()
+        for node, replacement in edits.items():
+            if isinstance(replacement, ast.Module):
+                added.update(stmt for stmt in replacement.body if stmt is not node)
+        self.units = [node for node in tree.body if node not in added]
+
+    def span(self, node):
+        return (node.lineno, node.col_offset, node.end_lineno, node.end_col_offset)
+
+    """
+    First line of a top-level statement, including its decorators
+    """
+    def unitStart(self, node):
+        start = node.lineno
+        for decorator in getattr(node, "decorator_list", []):
+            start = min(start, decorator.lineno)
+        return start
+
+    """
+    Assign each edit to the top-level statement containing it, edits inside
+    the span of another edit are dropped since the outer one covers them
+    """
+    def groupEdits(self):
+        spans = sorted(((self.span(node), node) for node in self.edits), key=lambda x: (x[0][0], x[0][1], -x[0][2], -x[0][3]))
+        kept = []
+        for span, node in spans:
+            if kept and (span[2], span[3]) <= (kept[-1][0][2], kept[-1][0][3]):
+                continue
+            kept.append((span, node))
+
+        groups = {}
+        units = self.units
+        idx = 0
+        for span, node in kept:
+            while idx < len(units) and units[idx].end_lineno < span[0]:
+                idx += 1
+            if idx < len(units):
+                groups.setdefault(idx, []).append((span, node))
+        return groups
+
+    """
+    Apply the edits of one top-level statement to its lines. Returns the
+    new lines, None when an edit cannot be expressed as a text change
+    """
+    def patchUnit(self, unit, edits):
+        start = self.unitStart(unit)
+        lines = self.lines[start - 1:unit.end_lineno]
+        for span, node in reversed(edits):
+            first = span[0] - start
+            last = span[2] - start
+            prefix = lines[first][:span[1]]
+            suffix = lines[last][span[3]:]
+            replacement = self.edits[node]
+            if replacement is None:
+                if prefix.strip() or (suffix.strip() and not suffix.strip().startswith(b"#")):
+                    return None
+                del lines[first:last + 1]
+            else:
+                text = ast.unparse(replacement).encode("utf-8")
+                if b"\n" in text:
+                    # Compound statements continue at the indentation of their first line
+                    if prefix.strip():
+                        return None
+                    text = text.replace(b"\n", b"\n" + prefix)
+                lines[first:last + 1] = [prefix + text + suffix]
+        return lines
+
+    """
+    Transformed statements a top-level statement of the source became
+    """
+    def expected(self, unit):
+        replacement = self.edits.get(unit)
+        if isinstance(replacement, ast.Module):
+            return replacement.body
+        return [unit]
+
+    """
+    Check that the patched text of a statement parses to the transformed statements
+    """
+    def matches(self, unit, lines):
+        try:
+            patched = ast.parse(b"".join(lines).decode("utf-8"))
+        except SyntaxError:
+            return False
+        expected = self.expected(unit)
+        return len(patched.body) == len(expected) and all(ast.dump(patched.body[idx]) == ast.dump(expected[idx])
+                                                           for idx in range(len(expected)))
+
+    """
+    Return the patched source text
+    """
+    def patch(self):
+        result = []
+        position = 0
+        units = self.units
+        for idx, edits in sorted(self.groupEdits().items()):
+            unit = units[idx]
+            start = self.unitStart(unit)
+            lines = self.patchUnit(unit, edits)
+            if lines is None or not self.matches(unit, lines):
+                lines = [(ast.unparse(ast.Module(self.expected(unit), [])) + "\n").encode("utf-8")]
+            result += self.lines[position:start - 1]
+            result += lines
+            position = unit.end_lineno
+        result += self.lines[position:]
+        return b"".join(result).decode("utf-8")
+
+
+"""
+Transform the file and print the original source with only the
+transformed spans changed, or a unified diff of the change
+
+@param filePath: file path to the tested program
+@param diff: print a unified diff instead of the patched file
+@param write: write the patched source back to the file
+@param options: TransformOptions, defaults are used when None
+"""
+def transformPatch(filePath, diff=False, write=False, options=None):
+    file = open(filePath, "r")
+    source = file.read()
+    file.close()
+
+    tree = ast.parse(source)
+    index = ModuleIndex(tree)
+    edits = {}
+    modules = options.moduleScope(filePath, tree.body) if options is not None else None
+    budget = options.budget if options is not None else None
+    degraded = {}
+    tree = transformTree(tree, index, edits, options, modules=modules, degraded=degraded)
+
+    # Keep the report out of the patch so the output can be applied as is
+    with redirect_stdout(sys.stderr):
+        printUnimportantVariables(collectUnimportantVariables(index.functionTable, index.functionTable, modules, budget, degraded))
+        printDegradedFunctions(degraded)
+
+    patched = SourcePatcher(source, tree, edits).patch() if edits else source
+    if write:
+        if patched != source:
+            file = open(filePath, "w")
+            file.write(patched)
+            file.close()
+    elif diff:
+        sys.stdout.writelines(difflib.unified_diff(source.splitlines(keepends=True), patched.splitlines(keepends=True),
+                                                   filePath, filePath))
+    else:
+        sys.stdout.write(patched)
@@ -0,0 +1,182 @@
+import ast
+from licm import storeCounts, isIntConstant, isInt, intNames
+from liveness import pinnedNames
+from passes import RewriteRule
+
+
+"""
+Rule simplifying arithmetic. Squares of names known to hold ints are
+computed as products, x ** 2 becomes x * x, and additions and
+multiplications by 0 and 1 are dropped when the other operand is known to
+be an int, float and bool operands would change value or type, and a
+float square can overflow where its product gives inf. A product with 0
+is only replaced by 0 when the other operand is a name or a constant,
+evaluating an expression such as a // b can raise. In for loops over range with a
+constant step, a product of the loop variable and a constant evaluated
+at least twice in the body is replaced by a variable increased by the
+step times the constant at the start of each iteration, one addition in
+place of several multiplications. The rule runs after constant
+propagation, which turns variables into the constants it looks for. The
+running variables get dummy lines like moved statements of
+LoopInvariantCodeMotion
+"""
+class ArithmeticPeephole(RewriteRule):
+    def __init__(self, functionTable, edits=None) -> None:
+        super().__init__(functionTable, edits)
+        self.bound = set()
+        self.names = set()
+        self.ints = set()
+        self.pinned = set()
+
+    def startFunction(self, node):
+        args = node.args
+        self.bound = set(storeCounts(ast.Module(node.body, [])))
+        self.bound |= set(arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs)
+        self.bound |= set(arg.arg for arg in (args.vararg, args.kwarg) if arg is not None)
+        self.bound |= set(self.functionTable)
+        self.names = set(nd.id for nd in ast.walk(node) if isinstance(nd, ast.Name)) | self.bound
+        self.ints = intNames(node, self.bound)
+        self.pinned = pinnedNames(node)
+
+    def finishStatement(self, node):
+        self.rewriteExpressions(node)
+        if isinstance(node, ast.For):
+            return self.reduceProducts(node)
+        return node
+
+    """
+    Simplify the expressions of a statement, statements in it were handled before
+    """
+    def rewriteExpressions(self, node):
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                for idx, item in enumerate(value):
+                    if isinstance(item, ast.expr):
+                        value[idx] = self.rewriteExpression(item)
+                    elif isinstance(item, (ast.keyword, ast.comprehension, ast.arguments, ast.withitem, ast.match_case)):
+                        self.rewriteExpressions(item)
+            elif isinstance(value, ast.expr):
+                setattr(node, field, self.rewriteExpression(value))
+
+    def rewriteExpression(self, node):
+        if isinstance(node, ast.Lambda):
+            return node
+        self.rewriteExpressions(node)
+        if not isinstance(node, ast.BinOp):
+            return node
+        left, op, right = node.left, node.op, node.right
+        replacement = node
+        match op:
+            case ast.Pow() if isinstance(left, ast.Name) and isIntConstant(right, 2) and isInt(left, self.ints):
+                replacement = ast.BinOp(left, ast.Mult(), ast.copy_location(ast.Name(left.id, ast.Load()), left))
+            case ast.Add() | ast.Sub() if isIntConstant(right, 0) and isInt(left, self.ints):
+                replacement = left
+            case ast.Add() if isIntConstant(left, 0) and isInt(right, self.ints):
+                replacement = right
+            case ast.Mult() | ast.FloorDiv() if isIntConstant(right, 1) and isInt(left, self.ints):
+                replacement = left
+            case ast.Mult() if isIntConstant(left, 1) and isInt(right, self.ints):
+                replacement = right
+            case ast.Mult() if (isIntConstant(right, 0) and isinstance(left, (ast.Name, ast.Constant)) and isInt(left, self.ints)) or \
+                               (isIntConstant(left, 0) and isinstance(right, (ast.Name, ast.Constant)) and isInt(right, self.ints)):
+                replacement = ast.Constant(0)
+        if replacement is node:
+            return node
+        if not hasattr(replacement, "lineno"):
+            ast.copy_location(replacement, node)
+        self.record(node, replacement)
+        return replacement
+
+    """
+    Replace the products of the variable of a for loop over range and a
+    constant evaluated at least twice in the body by running variables
+    """
+    def reduceProducts(self, node):
+        match node:
+            case ast.For(ast.Name(var), ast.Call(ast.Name("range"), args, []), body, _) if "range" not in self.bound and 1 <= len(args) <= 3:
+                pass
+            case _:
+                return node
+        start = args[0] if len(args) > 1 else ast.Constant(0)
+        step = args[2].value if len(args) == 3 and isIntConstant(args[2]) else (1 if len(args) < 3 else None)
+        if not step or not isinstance(start, (ast.Name, ast.Constant)) or not isInt(start, self.ints):
+            return node
+        # Statements added by BlockCleanup have no lines
+        if storeCounts(ast.Module(body, []))[var] or var in self.pinned or getattr(body[0], "lineno", node.lineno) == node.lineno:
+            return node
+        if isinstance(start, ast.Name) and start.id == var:
+            return node
+
+        products = {}
+        for nd in self.walkBody(body):
+            match nd:
+                case ast.BinOp(ast.Name(id), ast.Mult(), ast.Constant(value)) | \
+                     ast.BinOp(ast.Constant(value), ast.Mult(), ast.Name(id)) if id == var and type(value) is int and value > 1:
+                    products.setdefault(value, []).append(nd)
+        products = dict((factor, found) for factor, found in products.items() if len(found) > 1)
+        if not products:
+            return node
+
+        prelude = []
+        updates = []
+        for factor in sorted(products):
+            name = self.newName(var, factor)
+            if isinstance(start, ast.Constant):
+                initial = ast.Constant(start.value * factor - step * factor)
+            else:
+                initial = ast.BinOp(ast.BinOp(ast.Name(start.id, ast.Load()), ast.Mult(), ast.Constant(factor)),
+                                    ast.Sub(), ast.Constant(step * factor))
+            prelude.append(ast.Assign([ast.Name(name, ast.Store())], initial))
+            updates.append(ast.AugAssign(ast.Name(name, ast.Store()), ast.Add(), ast.Constant(step * factor)))
+            for product in products[factor]:
+                self.replaceNode(body, product, ast.copy_location(ast.Name(name, ast.Load()), product))
+
+        # Same dummy lines as statements moved in front of a loop
+        for stmts, anchor in ((prelude, node), (updates, body[0])):
+            for idx, stmt in enumerate(stmts):
+                line = anchor.lineno - 0.5 + (idx + 1) / (2 * (len(stmts) + 1))
+                for nd in ast.walk(stmt):
+                    if "lineno" in nd._attributes:
+                        nd.lineno = nd.end_lineno = line
+                        nd.col_offset = nd.end_col_offset = 0
+        node.body = updates + body
+        replacement = prelude + [node]
+        self.record(node, ast.Module(replacement, []))
+        return replacement
+
+    """
+    Nodes of a statement list, nested functions and classes are not looked into
+    """
+    def walkBody(self, body):
+        stack = list(body)
+        while stack:
+            nd = stack.pop()
+            if isinstance(nd, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+                continue
+            yield nd
+            stack += ast.iter_child_nodes(nd)
+
+    """
+    Replace a node in a statement list
+    """
+    def replaceNode(self, body, target, replacement):
+        for parent in self.walkBody(body):
+            for field, value in ast.iter_fields(parent):
+                if value is target:
+                    setattr(parent, field, replacement)
+                    return
+                if isinstance(value, list):
+                    for idx, item in enumerate(value):
+                        if item is target:
+                            value[idx] = replacement
+                            return
+
+    def newName(self, var, factor):
+        base = f"_{var}_times{factor}"
+        idx = 0
+        result = base
+        while result in self.names:
+            idx += 1
+            result = f"{base}{idx}"
+        self.names.add(result)
+        return result
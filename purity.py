@@ -0,0 +1,406 @@
+import ast
+from collections import Counter
+from licm import storeCounts
+
+
+# Builtins that neither change their arguments nor depend on state outside
+# them. Like the rest of the optimizer, operators and iteration of the
+# values passed to them are assumed to have no side effects
+PURE_BUILTINS = frozenset([
+    "abs", "all", "any", "bin", "bool", "bytes", "chr", "complex", "dict", "divmod", "enumerate",
+    "filter", "float", "frozenset", "hash", "hex", "int", "isinstance", "issubclass", "len", "list",
+    "map", "max", "min", "oct", "ord", "pow", "range", "reversed", "round", "set", "slice", "sorted",
+    "str", "sum", "tuple", "type", "zip", "ArithmeticError", "Exception", "IndexError", "KeyError",
+    "NotImplementedError", "RuntimeError", "TypeError", "ValueError", "ZeroDivisionError",
+])
+
+# Methods that may be called on containers created in the function
+CONTAINER_METHODS = frozenset([
+    "add", "append", "clear", "copy", "count", "discard", "extend", "get", "index", "insert", "items",
+    "keys", "pop", "popitem", "remove", "reverse", "setdefault", "sort", "update", "values",
+])
+
+# Builtins creating new containers
+FRESH_BUILTINS = frozenset(["dict", "list", "set"])
+
+# Builtins whose result is immutable whatever their arguments are
+IMMUTABLE_RESULTS = frozenset([
+    "bin", "bool", "chr", "complex", "float", "hash", "hex", "int", "isinstance", "issubclass", "len",
+    "oct", "ord", "str",
+])
+
+# Builtins whose result is immutable when their arguments are
+IMMUTABLE_ARGUMENTS = frozenset(["abs", "divmod", "max", "min", "pow", "range", "round", "sum"])
+
+# Annotations of parameters that are hashable whatever value is passed
+HASHABLE_ANNOTATIONS = frozenset(["bool", "bytes", "complex", "float", "frozenset", "int", "str"])
+
+
+"""
+Facts about one function used by PurityAnalysis, computed once from its
+body
+
+@param node: AST node corresponding to function definition
+@param functionTable: mapping from function names to definitions
+"""
+class FunctionFacts:
+    def __init__(self, node, functionTable):
+        self.node = node
+        args = node.args
+        self.params = [arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs]
+        self.varargs = [arg.arg for arg in (args.vararg, args.kwarg) if arg is not None]
+        body = ast.Module(node.body, [])
+        stores = storeCounts(body)
+        self.locals = set(stores) | set(self.params) | set(self.varargs)
+        self.fresh = self.freshLocals(body, stores, functionTable)
+        self.sources = self.valueSources(body, stores)
+        self.returns = [nd.value for nd in ast.walk(body) if isinstance(nd, ast.Return)]
+        self.hasLoop = any(isinstance(nd, (ast.For, ast.While)) for nd in ast.walk(body))
+
+    """
+    Local variables only ever assigned new lists, dicts and sets, changing
+    them cannot change anything outside the function
+    """
+    def freshLocals(self, body, stores, functionTable):
+        assigned = Counter()
+        for nd in ast.walk(body):
+            match nd:
+                case ast.Assign([ast.Name(id)], ast.List() | ast.Dict() | ast.Set() | ast.ListComp() | ast.SetComp() | ast.DictComp()):
+                    assigned[id] += 1
+                case ast.Assign([ast.Name(id)], ast.Call(ast.Name(func))) if (
+                        func in FRESH_BUILTINS and func not in stores and func not in functionTable):
+                    assigned[id] += 1
+        return set(id for id in assigned if assigned[id] == stores[id] and id not in self.params)
+
+    """
+    Expressions each local variable is assigned from. A variable assigned
+    by a statement the value of which is not known gets None. Unpacking an
+    expression and iterating over it give the expression as the source,
+    the parts of an immutable value are immutable as well
+    """
+    def valueSources(self, body, stores):
+        sources = {}
+        handled = Counter()
+
+        def add(target, value):
+            for nd in ast.walk(target):
+                if isinstance(nd, ast.Starred):
+                    # Starred targets get a new list
+                    value = None
+                if isinstance(nd, ast.Name):
+                    sources.setdefault(nd.id, []).append(value)
+                    handled[nd.id] += 1
+
+        for nd in ast.walk(body):
+            match nd:
+                case ast.Assign(targets, value, _):
+                    for target in targets:
+                        match target, value:
+                            case ast.Tuple(elts1) | ast.List(elts1), ast.Tuple(elts2) if len(elts1) == len(elts2):
+                                for idx in range(len(elts1)):
+                                    add(elts1[idx], elts2[idx])
+                            case ast.Name() | ast.Tuple() | ast.List(), _:
+                                add(target, value)
+                case ast.AugAssign(ast.Name(id) as target, op, value):
+                    add(target, ast.BinOp(ast.Name(id, ast.Load()), op, value))
+                case ast.AnnAssign(ast.Name() as target, _, value) if value is not None:
+                    add(target, value)
+                case ast.For(target, iter):
+                    add(target, iter)
+        for id in stores:
+            if handled[id] < stores[id]:
+                sources.setdefault(id, []).append(None)
+        return sources
+
+
+"""
+Effect analysis over the functions of a module. A function is pure when
+it does not declare globals or nonlocals, does not read variables outside
+it other than functions and builtins, only changes containers it created
+itself and only calls pure functions, so calling it again with the same
+arguments gives the same result and changes nothing. Recursive functions
+are pure unless something else in them has an effect.
+
+For memoization, a function must also take hashable arguments and return
+immutable values, so a cached result cannot be changed by its callers.
+Arguments are hashable when every parameter is annotated with a hashable
+builtin type, or when the function is only ever called, never used as a
+value, and every call in the tree passes values that are immutable. Values
+are immutable when they are built from constants, parameters of functions
+taking hashable arguments and calls of functions returning immutable
+values through operators, tuples and builtins like len and range.
+
+All properties are the largest solutions of their equations, found by
+starting with every function having them and dropping them until nothing
+changes. Called names are resolved through the top-level functions the
+module binds only once, methods and names bound to anything else are
+not known and calling them is an effect
+
+@param module: ModuleIndex or LazyFunctionTable of the module, called
+               names are resolved through its moduleFunctions
+@param tree: tree whose calls give the arguments of the functions, the
+             functions defined in it and the functions they call are analyzed
+"""
+class PurityAnalysis:
+    def __init__(self, module, tree):
+        self.functionTable = module.moduleFunctions
+        self.tree = tree
+        self.facts = {}
+        self.calls = {}
+        self.escaping = set()
+        self.stores = storeCounts(tree)
+        self.collectFunctions()
+        self.collectCalls(tree, None)
+
+        self.pure = set()
+        callees = {}
+        for name in self.facts:
+            callees[name] = self.calleesIfPure(self.facts[name])
+            if callees[name] is not None:
+                self.pure.add(name)
+        changed = True
+        while changed:
+            changed = False
+            for name in list(self.pure):
+                if not callees[name] <= self.pure:
+                    self.pure.discard(name)
+                    changed = True
+
+        self.hashable = set(self.facts)
+        self.immutableReturns = set(self.facts)
+        self.immutableNames = {}
+        changed = True
+        while changed:
+            changed = False
+            for name in self.facts:
+                self.immutableNames[name] = self.findImmutableNames(name)
+            for name in list(self.hashable):
+                if not self.takesHashable(name):
+                    self.hashable.discard(name)
+                    changed = True
+            for name in list(self.immutableReturns):
+                names = self.immutableNames[name]
+                if not all(value is None or self.isImmutable(value, names, name) for value in self.facts[name].returns):
+                    self.immutableReturns.discard(name)
+                    changed = True
+
+    """
+    Facts of the functions defined in the tree and of every function they
+    call, following calls through the function table
+    """
+    def collectFunctions(self):
+        stack = [node for node in ast.walk(self.tree) if isinstance(node, ast.FunctionDef)]
+        while stack:
+            node = stack.pop()
+            if node.name in self.facts or self.functionTable.get(node.name) is not node:
+                continue
+            facts = FunctionFacts(node, self.functionTable)
+            self.facts[node.name] = facts
+            for nd in ast.walk(node):
+                if isinstance(nd, ast.Name) and nd.id in self.functionTable and nd.id not in facts.locals:
+                    stack.append(self.functionTable[nd.id])
+
+    """
+    Record every call of a function of the table in the tree with the
+    function it is made in, and the functions used other than by calling them
+
+    @param function: name of the analyzed function the node is in, None
+                     for code outside them
+    """
+    def collectCalls(self, node, function):
+        for child in ast.iter_child_nodes(node):
+            match child:
+                case ast.FunctionDef(name) if name in self.facts and self.facts[name].node is child:
+                    self.collectCalls(child, name)
+                case ast.FunctionDef() | ast.AsyncFunctionDef() | ast.Lambda() | ast.ClassDef():
+                    # Names in them are not the ones of the function
+                    self.collectCalls(child, None)
+                case ast.Call(ast.Name(id) as func, args, keywords):
+                    self.calls.setdefault(id, []).append((child, function))
+                    for arg in args:
+                        self.collectCalls(arg, function)
+                    for keyword in keywords:
+                        self.collectCalls(keyword, function)
+                case ast.Name(id, ast.Load()):
+                    self.escaping.add(id)
+                case _:
+                    self.collectCalls(child, function)
+
+    """
+    Functions a function reads if nothing else in it has an effect, None
+    when it has one
+    """
+    def calleesIfPure(self, facts):
+        callees = set()
+        for nd in ast.walk(ast.Module(facts.node.body, [])):
+            match nd:
+                case (ast.Global() | ast.Nonlocal() | ast.Yield() | ast.YieldFrom() | ast.Await() | ast.Import()
+                      | ast.ImportFrom() | ast.FunctionDef() | ast.AsyncFunctionDef() | ast.ClassDef() | ast.Lambda()
+                      | ast.With() | ast.AsyncWith() | ast.AsyncFor()):
+                    return None
+                case ast.Name(id, ast.Load()):
+                    if id in facts.locals:
+                        continue
+                    if id in self.functionTable:
+                        callees.add(id)
+                    elif id not in PURE_BUILTINS or self.stores[id]:
+                        return None
+                case ast.Call(ast.Name(id)):
+                    if id in facts.locals:
+                        return None
+                case ast.Call(ast.Attribute(ast.Name(id), method)):
+                    if id not in facts.fresh or method not in CONTAINER_METHODS:
+                        return None
+                case ast.Call():
+                    return None
+                case ast.Subscript(ast.Name(id), _, ast.Store() | ast.Del()) if id in facts.fresh:
+                    pass
+                case ast.Subscript(_, _, ast.Store() | ast.Del()) | ast.Attribute(_, _, ast.Store() | ast.Del()):
+                    return None
+        return callees
+
+    """
+    Local variables of a function only holding immutable values, with its
+    parameters when it takes hashable arguments
+    """
+    def findImmutableNames(self, function):
+        facts = self.facts[function]
+        names = set(facts.locals) - set(facts.params) - set(facts.varargs)
+        if function in self.hashable:
+            names |= set(facts.params)
+        changed = True
+        while changed:
+            changed = False
+            for name in list(names):
+                for value in facts.sources.get(name, []):
+                    if value is None or not self.isImmutable(value, names, function):
+                        names.discard(name)
+                        changed = True
+                        break
+        return names
+
+    """
+    Check whether an expression always gives an immutable value
+
+    @param names: variables holding immutable values
+    @param function: name of the analyzed function the expression is in,
+                     None for code outside them
+    """
+    def isImmutable(self, node, names, function):
+        local = self.facts[function].locals if function is not None else set()
+        match node:
+            case ast.Constant() | ast.JoinedStr():
+                return True
+            case ast.Name(id):
+                return id in names
+            case ast.BinOp(left, _, right):
+                return self.isImmutable(left, names, function) and self.isImmutable(right, names, function)
+            case ast.UnaryOp(_, operand):
+                return self.isImmutable(operand, names, function)
+            case ast.BoolOp(_, values) | ast.Tuple(values, ast.Load()):
+                return all(self.isImmutable(nd, names, function) for nd in values)
+            case ast.Compare(left, _, comparators):
+                return self.isImmutable(left, names, function) and all(self.isImmutable(nd, names, function) for nd in comparators)
+            case ast.IfExp(_, body, orelse):
+                return self.isImmutable(body, names, function) and self.isImmutable(orelse, names, function)
+            case ast.Subscript(value, _, ast.Load()):
+                return self.isImmutable(value, names, function)
+            case ast.Call(ast.Name(id), args, keywords) if id not in local:
+                if id in self.functionTable:
+                    return id in self.immutableReturns
+                if self.stores[id]:
+                    return False
+                if id in IMMUTABLE_RESULTS:
+                    return True
+                if id in IMMUTABLE_ARGUMENTS and not keywords:
+                    return all(self.isImmutable(nd, names, function) for nd in args)
+        return False
+
+    """
+    Check whether every argument passed to a function is hashable
+    """
+    def takesHashable(self, name):
+        facts = self.facts[name]
+        args = facts.node.args
+        annotated = args.posonlyargs + args.args + args.kwonlyargs
+        if all(isinstance(arg.annotation, ast.Name) and arg.annotation.id in HASHABLE_ANNOTATIONS for arg in annotated):
+            if not facts.varargs:
+                return True
+        if facts.varargs or name in self.escaping or self.stores[name] > 1:
+            return False
+        if not facts.params:
+            return True
+        calls = self.calls.get(name, [])
+        if all(function == name for _, function in calls):
+            # Only calls from the function itself, the first call is not known
+            return False
+        for call, function in calls:
+            names = self.immutableNames[function] if function is not None else set()
+            for arg in call.args:
+                if not self.isImmutable(arg, names, function):
+                    return False
+            for keyword in call.keywords:
+                if keyword.arg is None or not self.isImmutable(keyword.value, names, function):
+                    return False
+        return True
+
+    """
+    Check whether a top-level function can be wrapped in a cache. It has to
+    be pure, take hashable arguments, return immutable values and do
+    enough work for a cache lookup to be cheaper: loop or call a function
+    of the table
+    """
+    def isMemoizable(self, node):
+        if not isinstance(node, ast.FunctionDef) or node.decorator_list or node.name not in self.facts:
+            return False
+        facts = self.facts[node.name]
+        if facts.node is not node or node.name not in self.pure:
+            return False
+        if node.name not in self.hashable or node.name not in self.immutableReturns:
+            return False
+        calls = any(isinstance(nd, ast.Call) and isinstance(nd.func, ast.Name) and nd.func.id in self.functionTable
+                    and nd.func.id not in facts.locals for nd in ast.walk(node))
+        return facts.hasLoop or calls
+
+
+"""
+Wrap the pure top-level functions of a tree that take hashable arguments
+in functools.lru_cache. Results of a function are cached with the types
+of its arguments, so f(1) and f(1.0) are cached apart. Imports functools
+in front of the first wrapped function unless it is already imported
+before it. Nothing is wrapped when the name functools is used for
+something else. Returns the wrapped function definitions
+
+@param tree: module to transform, modified in place
+@param module: ModuleIndex or LazyFunctionTable of the module, called
+               names are resolved through its moduleFunctions
+@param edits: if given, the wrapped functions are recorded in it, see recordEdit
+@param maxsize: results each cache keeps
+"""
+def memoizePureFunctions(tree, module, edits=None, maxsize=128):
+    analysis = PurityAnalysis(module, tree)
+    memoized = [node for node in tree.body if analysis.isMemoizable(node)]
+    if not memoized:
+        return []
+
+    position = tree.body.index(memoized[0])
+    imported = False
+    for node in tree.body[:position]:
+        if isinstance(node, ast.Import) and any(alias.name == "functools" and alias.asname is None for alias in node.names):
+            imported = True
+    if not imported:
+        if storeCounts(tree)["functools"] or any(isinstance(nd, ast.Name) and nd.id == "functools" for nd in ast.walk(tree)):
+            return []
+        importNode = ast.copy_location(ast.Import([ast.alias("functools")]), memoized[0])
+        tree.body.insert(position, importNode)
+
+    for node in memoized:
+        decorator = ast.Call(ast.Attribute(ast.Name("functools", ast.Load()), "lru_cache", ast.Load()), [],
+                             [ast.keyword("maxsize", ast.Constant(maxsize)), ast.keyword("typed", ast.Constant(True))])
+        node.decorator_list.append(decorator)
+        for nd in ast.walk(decorator):
+            ast.copy_location(nd, node)
+        if edits is not None:
+            # The import is written together with the first function
+            edits[node] = ast.Module([importNode, node], []) if node is memoized[0] and not imported else node
+    return memoized
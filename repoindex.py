@@ -0,0 +1,316 @@
+import ast
+import hashlib
+import os
+import sqlite3
+from closure import DependencyMatrix
+from symbols import ModuleIndex
+from transform import DeadCodeElim
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS functions (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    lineno INTEGER NOT NULL,
+    end_lineno INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS definitions (
+    function_id INTEGER NOT NULL REFERENCES functions(id) ON DELETE CASCADE,
+    variable TEXT NOT NULL,
+    line REAL NOT NULL,
+    dependency TEXT
+);
+CREATE TABLE IF NOT EXISTS uses (
+    function_id INTEGER NOT NULL REFERENCES functions(id) ON DELETE CASCADE,
+    variable TEXT NOT NULL,
+    line REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS edges (
+    function_id INTEGER NOT NULL REFERENCES functions(id) ON DELETE CASCADE,
+    variable TEXT NOT NULL,
+    dependency TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS return_feeds (
+    function_id INTEGER NOT NULL REFERENCES functions(id) ON DELETE CASCADE,
+    variable TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS findings (
+    function_id INTEGER NOT NULL REFERENCES functions(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    variable TEXT NOT NULL,
+    line REAL
+);
+CREATE INDEX IF NOT EXISTS functions_file ON functions(file_id);
+CREATE INDEX IF NOT EXISTS functions_name ON functions(name);
+CREATE INDEX IF NOT EXISTS definitions_variable ON definitions(function_id, variable);
+CREATE INDEX IF NOT EXISTS uses_variable ON uses(function_id, variable);
+CREATE INDEX IF NOT EXISTS edges_variable ON edges(function_id, variable);
+CREATE INDEX IF NOT EXISTS edges_dependency ON edges(dependency);
+CREATE INDEX IF NOT EXISTS return_feeds_function ON return_feeds(function_id);
+CREATE INDEX IF NOT EXISTS findings_kind ON findings(kind);
+"""
+
+
+"""
+Analysis results of every Python file under a directory, kept in a
+SQLite database. A file is analyzed again only when its modification
+time changed and its content hash differs from the indexed one, the rows
+of a file are replaced as a whole
+
+Tables: files, functions, definitions (one row per dependency of each
+definition), uses, edges (transitive dependencies of each variable),
+return_feeds (names the returned values depend on) and findings with
+kind 'dead_store' (definition not reaching a use), 'unused' (variable
+never used) or 'no_return_effect' (variable not affecting the return)
+
+Functions that cannot be analyzed, or whose analysis goes over the
+budget, are stored with the error and no results
+
+@param dbPath: path of the database file, created if missing
+@param budget: AnalysisBudget of each function, None for no limits
+"""
+class RepositoryIndex:
+    def __init__(self, dbPath, budget=None):
+        self.budget = budget
+        self.connection = sqlite3.connect(dbPath)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    """
+    Bring the index up to date with the Python files under the given
+    directory. Returns the number of files analyzed, unchanged and removed
+
+    @param root: directory to index, paths are stored relative to it
+    """
+    def update(self, root):
+        analyzed = unchanged = 0
+        seen = set()
+        for directory, dirs, files in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                if not name.endswith(".py"):
+                    continue
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, root)
+                seen.add(relative)
+                if self.updateFile(path, relative):
+                    analyzed += 1
+                else:
+                    unchanged += 1
+                # Files indexed so far are kept if a later one fails
+                self.connection.commit()
+
+        removed = 0
+        for fileId, path in self.connection.execute("SELECT id, path FROM files").fetchall():
+            if path not in seen:
+                self.connection.execute("DELETE FROM files WHERE id = ?", (fileId,))
+                removed += 1
+        self.connection.commit()
+        return analyzed, unchanged, removed
+
+    """
+    Index a single file if it changed, returns whether it was analyzed
+    """
+    def updateFile(self, path, relative):
+        mtime = os.stat(path).st_mtime_ns
+        row = self.connection.execute("SELECT id, mtime, hash FROM files WHERE path = ?", (relative,)).fetchone()
+        if row is not None and row[1] == mtime:
+            return False
+        file = open(path, "rb")
+        data = file.read()
+        file.close()
+        digest = hashlib.sha256(data).hexdigest()
+        if row is not None and row[2] == digest:
+            self.connection.execute("UPDATE files SET mtime = ? WHERE id = ?", (mtime, row[0]))
+            return False
+
+        if row is not None:
+            self.connection.execute("DELETE FROM files WHERE id = ?", (row[0],))
+        try:
+            tree = ast.parse(data)
+        except (SyntaxError, ValueError) as e:
+            self.connection.execute("INSERT INTO files (path, mtime, hash, error) VALUES (?, ?, ?, ?)",
+                                    (relative, mtime, digest, str(e)))
+            return True
+        fileId = self.connection.execute("INSERT INTO files (path, mtime, hash) VALUES (?, ?, ?)",
+                                         (relative, mtime, digest)).lastrowid
+        self.indexFunctions(fileId, ModuleIndex(tree).functionTable)
+        return True
+
+    """
+    Analyze every function of a file and insert the results. A function
+    whose analysis or results fail is stored with the error, the rows
+    inserted for it before the failure are rolled back
+    """
+    def indexFunctions(self, fileId, functionTable):
+        # A fresh analysis per file, scope information accumulates across functions
+        deadcode = DeadCodeElim(functionTable, budget=self.budget)
+        for func in functionTable:
+            node = functionTable[func]
+            self.connection.execute("SAVEPOINT function")
+            try:
+                self.indexFunction(fileId, func, functionTable, deadcode)
+            except Exception as e:
+                self.connection.execute("ROLLBACK TO function")
+                self.connection.execute("INSERT INTO functions (file_id, name, lineno, end_lineno, error) VALUES (?, ?, ?, ?, ?)",
+                                        (fileId, func, node.lineno, node.end_lineno, repr(e)))
+            self.connection.execute("RELEASE function")
+
+    """
+    Analyze a single function and insert its results. Definitions of
+    subscripts and attributes can be keyed by other nodes than names, only
+    names are stored
+    """
+    def indexFunction(self, fileId, func, functionTable, deadcode):
+        node = functionTable[func]
+        res = ({}, {}, {})
+        deadcode.findDeadCodeInFunction(func, res[0], res[1], res[2])
+        functionId = self.connection.execute("INSERT INTO functions (file_id, name, lineno, end_lineno) VALUES (?, ?, ?, ?)",
+                                             (fileId, func, node.lineno, node.end_lineno)).lastrowid
+        referenceTable = deadcode.allDefinitions
+        rows = []
+        for var in referenceTable:
+            if var in functionTable or not isinstance(var, str):
+                continue
+            for line in referenceTable[var]:
+                names = [dep for dep in referenceTable[var][line] if isinstance(dep, str)]
+                for dep in names or [None]:
+                    rows.append((functionId, var, line, dep))
+        self.connection.executemany("INSERT INTO definitions VALUES (?, ?, ?, ?)", rows)
+
+        rows = []
+        for var in deadcode.allUses:
+            if not isinstance(var, str):
+                continue
+            for line in set(deadcode.allUses[var]):
+                rows.append((functionId, var, line))
+        self.connection.executemany("INSERT INTO uses VALUES (?, ?, ?)", rows)
+
+        matrix = DependencyMatrix(referenceTable, functionTable)
+        rows = []
+        for var, deps in matrix.allDependencies().items():
+            if not isinstance(var, str):
+                continue
+            for dep in deps:
+                if isinstance(dep, str):
+                    rows.append((functionId, var, dep))
+        self.connection.executemany("INSERT INTO edges VALUES (?, ?, ?)", rows)
+        feeds = [name for name in matrix.reachesReturn() if isinstance(name, str)]
+        self.connection.executemany("INSERT INTO return_feeds VALUES (?, ?)", [(functionId, name) for name in sorted(feeds)])
+
+        rows = []
+        for var, lines in res[0][func].items():
+            if not isinstance(var, str):
+                continue
+            for line in sorted(set(lines)):
+                rows.append((functionId, "dead_store", var, line))
+        for var in res[1][func]:
+            if not isinstance(var, str):
+                continue
+            for line in referenceTable[var]:
+                rows.append((functionId, "unused", var, line))
+        for var in res[2][func]:
+            if isinstance(var, str):
+                rows.append((functionId, "no_return_effect", var, None))
+        self.connection.executemany("INSERT INTO findings VALUES (?, ?, ?, ?)", rows)
+
+    """
+    Findings of the given kind over the whole repository, as
+    (path, function, variable, line) rows
+    """
+    def findings(self, kind):
+        return self.connection.execute("""
+            SELECT files.path, functions.name, findings.variable, findings.line
+            FROM findings JOIN functions ON functions.id = findings.function_id
+                          JOIN files ON files.id = functions.file_id
+            WHERE findings.kind = ?
+            ORDER BY files.path, functions.lineno, findings.line""", (kind,)).fetchall()
+
+    """
+    Names the returned values of every function with the given name
+    depend on, as (path, function, variable) rows
+    """
+    def returnFeeds(self, functionName):
+        return self.connection.execute("""
+            SELECT files.path, functions.name, return_feeds.variable
+            FROM return_feeds JOIN functions ON functions.id = return_feeds.function_id
+                              JOIN files ON files.id = functions.file_id
+            WHERE functions.name = ?
+            ORDER BY files.path, functions.lineno, return_feeds.variable""", (functionName,)).fetchall()
+
+    """
+    Transitive dependencies of a variable in every function with the given
+    name, as (path, function, dependency) rows
+    """
+    def dependencies(self, functionName, variableName):
+        return self.connection.execute("""
+            SELECT files.path, functions.name, edges.dependency
+            FROM edges JOIN functions ON functions.id = edges.function_id
+                       JOIN files ON files.id = functions.file_id
+            WHERE functions.name = ? AND edges.variable = ?
+            ORDER BY files.path, functions.lineno, edges.dependency""", (functionName, variableName)).fetchall()
+
+    """
+    Functions that could not be analyzed, as (path, function, error) rows
+    """
+    def errors(self):
+        return self.connection.execute("""
+            SELECT files.path, functions.name, functions.error
+            FROM functions JOIN files ON files.id = functions.file_id
+            WHERE functions.error IS NOT NULL
+            UNION ALL
+            SELECT path, NULL, error FROM files WHERE error IS NOT NULL
+            ORDER BY 1""").fetchall()
+
+
+"""
+Update the index of a directory and print the answer to a query
+
+@param root: directory to index
+@param dbPath: database file, .dataflow.sqlite in the directory when None
+@param query: 'dead-stores', 'unused', 'no-return-effect', 'return-feeds',
+              'dependencies' or 'errors', None to only update the index
+@param functionName: function for the 'return-feeds' and 'dependencies' queries
+@param variableName: variable for the 'dependencies' query
+@param budget: AnalysisBudget of each function, None for no limits
+"""
+def runRepositoryIndex(root, dbPath=None, query=None, functionName=None, variableName=None, budget=None):
+    if dbPath is None:
+        dbPath = os.path.join(root, ".dataflow.sqlite")
+    index = RepositoryIndex(dbPath, budget)
+    try:
+        analyzed, unchanged, removed = index.update(root)
+        if query is None:
+            print("Analyzed files:", analyzed, "unchanged:", unchanged, "removed:", removed)
+            return
+
+        kinds = {"dead-stores": "dead_store", "unused": "unused", "no-return-effect": "no_return_effect"}
+        if query in kinds:
+            for path, func, var, line in index.findings(kinds[query]):
+                if line is None:
+                    print(f"{path}: {func}: {var}")
+                else:
+                    print(f"{path}:{line:g}: {func}: {var}")
+        elif query == "return-feeds":
+            for path, func, var in index.returnFeeds(functionName):
+                print(f"{path}: {func}: {var}")
+        elif query == "dependencies":
+            for path, func, dep in index.dependencies(functionName, variableName):
+                print(f"{path}: {func}: {variableName} depends on {dep}")
+        elif query == "errors":
+            for path, func, error in index.errors():
+                print(f"{path}: {func}: {error}")
+    finally:
+        index.close()
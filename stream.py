@@ -0,0 +1,99 @@
+import ast
+import shelve
+import sys
+import tempfile
+from lazy import LazySource, LazyFunctionTable
+from symbols import ModuleIndex
+from transform import transformTree, collectUnimportantVariables, printUnimportantVariables, printDegradedFunctions
+
+
+"""
+Function table for streaming over a file. Every function name in the
+file is known from the split of the file, only the definitions of the
+top-level statement being transformed are kept, other definitions are
+parsed again when looked up and not cached
+"""
+class StreamFunctionTable(LazyFunctionTable):
+    def __init__(self, source):
+        super().__init__(source)
+        self.currentSpan = None
+        self.currentIndex = None
+
+    """
+    Make the given statement the one being transformed, releasing the
+    definitions of the previous one
+    """
+    def load(self, span, statements):
+        self.currentSpan = span
+        self.currentIndex = ModuleIndex(ast.Module(statements, []))
+        return self.currentIndex
+
+    def parse(self, span):
+        if span is self.currentSpan:
+            return self.currentIndex
+        return ModuleIndex(ast.Module(self.source.parseStatements(span), []))
+
+    """
+    Names the table resolves to definitions of the current statement, in
+    the order of their definitions
+    """
+    def currentFunctions(self):
+        return [name for name in self.currentIndex.functionTable if self.spans[name][1] is self.currentSpan]
+
+
+"""
+Transform the file one top-level statement at a time. Only the statement
+being transformed is parsed and kept in memory, its unparsed code and its
+part of the report are spilled to a shelve in a temporary directory and
+read back at the end, so the output is the same as the output of
+transformLoop while memory use does not grow with the size of the file
+
+@param filePath: file path to the tested program
+@param options: TransformOptions, defaults are used when None
+"""
+def transformStreaming(filePath, options=None):
+    source = LazySource(filePath)
+    table = StreamFunctionTable(source)
+    directory = tempfile.TemporaryDirectory()
+    store = shelve.open(directory.name + "/results")
+    # Imports are collected as the statements are streamed, calls resolve
+    # against the imports that come before them in the file
+    modules = options.moduleScope(filePath, []) if options is not None else None
+    budget = options.budget if options is not None else None
+    try:
+        count = 0
+        for span in source.spans:
+            statements = source.parseStatements(span)
+            index = table.load(span, statements)
+            if modules is not None and span.kind == "import":
+                modules.addImports(statements)
+            degraded = {}
+            transformTree(ast.Module(statements, []), index, options=options, functionTable=table,
+                          modules=modules, degraded=degraded)
+            mayRemove = collectUnimportantVariables(table, table.currentFunctions(), modules, budget, degraded)
+
+            code = ""
+            for node in statements:
+                if count == 0 and not code:
+                    # Only the first statement of the module can be a docstring
+                    code += ast.unparse(ast.Module([node], []))
+                    continue
+                code += "\n"
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    code += "\n"
+                code += ast.unparse(node)
+            store[str(count)] = (code, mayRemove, degraded)
+            count += 1
+        table.load(None, [])
+
+        for i in range(count):
+            printUnimportantVariables(store[str(i)][1])
+        for i in range(count):
+            printDegradedFunctions(store[str(i)][2])
+        for i in range(count):
+            sys.stdout.write(store[str(i)][0])
+        sys.stdout.write("\n")
+    finally:
+        store.close()
+        directory.cleanup()
+        source.close()
@@ -0,0 +1,253 @@
+import ast
+from collections import Counter
+
+
+"""
+Number of stores to each name at the top level of a module, the bodies of
+functions and classes are not looked into, only their names count
+"""
+def moduleStores(tree):
+    counts = Counter()
+    stack = list(tree.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            counts[node.name] += 1
+            continue
+        match node:
+            case ast.Lambda():
+                continue
+            case ast.Name(id, ast.Store() | ast.Del()):
+                counts[id] += 1
+            case ast.ExceptHandler(_, name) if name is not None:
+                counts[name] += 1
+            case ast.alias(name, asname):
+                counts[asname or name.split(".")[0]] += 1
+            case ast.MatchAs(_, name) | ast.MatchStar(name) if name is not None:
+                counts[name] += 1
+            case ast.MatchMapping(_, _, rest) if rest is not None:
+                counts[rest] += 1
+        stack += ast.iter_child_nodes(node)
+    return counts
+
+
+"""
+Entry of the module index for a single function definition
+
+@param node: AST node of the function definition
+@param qualname: dotted name of the function, nested functions get a
+                 <locals> component like Python's __qualname__
+@param parent: qualified name of the enclosing function or class,
+               None for module-level definitions
+@param depth: number of enclosing functions and classes
+"""
+class Symbol:
+    def __init__(self, node, qualname, parent, depth):
+        self.node = node
+        self.name = node.name
+        self.qualname = qualname
+        self.parent = parent
+        self.depth = depth
+        self.lineno = node.lineno
+        self.end_lineno = node.end_lineno
+        self.nodeCount = 0
+        self.children = []
+
+
+"""
+Index of every function definition in a module, built in one traversal
+of the tree. Functions are keyed by qualified names so methods and nested
+functions sharing a bare name do not overwrite each other. Passes that
+rewrite a function should call refresh with its qualified name instead of
+rebuilding the whole index.
+
+The function table resolves bare names to methods and nested functions
+too. A call of a module-level name is resolved through moduleFunctions,
+which only holds the functions defined at the top level of the module
+that the module binds by nothing but their definition.
+
+@param root: root of the AST of the parsed program
+"""
+class ModuleIndex:
+    def __init__(self, root):
+        self.root = root
+        self.symbols = {}
+        self.qualnames = {}
+        self.classes = {}
+        self.classParents = {}
+        self.functionTable = {}
+        self.moduleStores = Counter()
+        self.moduleFunctions = {}
+        self.nodeCount = self.indexNode(root, None, "", 0)
+        self.buildFunctionTable()
+        self.buildModuleFunctions()
+
+    """
+    Traverse the subtree of the given node, registering every function
+    and class definition on the way. Returns the number of nodes in the subtree
+
+    @param node: root of the subtree
+    @param parent: qualified name of the closest enclosing definition
+    @param prefix: qualified name prefix for definitions in this subtree
+    @param depth: nesting depth of definitions in this subtree
+    """
+    def indexNode(self, node, parent, prefix, depth):
+        match node:
+            case ast.FunctionDef(name=name) | ast.AsyncFunctionDef(name=name):
+                qualname = prefix + name
+                symbol = Symbol(node, qualname, parent, depth)
+                self.symbols[qualname] = symbol
+                self.qualnames[node] = qualname
+                if parent in self.symbols:
+                    self.symbols[parent].children.append(qualname)
+                count = 1
+                for child in ast.iter_child_nodes(node):
+                    count += self.indexNode(child, qualname, qualname + ".<locals>.", depth + 1)
+                symbol.nodeCount = count
+                return count
+            case ast.ClassDef(name=name):
+                qualname = prefix + name
+                self.classes[qualname] = node
+                self.classParents[qualname] = parent
+                count = 1
+                for child in ast.iter_child_nodes(node):
+                    count += self.indexNode(child, qualname, qualname + ".", depth + 1)
+                return count
+        count = 1
+        for child in ast.iter_child_nodes(node):
+            count += self.indexNode(child, parent, prefix, depth)
+        return count
+
+    """
+    Build the mapping from bare function names to definitions used by
+    Analysis. When several definitions share a name, the least nested one
+    wins, and among equally nested ones the last definition wins
+    """
+    def buildFunctionTable(self):
+        self.functionTable.clear()
+        chosen = {}
+        for symbol in self.symbols.values():
+            if not isinstance(symbol.node, ast.FunctionDef):
+                continue
+            if symbol.name in chosen:
+                other = chosen[symbol.name]
+                if (other.depth, -other.lineno) < (symbol.depth, -symbol.lineno):
+                    continue
+            chosen[symbol.name] = symbol
+        for symbol in sorted(chosen.values(), key=lambda x: x.lineno):
+            self.functionTable[symbol.name] = symbol.node
+
+    """
+    Count the names bound at the top level of the module and build
+    moduleFunctions from them. Function bodies are not looked into, so
+    refresh and remove keep both up to date from the definitions they change
+    """
+    def buildModuleFunctions(self):
+        self.moduleStores = moduleStores(self.module())
+        self.moduleFunctions = dict((node.name, node) for node in self.module().body
+                                    if isinstance(node, ast.FunctionDef) and self.moduleStores[node.name] == 1)
+
+    """
+    The root as a module, a root that is a single statement is a module holding only it
+    """
+    def module(self):
+        return self.root if isinstance(self.root, ast.Module) else ast.Module([self.root], [])
+
+    """
+    Return the symbol of the innermost function containing the given line,
+    None if the line is at module level
+
+    @param line: line number in the module
+    """
+    def functionAtLine(self, line):
+        result = None
+        for symbol in self.symbols.values():
+            if symbol.lineno <= line <= symbol.end_lineno:
+                if result is None or symbol.depth > result.depth:
+                    result = symbol
+        return result
+
+    """
+    Re-index a single function after it has been rewritten in place or
+    replaced by a new definition. Only the subtree of that function is
+    traversed, node counts of enclosing functions are adjusted by the difference
+
+    @param qualname: qualified name of the function to refresh
+    @param node: new definition, if the function node itself was replaced
+    """
+    def refresh(self, qualname, node=None):
+        old = self.symbols[qualname]
+        if node is None:
+            node = old.node
+        self.dropNested(qualname)
+        del self.symbols[qualname]
+        del self.qualnames[old.node]
+        prefix = qualname[:len(qualname) - len(old.name)]
+        count = self.indexNode(node, None, prefix, old.depth)
+        symbol = self.symbols[qualname]
+        symbol.parent = old.parent
+        self.adjustCounts(old.parent, count - old.nodeCount)
+        self.buildFunctionTable()
+        if self.moduleFunctions.get(old.name) is old.node:
+            # The definition is the same store under the same name
+            self.moduleFunctions[old.name] = node
+        return symbol
+
+    """
+    Same as refresh, for callers holding the definition node
+    rather than its qualified name
+
+    @param node: AST node of an indexed function definition
+    """
+    def refreshNode(self, node):
+        return self.refresh(self.qualnames[node])
+
+    """
+    Drop a function and everything nested in it from the index
+
+    @param qualname: qualified name of the function to remove
+    """
+    def remove(self, qualname):
+        symbol = self.symbols.pop(qualname)
+        del self.qualnames[symbol.node]
+        self.dropNested(qualname)
+        if symbol.parent in self.symbols:
+            self.symbols[symbol.parent].children.remove(qualname)
+        self.adjustCounts(symbol.parent, -symbol.nodeCount)
+        self.buildFunctionTable()
+        if symbol.depth == 0:
+            # Definitions outside functions and classes are the stores moduleStores counts
+            self.moduleStores[symbol.name] -= 1
+            if self.moduleFunctions.get(symbol.name) is symbol.node:
+                del self.moduleFunctions[symbol.name]
+            remaining = self.functionTable.get(symbol.name)
+            if self.moduleStores[symbol.name] == 1 and any(node is remaining for node in self.module().body):
+                self.moduleFunctions[symbol.name] = remaining
+        return symbol
+
+    """
+    Drop everything nested in the given function from the index
+    """
+    def dropNested(self, qualname):
+        nested = qualname + "."
+        for name in [i for i in self.symbols if i.startswith(nested)]:
+            del self.qualnames[self.symbols[name].node]
+            del self.symbols[name]
+        for name in [i for i in self.classes if i.startswith(nested)]:
+            del self.classes[name]
+            del self.classParents[name]
+
+    """
+    Propagate a change in node count to every enclosing function and the module
+
+    @param qualname: qualified name of the closest enclosing definition
+    @param delta: change in number of nodes
+    """
+    def adjustCounts(self, qualname, delta):
+        self.nodeCount += delta
+        while qualname is not None:
+            if qualname in self.symbols:
+                self.symbols[qualname].nodeCount += delta
+                qualname = self.symbols[qualname].parent
+            else:
+                qualname = self.classParents.get(qualname)
@@ -0,0 +1,178 @@
+import ast
+from licm import storeCounts
+from liveness import pinnedNames
+from passes import RewriteRule
+
+
+"""
+Return statements of a function that call the function itself in tail
+position, None when one of them is in a loop, try or with block, where
+continuing an enclosing loop would behave differently. Statements of
+nested definitions are not looked into
+
+@param body: list of statements
+@param name: name of the function
+"""
+def tailCalls(body, name):
+    calls = []
+    for node in body:
+        match node:
+            case ast.Return(ast.Call(ast.Name(id))) if id == name:
+                calls.append(node)
+            case ast.If(_, body, orelse):
+                inner = tailCalls(body, name)
+                other = tailCalls(orelse, name)
+                if inner is None or other is None:
+                    return None
+                calls += inner + other
+            case ast.FunctionDef() | ast.AsyncFunctionDef() | ast.ClassDef():
+                pass
+            case _:
+                for nd in ast.walk(node):
+                    if isinstance(nd, ast.Return) and isinstance(nd.value, ast.Call) and \
+                            isinstance(nd.value.func, ast.Name) and nd.value.func.id == name:
+                        return None
+    return calls
+
+
+"""
+Check whether running a statement list always ends in a return, raise or
+continue statement
+"""
+def leavesBody(body):
+    if not body:
+        return False
+    match body[-1]:
+        case ast.Return() | ast.Raise() | ast.Continue():
+            return True
+        case ast.If(_, body, orelse):
+            return leavesBody(body) and leavesBody(orelse)
+    return False
+
+
+"""
+Rule turning self tail calls into loops. The body of a function whose
+return statements call the function itself is put in a while True loop,
+and each such return is replaced by an assignment of the arguments to
+the parameters and a continue statement, so no frame is created for the
+call and deep recursion does not reach the recursion limit.
+
+Only top-level functions bound by nothing but their definition, without
+decorators, *args and **kwargs, whose parameters are all passed or have
+constant defaults at the calls, are converted. A function the module
+rebinds, such as one wrapped by an assignment, is called through the
+new value and the wrapper would be skipped.
+Functions with nested functions, lambdas, generator expressions or names
+declared global or nonlocal are kept, since their variables would be
+shared between iterations where calls had their own. Tail calls in
+loops, try and with blocks are not converted. The loop shares the lines
+of the body, so the rule belongs to a pass after the analysis-based ones
+
+@param module: ModuleIndex or LazyFunctionTable of the module, the
+               converted functions are taken from its moduleFunctions
+"""
+class TailCallElimination(RewriteRule):
+    def __init__(self, functionTable, module, edits=None) -> None:
+        super().__init__(functionTable, edits)
+        self.module = module
+
+    def startFunction(self, node):
+        if self.module.moduleFunctions.get(node.name) is not node:
+            return
+        args = node.args
+        if node.decorator_list or args.vararg is not None or args.kwarg is not None or node.name in storeCounts(ast.Module(node.body, [])):
+            return
+        if pinnedNames(node):
+            return
+        for nd in ast.walk(ast.Module(node.body, [])):
+            if isinstance(nd, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda, ast.GeneratorExp,
+                               ast.Yield, ast.YieldFrom, ast.Await)):
+                return
+        calls = tailCalls(node.body, node.name)
+        if not calls:
+            return
+        bindings = [self.bindArguments(node, call.value) for call in calls]
+        if any(binding is None for binding in bindings):
+            return
+
+        # The rule changes the whole function once, before its statements are visited
+        for call, binding in zip(calls, bindings):
+            self.replaceReturn(node, call, binding)
+        start = 0
+        if node.body and isinstance(node.body[0], ast.Expr) and isinstance(node.body[0].value, ast.Constant) \
+                and isinstance(node.body[0].value.value, str):
+            # The docstring stays the first statement
+            start = 1
+        body = node.body[start:]
+        if not leavesBody(body):
+            # Falling off the end of the function returns None
+            body.append(ast.Return(None))
+        elif isinstance(body[-1], ast.Continue):
+            body.pop(-1)
+        loop = ast.While(ast.Constant(True), body, [])
+        loop.lineno = body[0].lineno
+        loop.col_offset = body[0].col_offset
+        loop.end_lineno = node.end_lineno
+        loop.end_col_offset = node.end_col_offset
+        ast.fix_missing_locations(loop)
+        node.body = node.body[:start] + [loop]
+        self.record(node, node)
+
+    """
+    Replace a return statement with a tail call by the assignment of the
+    arguments to the parameters followed by continue
+    """
+    def replaceReturn(self, function, call, binding):
+        for parent in ast.walk(function):
+            for field in ("body", "orelse"):
+                statements = getattr(parent, field, None)
+                if not isinstance(statements, list) or call not in statements:
+                    continue
+                idx = statements.index(call)
+                changed = [(param, value) for param, value in binding
+                           if not (isinstance(value, ast.Name) and value.id == param)]
+                replacement = []
+                if len(changed) == 1:
+                    replacement.append(ast.Assign([ast.Name(changed[0][0], ast.Store())], changed[0][1]))
+                elif changed:
+                    targets = ast.Tuple([ast.Name(param, ast.Store()) for param, _ in changed], ast.Store())
+                    replacement.append(ast.Assign([targets], ast.Tuple([value for _, value in changed], ast.Load())))
+                replacement.append(ast.Continue())
+                for stmt in replacement:
+                    for nd in ast.walk(stmt):
+                        if "lineno" in nd._attributes and not hasattr(nd, "lineno"):
+                            ast.copy_location(nd, call)
+                statements[idx:idx + 1] = replacement
+                return
+
+    """
+    Pair every parameter of a function with the expression a call passes
+    to it, in the order of the parameters. Parameters not passed get their
+    default when it is a constant. None when the call cannot be matched
+    """
+    def bindArguments(self, function, call):
+        args = function.args
+        positional = args.posonlyargs + args.args
+        if len(call.args) > len(positional) or any(isinstance(arg, ast.Starred) for arg in call.args):
+            return None
+        values = {}
+        for param, arg in zip(positional, call.args):
+            values[param.arg] = arg
+        keywordNames = set(arg.arg for arg in args.args + args.kwonlyargs)
+        for keyword in call.keywords:
+            if keyword.arg is None or keyword.arg not in keywordNames or keyword.arg in values:
+                return None
+            values[keyword.arg] = keyword.value
+        defaults = dict(zip([arg.arg for arg in positional[len(positional) - len(args.defaults):]], args.defaults))
+        for arg, default in zip(args.kwonlyargs, args.kw_defaults):
+            if default is not None:
+                defaults[arg.arg] = default
+        binding = []
+        for param in positional + args.kwonlyargs:
+            if param.arg in values:
+                binding.append((param.arg, values[param.arg]))
+            elif isinstance(defaults.get(param.arg), ast.Constant):
+                binding.append((param.arg, ast.Constant(defaults[param.arg].value)))
+            else:
+                return None
+        return binding
@@ -0,0 +1,10 @@
+"""Only the first statement of a module can be its docstring"""
+import math
+
+def area(r):
+    return 3 * r * r
+
+def circle(r):
+    return area(r) + math.tau
+LIMIT = 10
+SCALE = 2
\ No newline at end of file
@@ -0,0 +1,14 @@
+# flags: --stream
+"""Only the first statement of a module can be its docstring"""
+import math
+
+def area(r):
+    pi = 3 # removed after constant propagation
+    unused = r * 2 # removed not used
+    return pi * r * r # constant propagation
+
+def circle(r):
+    # Calls resolve to functions in other top-level statements
+    return area(r) + math.tau
+
+LIMIT = 10; SCALE = 2 # several statements sharing a line stay together
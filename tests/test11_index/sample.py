@@ -0,0 +1,14 @@
+def store(a, x):
+    # Stores into items and attributes change a in place, they are not new definitions
+    a[0].b = x
+    return a
+
+def unpack():
+    # More values than targets, unpacked like any other value, y is never used
+    x, y = 1, 2, 3
+    return x
+
+def dead(n):
+    t = n + 1
+    t = n + 2 # the first store never reaches a use
+    return t
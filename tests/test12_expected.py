@@ -0,0 +1,24 @@
+def hoisted(xs, n):
+    total = 0
+    for i in range(n):
+        scale = i * 2
+        _inv0 = i - 1
+        for x in xs:
+            total += x * scale + _inv0
+    return total
+
+def kept(xs, a, b):
+    total = 0
+    for x in xs:
+        ratio = a / b
+        b = b + 1
+        total += x * ratio + b * 2
+    return total
+
+def mutated(n, b):
+    a = []
+    out = []
+    for i in range(n):
+        a.append(i)
+        out.append(a + b)
+    return out
\ No newline at end of file
@@ -0,0 +1,24 @@
+# flags: --licm
+def hoisted(xs, n):
+    total = 0
+    for i in range(n):
+        for x in xs:
+            scale = i * 2 # moved in front of the inner loop
+            total += x * scale + (i - 1) # i - 1 computed once before the inner loop
+    return total
+
+def kept(xs, a, b):
+    total = 0
+    for x in xs:
+        ratio = a / b # division can raise, it stays in the loop
+        b = b + 1 # b changes in the loop
+        total += x * ratio + b * 2
+    return total
+
+def mutated(n, b):
+    a = []
+    out = []
+    for i in range(n):
+        a.append(i)
+        out.append(a + b) # a changes in the loop and is not an int
+    return out
@@ -0,0 +1,22 @@
+def shared(a, b, c):
+    _cse0 = a * b
+    d = _cse0 + c
+    e = _cse0 - c
+    return d * e
+
+def held(xs, i):
+    first = xs[i] + 1
+    return first * first
+
+def changed(xs, i):
+    x = xs[i] + 1
+    xs.append(x)
+    y = xs[i] + 1
+    return x + y
+
+def looped(a, b, n):
+    s = a * b
+    for k in range(n):
+        t = a * b + k
+        a = t
+    return s + a
\ No newline at end of file
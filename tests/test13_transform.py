@@ -0,0 +1,22 @@
+# flags: --cse
+def shared(a, b, c):
+    d = a * b + c # a * b computed once into a new variable
+    e = a * b - c
+    return d * e
+
+def held(xs, i):
+    first = xs[i] + 1
+    return first * (xs[i] + 1) # reads first instead
+
+def changed(xs, i):
+    x = xs[i] + 1
+    xs.append(x) # the call can change xs, xs[i] + 1 is computed again
+    y = xs[i] + 1
+    return x + y
+
+def looped(a, b, n):
+    s = a * b
+    for k in range(n):
+        t = a * b + k # a changes later in the loop
+        a = t
+    return s + a
@@ -0,0 +1,27 @@
+def full(a):
+    s = 0
+    s = s + 0 * a
+    s = s + 1 * a
+    s = s + 2 * a
+    return (s, 2)
+
+def partial(xs):
+    total = 0
+    for i in range(0, 12, 4):
+        total = total + xs[i]
+        total = total + xs[i + 1]
+        total = total + xs[i + 2]
+        total = total + xs[i + 3]
+    return total
+
+def blocks(a):
+    for i in range(2):
+        if a > i:
+            a = a - i
+    return a
+
+def early(xs):
+    for i in range(3):
+        if xs[i]:
+            break
+    return xs
\ No newline at end of file
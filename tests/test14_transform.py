@@ -0,0 +1,24 @@
+# flags: --unroll 4
+def full(a):
+    s = 0
+    for i in range(3):
+        s = s + i * a # one copy for each value of i
+    return s, i # the last value of i is propagated
+
+def partial(xs):
+    total = 0
+    for i in range(12):
+        total = total + xs[i] # four values of i per iteration
+    return total
+
+def blocks(a):
+    for i in range(2):
+        if a > i: # blocks in the body keep the loop
+            a = a - i
+    return a
+
+def early(xs):
+    for i in range(3):
+        if xs[i]:
+            break # the loop can be left early
+    return xs
@@ -0,0 +1,34 @@
+import functools
+
+@functools.lru_cache(maxsize=128, typed=True)
+def fib(n: int):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+@functools.lru_cache(maxsize=128, typed=True)
+def total(n: int):
+    s = 0
+    for i in range(n):
+        s += fib(i)
+    return s
+counter = []
+
+def logged(n: int):
+    counter.append(n)
+    return fib(n)
+
+def listed(xs):
+    return [fib(x) for x in xs]
+
+class Clock:
+
+    def tick(self):
+        return 1
+tick = lambda: 1
+
+def ticks(n: int):
+    s = 0
+    for _ in range(n):
+        s += tick()
+    return s
\ No newline at end of file
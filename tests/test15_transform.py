@@ -0,0 +1,34 @@
+# flags: --memoize 128
+def fib(n: int):
+    # Pure and calls itself, wrapped in functools.lru_cache
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+def total(n: int):
+    s = 0
+    for i in range(n):
+        s += fib(i)
+    return s
+
+counter = []
+
+def logged(n: int):
+    counter.append(n) # changes a list of the module, not pure
+    return fib(n)
+
+def listed(xs):
+    # Returns a list the caller could change
+    return [fib(x) for x in xs]
+
+class Clock:
+    def tick(self):
+        return 1
+
+tick = lambda: 1
+
+def ticks(n: int):
+    s = 0
+    for i in range(n):
+        s += tick() # calls the lambda, not the method, it is not known to be pure
+    return s
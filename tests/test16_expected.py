@@ -0,0 +1,15 @@
+def constant(x):
+    y = x * 2
+    return y
+
+def unknown(x, flag):
+    if flag:
+        y = x
+    else:
+        y = -x
+    return y
+
+def unbound(x):
+    if 0:
+        z = x
+    return z
\ No newline at end of file
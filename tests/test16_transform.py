@@ -0,0 +1,23 @@
+# flags: --branches
+def constant(x):
+    debug = False
+    if debug: # never taken, removed with the branch
+        print(x)
+    mode = 2
+    if mode == 1:
+        y = x
+    else: # only the else branch is kept
+        y = x * 2
+    return y
+
+def unknown(x, flag):
+    if flag: # the test is not a constant, both branches stay
+        y = x
+    else:
+        y = -x
+    return y
+
+def unbound(x):
+    if 0:
+        z = x # the only assignment of z, the branch stays
+    return z
@@ -0,0 +1,25 @@
+from operator import neg as get
+
+class Box:
+
+    def get(self):
+        return self.value
+
+def square(y):
+    t = y * y
+    return t + 1
+
+def caller(a):
+    _square_t = a * a
+    return _square_t + 1
+
+def imported(x):
+    return get(x)
+
+def countdown(n):
+    if n <= 0:
+        return 0
+    return countdown(n - 1)
+
+def again(n):
+    return countdown(n)
\ No newline at end of file
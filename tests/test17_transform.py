@@ -0,0 +1,24 @@
+# flags: --inline 40
+from operator import neg as get
+
+class Box:
+    def get(self):
+        return self.value
+
+def square(y):
+    t = y * y
+    return t + 1
+
+def caller(a):
+    return square(a) # inlined with t renamed
+
+def imported(x):
+    return get(x) # the method Box.get shares the name, the call stays
+
+def countdown(n):
+    if n <= 0:
+        return 0
+    return countdown(n - 1) # recursive, the call stays
+
+def again(n):
+    return countdown(n)
@@ -0,0 +1,30 @@
+def gcd(a, b):
+    """Greatest common divisor"""
+    while True:
+        if b == 0:
+            return a
+        a, b = (b, a % b)
+
+def total(xs, acc=0):
+    while True:
+        if not xs:
+            return acc
+        xs, acc = (xs[1:], acc + xs[0])
+
+def factorial(n):
+    if n <= 1:
+        return 1
+    return n * factorial(n - 1)
+
+def searched(xs, target):
+    for x in xs:
+        if x == target:
+            return searched(xs[1:], target)
+    return None
+
+def down(n):
+    if n <= 0:
+        return 0
+    return down(n - 1)
+traced = down
+down = lambda n: traced(n) + 1
\ No newline at end of file
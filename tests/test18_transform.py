@@ -0,0 +1,30 @@
+# flags: --tail-calls
+def gcd(a, b):
+    """Greatest common divisor"""
+    if b == 0:
+        return a
+    return gcd(b, a % b) # becomes an assignment and continue
+
+def total(xs, acc=0):
+    if not xs:
+        return acc
+    return total(xs[1:], acc + xs[0]) # both parameters are assigned at once
+
+def factorial(n):
+    if n <= 1:
+        return 1
+    return n * factorial(n - 1) # not a tail call, the function is kept
+
+def searched(xs, target):
+    for x in xs:
+        if x == target:
+            return searched(xs[1:], target) # in a loop, the function is kept
+    return None
+
+def down(n):
+    if n <= 0:
+        return 0
+    return down(n - 1) # calls the lambda bound below, the function is kept
+
+traced = down
+down = lambda n: traced(n) + 1
@@ -0,0 +1,29 @@
+def clamp(x):
+    return min(max(x, 0), 1)
+
+def lengths(items):
+    _clamp = clamp
+    _len = len
+    out = 0
+    for item in items:
+        out += _len(item) + _clamp(item[0])
+    return out
+
+def ranked(items):
+    total = 0
+    for item in items:
+        total += sorted(item)[0]
+    return total
+sorted = list
+
+def once(items):
+    return len(items)
+
+def early(items):
+    out = 0
+    for item in items:
+        out += late(item)
+    return out
+
+def late(item):
+    return item + 1
\ No newline at end of file
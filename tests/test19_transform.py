@@ -0,0 +1,29 @@
+# flags: --localize
+def clamp(x):
+    return min(max(x, 0), 1)
+
+def lengths(items):
+    out = 0
+    for item in items:
+        out += len(item) + clamp(item[0]) # len and clamp are loaded once
+    return out
+
+def ranked(items):
+    total = 0
+    for item in items:
+        total += sorted(item)[0] # sorted is bound by the module below, it stays
+    return total
+
+sorted = list
+
+def once(items):
+    return len(items) # not read in a loop
+
+def early(items):
+    out = 0
+    for item in items:
+        out += late(item) # late is defined below, it stays
+    return out
+
+def late(item):
+    return item + 1
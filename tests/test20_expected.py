@@ -0,0 +1,19 @@
+def evens(xs):
+    res = [x * x for x in xs if x % 2 == 0]
+    return res
+
+def index(words):
+    found = {word: len(word) for word in words}
+    return found
+
+def last(xs):
+    seen = []
+    for x in xs:
+        seen.append(x)
+    return (seen, x)
+
+def ordered(words, key, value):
+    found = {}
+    for word in words:
+        found[key(word)] = value(word)
+    return found
\ No newline at end of file
@@ -0,0 +1,25 @@
+# flags: --comprehensions
+def evens(xs):
+    res = []
+    for x in xs:
+        if x % 2 == 0:
+            res.append(x * x) # becomes a list comprehension
+    return res
+
+def index(words):
+    found = {}
+    for word in words:
+        found[word] = len(word) # becomes a dict comprehension
+    return found
+
+def last(xs):
+    seen = []
+    for x in xs:
+        seen.append(x)
+    return seen, x # x is read after the loop, the loop stays
+
+def ordered(words, key, value):
+    found = {}
+    for word in words:
+        found[key(word)] = value(word) # the value is computed before the key, the loop stays
+    return found
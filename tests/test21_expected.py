@@ -0,0 +1,19 @@
+def squares(n):
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+def strided(xs, n):
+    s = 0
+    _i_times3 = -6
+    for i in range(0, n, 2):
+        _i_times3 += 6
+        s += xs[_i_times3] + xs[_i_times3 + 1]
+    return s
+
+def floats(x):
+    return x ** 2 + 0
+
+def division(a, b):
+    return a // b * 0 + 0
\ No newline at end of file
@@ -0,0 +1,19 @@
+# flags: --peephole
+def squares(n):
+    total = 0
+    for i in range(n):
+        total += i ** 2 + 0 # i holds ints, i * i and the + 0 is dropped
+    return total
+
+def strided(xs, n):
+    s = 0
+    for i in range(0, n, 2):
+        s += xs[i * 3] + xs[i * 3 + 1] # i * 3 becomes a running variable
+    return s
+
+def floats(x):
+    return x ** 2 + 0 # x may be a float, both stay
+
+def division(a, b):
+    k = 0
+    return (a // b) * 0 + k * 0 # a // b can raise, only k * 0 becomes 0
@@ -0,0 +1,15 @@
+cache = {}
+
+def remembered(k, v):
+    cache[k] = v
+    return v
+
+def filled(x):
+    a = [[0]]
+    a[0][0] = x
+    b = a
+    return b
+
+def labeled(o, x):
+    o.label = x
+    return x
\ No newline at end of file
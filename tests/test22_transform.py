@@ -0,0 +1,15 @@
+cache = {}
+
+def remembered(k, v):
+    cache[k] = v # changes the dict of the module, kept as is
+    return v
+
+def filled(x):
+    a = [[0]]
+    a[0][0] = x # changes the list a holds, its definition is kept
+    b = a
+    return b
+
+def labeled(o, x):
+    o.label = x # label is an attribute, not a variable
+    return x
@@ -0,0 +1,12 @@
+# flags: --patch
+def scaled(values, factor):
+    total = 0
+    for value in values:
+        # Comments and formatting outside the edited spans are kept
+        total += value * 2   # constant propagation
+    return total
+
+
+def untouched(a,b):
+    # Nothing to change, the text stays as written
+    return (a+b)
@@ -0,0 +1,13 @@
+# flags: --patch
+def scaled(values, factor):
+    unit = 2 # removed after constant propagation
+    total = 0
+    for value in values:
+        # Comments and formatting outside the edited spans are kept
+        total += value * unit   # constant propagation
+    return total
+
+
+def untouched(a,b):
+    # Nothing to change, the text stays as written
+    return (a+b)
@@ -1,14 +1,29 @@
-from _ast import Assign, Expr, For, FunctionDef, If, Name, Subscript
 import ast
-from typing import Any
-from analysis import Analysis
+import math
+from analysis import Analysis, BudgetExceeded
+from closure import DependencyMatrix
+from symbols import ModuleIndex
+from liveness import DeadStoreElimination
+from licm import LoopInvariantCodeMotion
+from cse import CommonSubexpressionElimination
+from unroll import LoopUnrolling
+from purity import memoizePureFunctions
+from localize import localizeGlobals
+from branches import DeadBranchElimination
+from inline import FunctionInlining
+from tailcall import TailCallElimination
+from comprehension import AccumulationToComprehension
+from peephole import ArithmeticPeephole
+from modules import moduleScopeFor
+from passes import RewriteRule, BlockCleanup, PassManager, Rerun
 
 class DeadCodeElim:
-    def __init__(self, functionTable) -> None:
+    def __init__(self, functionTable, modules=None, budget=None) -> None:
         self.functionTable = functionTable
-        self.analysis = Analysis(functionTable)
+        self.analysis = Analysis(functionTable, modules, budget)
         self.analysis.processCallees = False
         self.allDefinitions = {}
+        self.allUses = {}
         self.allScopes = {}
 
     """
@@ -19,7 +34,8 @@ class DeadCodeElim:
             if lineNumber in self.allDefinitions[var]:
                 return self.allScopes[var][lineNumber]
         
-        return self.getScopeForGivenLine(lineNumber-1)
+        # Dummy lines of moved statements continue from the line before
+        return self.getScopeForGivenLine(math.ceil(lineNumber) - 1)
 
 
     """
@@ -75,46 +91,12 @@ class DeadCodeElim:
 
     """
     This function finds the values that will affect returned
-    variables of the function by traversing from the returned values backwards
+    variables of the function by traversing from the returned values backwards.
+    The traversal is answered by the closure of the dependency graph,
+    see DependencyMatrix.reachesReturn
     """
     def findUnimportantVariables(self, allDefinitions, func, unimportantDefinitions):
-        varsUsedInReturn = allDefinitions['return']
-        totalVisited = []
-        for line in varsUsedInReturn:
-            if line == 0:
-                continue
-            usedVariables = varsUsedInReturn[line]
-            stack = []
-            visited = []
-            for i in usedVariables:
-                stack.append((line, i))
-                visited.append((line, i))
-
-            while stack:
-                curLine, curVar = stack.pop(0)
-                if curVar in self.functionTable:
-                    continue
-                if curVar not in allDefinitions:
-                    continue
-                nextVariables = allDefinitions[curVar]
-                lines = list(nextVariables.keys())
-                lines.sort()
-                idx = -1
-                for i in range(len(lines)):
-                    if lines[i] > curLine:
-                        idx = i - 1
-                nextLine = lines[idx]
-                for vars in nextVariables[nextLine]:
-                    if (nextLine, vars) not in visited:
-                        stack.append((nextLine, vars))
-                        visited.append((nextLine, vars))
-            
-            totalVisited += visited
-
-        totalVisited = list(set(totalVisited))
-        variablesUsedInReturn = []
-        for i in totalVisited:
-            variablesUsedInReturn.append(i[1])
+        variablesUsedInReturn = DependencyMatrix(allDefinitions, self.functionTable).reachesReturn()
 
         unimportantDefinitions[func] = []
         for i in allDefinitions:
@@ -133,171 +115,108 @@ class DeadCodeElim:
         notUsedAtAll = {}
         definitionsMayRemove = {}
         for func in self.functionTable:
-            resTable, useTable, scopeTable = self.analysis.processFunction(self.functionTable[func], [])
-            self.allDefinitions = resTable
-            self.allScopes = scopeTable
-            definitionsToRemove[func] = {}
-            notUsedAtAll[func] = []
-            for var in resTable:
-                if var == 'return':
-                    continue
-                if var in useTable:
-                    uses = useTable[var]
-                    uses = list(set(uses))
-                    definitions = resTable[var]
-                    uses.sort()
-                    scope = scopeTable[var]
-                    self.findUnreachingDefinitions(definitions, uses, scope, var, definitionsToRemove, func)
-                else:
-                    notUsedAtAll[func].append(var)
-
-        
-            self.findUnimportantVariables(resTable, func, definitionsMayRemove)
+            self.findDeadCodeInFunction(func, definitionsToRemove, notUsedAtAll, definitionsMayRemove)
         return (definitionsToRemove, notUsedAtAll, definitionsMayRemove)
 
-def collectFunctions(root):
-    functionTable = {}
-
-    for node in ast.walk(root):
-        match node:
-            case ast.FunctionDef(name, args, body, decorator_list, returns, type_comment, type_params):
-                functionTable[name] = node
-
-    return functionTable
-
-"""
-Transformer for removing definitions that do not have
-use
-"""
-class RemoveTransformer(ast.NodeTransformer):
-    def __init__(self, globalFunctionTable) -> None:
-        super().__init__()
-        self.deadcode = DeadCodeElim(globalFunctionTable)
-        results = self.deadcode.findDeadCode()
-        self.toRemove = results[0]
-        self.notUsedAtAll = results[1]
-        self.mayRemove = results[2]
-        self.currentFunc = None
-        self.subscriptFlag = False
-    
     """
-    Keep track of current function
+    Same as findDeadCode for a single function, results are added to the given mappings
     """
-    def visit_FunctionDef(self, node: FunctionDef) -> Any:
-        self.currentFunc = node.name
-        for nodes in node.body:
-            if isinstance(nodes, ast.Assign):
-                self.visit_Assign(nodes)
+    def findDeadCodeInFunction(self, func, definitionsToRemove, notUsedAtAll, definitionsMayRemove):
+        resTable, useTable, scopeTable = self.analysis.processFunction(self.functionTable[func], [])
+        self.allDefinitions = resTable
+        self.allUses = useTable
+        self.allScopes = scopeTable
+        definitionsToRemove[func] = {}
+        notUsedAtAll[func] = []
+        for var in resTable:
+            if var == 'return':
+                continue
+            if var in useTable:
+                uses = useTable[var]
+                uses = list(set(uses))
+                definitions = resTable[var]
+                uses.sort()
+                scope = scopeTable[var]
+                self.findUnreachingDefinitions(definitions, uses, scope, var, definitionsToRemove, func)
             else:
-                self.visit(nodes)
-        return node
-    
-    """
-    In this transformer we target assign statements and delete them
-    """
-    def visit_Assign(self, node: Assign) -> Any:
-        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
-            target = node.targets[0]
-            if target.id in self.toRemove[self.currentFunc]:
-                if node.lineno in self.toRemove[self.currentFunc][target.id]:
-                    node.targets = []
-                    node.value = ast.Constant("remove")
-            elif target.id in self.notUsedAtAll[self.currentFunc]:
-                node.targets = []
-                node.value = ast.Constant("remove")
-        else:
-            for i in node.targets:
-                if not isinstance(i, ast.Name):
-                    return node
-            
-            newTargets = []
-            for i in node.targets:
-                if i.id in self.toRemove[self.currentFunc] and node.lineno in self.toRemove[self.currentFunc][i.id]:
-                    continue
-                elif i.id in self.notUsedAtAll[self.currentFunc]:
-                    continue
-                newTargets.append(i)
+                notUsedAtAll[func].append(var)
 
-            node.targets = newTargets
+        self.findUnimportantVariables(resTable, func, definitionsMayRemove)
 
-        return node
-    
-    
 """
-In case we cannot delete variables but know that they are not used,
-for example iterator values, we replace them with underscore
+Rule removing definitions that do not reach a use and definitions of
+variables that are never used
 """
-class ReplaceWithUnderScore(ast.NodeTransformer):
-    def __init__(self, globalFunctionTable) -> None:
-        super().__init__()
-        self.deadcode = DeadCodeElim(globalFunctionTable)
-        results = self.deadcode.findDeadCode()
-        self.toRemove = results[0]
-        self.notUsedAtAll = results[1]
-        self.mayRemove = results[2]
+class RemoveUnusedDefinitions(RewriteRule):
+    def __init__(self, globalFunctionTable, edits=None, modules=None, budget=None) -> None:
+        super().__init__(globalFunctionTable, edits)
+        self.deadcode = DeadCodeElim(globalFunctionTable, modules, budget)
+        self.toRemove = {}
+        self.notUsedAtAll = {}
+        self.mayRemove = {}
         self.currentFunc = None
-        self.subscriptFlag = False
 
-    def visit_FunctionDef(self, node: FunctionDef) -> Any:
+    def startFunction(self, node):
         self.currentFunc = node.name
-        for nodes in node.body:
-            self.visit(nodes)
-        return node
-
-    def visit_Subscript(self, node: Subscript) -> Any:
-        self.subscriptFlag = True
-        self.visit(node.value)
-        self.visit(node.slice)
-        self.subscriptFlag = False
-        return node
-    
-    def visit_Name(self, node: Name) -> Any:
-        if node.id in self.toRemove[self.currentFunc] and node.lineno in self.toRemove[self.currentFunc][node.id]:
-            node.id = "_"
-        elif node.id in self.notUsedAtAll[self.currentFunc]:
-            node.id = "_"
-        return node
+        self.deadcode.findDeadCodeInFunction(node.name, self.toRemove, self.notUsedAtAll, self.mayRemove)
 
+    def isRemoved(self, name, line):
+        if name in self.toRemove[self.currentFunc]:
+            return line in self.toRemove[self.currentFunc][name]
+        return name in self.notUsedAtAll[self.currentFunc]
 
-"""
-If after removing assign statement, block is empty, remove the block
-"""
-class RemoveBlocks(ast.NodeTransformer):
-    def visit_If(self, node: If) -> Any:
-        if node.body == [] and node.orelse == []:
-            return None
-        elif node.body == []:
-            node.body.append(ast.Pass())
-        return node
-    
-    def visit_For(self, node: For) -> Any:
-        if node.body == []:
+    """
+    Delete assign statements whose targets are all removed, statements
+    with several targets keep the targets that are still needed
+    """
+    def rewriteStatement(self, node):
+        if not isinstance(node, ast.Assign):
+            return node
+        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            if self.isRemoved(node.targets[0].id, node.lineno):
+                self.record(node, None)
+                return None
+            return node
+
+        for i in node.targets:
+            if not isinstance(i, ast.Name):
+                return node
+
+        newTargets = [i for i in node.targets if not self.isRemoved(i.id, node.lineno)]
+        if len(newTargets) != len(node.targets):
+            self.record(node, node if newTargets else None)
+        if not newTargets:
             return None
+        node.targets = newTargets
         return node
 
 
 """
-Helper for RemoveTransformer, cannot directly remove Assign nodes
+In case we cannot delete variables but know that they are not used,
+for example iterator values, we replace them with underscore. Uses the
+results of the RemoveUnusedDefinitions rule of the same pass
 """
-class CleanUpTransformer(ast.NodeTransformer):
-    def visit_Assign(self, node: Assign) -> Any:
-        if node.targets == []:
-            return None
+class ReplaceWithUnderScore(RewriteRule):
+    def __init__(self, removal, edits=None) -> None:
+        super().__init__(removal.functionTable, edits)
+        self.removal = removal
+
+    def rewriteName(self, node):
+        if self.removal.isRemoved(node.id, node.lineno):
+            node.id = "_"
+            self.record(node, node)
         return node
 
 
 """
-Transformer for constant value propagation
+Rule for constant value propagation
 """
-class ConstantValuePropagation(ast.NodeTransformer):
-    def __init__(self, globalFunctionTable) -> None:
-        super().__init__()
-        self.analysis = Analysis(globalFunctionTable)
+class ConstantValuePropagation(RewriteRule):
+    def __init__(self, globalFunctionTable, edits=None, modules=None, budget=None) -> None:
+        super().__init__(globalFunctionTable, edits)
+        self.analysis = Analysis(globalFunctionTable, modules, budget)
         self.analysis.processCallees = False
-        self.results = {}
-        for func in globalFunctionTable:
-            self.results[func] = self.analysis.processFunction(globalFunctionTable[func], [])
-        self.currentFunc = None
+        self.results = None
         self.allDefinitions = {}
         self.allScopes = {}
 
@@ -306,7 +225,8 @@ class ConstantValuePropagation(ast.NodeTransformer):
             if lineNumber in self.allDefinitions[var]:
                 return self.allScopes[var][lineNumber]
         
-        return self.getScopeForGivenLine(lineNumber-1)
+        # Dummy lines of moved statements continue from the line before
+        return self.getScopeForGivenLine(math.ceil(lineNumber) - 1)
 
     def compareScopes(self, scope1, scope2):
         if scope1 == scope2:
@@ -326,18 +246,15 @@ class ConstantValuePropagation(ast.NodeTransformer):
         else:
             return False
 
-    def visit_FunctionDef(self, node: FunctionDef) -> Any:
-        self.currentFunc = node.name
-        self.allDefinitions = self.results[node.name][0]
-        self.allScopes = self.results[node.name][2]
-        for nodes in node.body:
-            self.visit(nodes)
-        return node
+    def startFunction(self, node):
+        self.results = self.analysis.processFunction(self.functionTable[node.name], [])
+        self.allDefinitions = self.results[0]
+        self.allScopes = self.results[2]
 
-    def visit_Name(self, node: Name) -> Any:
-        uses = self.results[self.currentFunc][1]
-        definitions = self.results[self.currentFunc][0]
-        scope = self.results[self.currentFunc][2]
+    def rewriteName(self, node):
+        uses = self.results[1]
+        definitions = self.results[0]
+        scope = self.results[2]
         if node.id in uses and node.id in definitions:
             varUses = uses[node.id]
             varDefinitions = definitions[node.id]
@@ -365,6 +282,7 @@ class ConstantValuePropagation(ast.NodeTransformer):
                 beforeDefinitionsInScope.sort(key=lambda x: x[0])
                 lastDef = beforeDefinitionsInScope[-1]
                 if len(lastDef[1]) == 1 and isinstance(lastDef[1][0], ast.Constant):
+                    self.record(node, lastDef[1][0])
                     return lastDef[1][0]
         
         return node
@@ -372,42 +290,223 @@ class ConstantValuePropagation(ast.NodeTransformer):
                 
 
 
-def transformLoop(filePath):
-    
+"""
+Record that a node of the original tree was replaced or deleted, so the
+change can be applied to the original source text instead of unparsing
+the whole tree
+
+@param edits: mapping from original nodes to their replacement, None to skip recording
+@param node: node of the original tree, its location is the span that changes
+@param replacement: node whose unparsed text replaces the span, None to delete it
+"""
+def recordEdit(edits, node, replacement):
+    if edits is not None:
+        edits[node] = replacement
+
+
+"""
+Update the module index entries of the functions a transformer changed
+
+@param index: ModuleIndex of the transformed tree
+@param changedFunctions: function definition nodes that were rewritten
+"""
+def refreshFunctions(index, changedFunctions):
+    for node in changedFunctions:
+        if node in index.qualnames:
+            index.refreshNode(node)
+
+
+"""
+Options selecting how the optimizations are applied
+
+@param liveness: remove dead stores with one backward liveness pass per
+                 function instead of repeated reaching-definition rounds
+@param loader: ModuleLoader resolving imports, calls to imported functions
+               are analyzed with their summaries when given
+@param budget: AnalysisBudget of each function, functions going over it
+               are not transformed any further
+@param licm: move loop-invariant assignments and expressions in front of loops
+@param cse: compute repeated expressions once
+@param unroll: statements a for loop over a constant range may have once
+               unrolled, None to not unroll loops
+@param memoize: results the cache of a pure function keeps, None to not
+                cache the results of pure functions
+@param branches: remove the branches of if statements, while loops and
+                 conditional expressions that constant tests never take
+@param inline: nodes the body of a function inlined at its calls may
+               have, None to not inline functions
+@param comprehensions: rewrite loops filling empty containers into comprehensions
+@param peephole: simplify arithmetic and reduce products of loop variables to additions
+@param tailCalls: turn functions returning calls of themselves into loops
+@param localize: bind the builtins and functions read in loops to local
+                 variables at the start of the functions
+"""
+class TransformOptions:
+    def __init__(self, liveness=False, loader=None, budget=None, licm=False, cse=False, unroll=None, memoize=None,
+                 branches=False, inline=None, tailCalls=False,
+                 localize=False, comprehensions=False, peephole=False):
+        self.liveness = liveness
+        self.loader = loader
+        self.budget = budget
+        self.licm = licm
+        self.cse = cse
+        self.unroll = unroll
+        self.memoize = memoize
+        self.branches = branches
+        self.inline = inline
+        self.tailCalls = tailCalls
+        self.localize = localize
+        self.comprehensions = comprehensions
+        self.peephole = peephole
+
+    """
+    Imports of a file for the analysis, None when no loader is set
+
+    @param filePath: path of the file
+    @param body: top-level statements of the file holding its imports
+    """
+    def moduleScope(self, filePath, body):
+        return moduleScopeFor(self.loader, filePath, body)
+
+
+"""
+Apply the optimizations to the given tree until it no longer changes.
+The tree can be the whole module or a module wrapping some of its
+definitions, only the functions in the tree are analyzed
+
+@param tree: AST to transform, modified in place
+@param index: ModuleIndex of the module the definitions belong to
+@param edits: if given, every node the transformers replace or delete is
+              recorded in it, see recordEdit
+@param options: TransformOptions, defaults are used when None
+@param functionTable: mapping from function names to definitions used by
+                      the analysis, the table of the index when None. When
+                      given, its moduleFunctions resolve module-level calls
+@param modules: ModuleScope of the imports of the module, see TransformOptions.moduleScope
+@param degraded: if given, functions whose analysis went over the budget
+                 are recorded in it with the reason
+"""
+def transformTree(tree, index, edits=None, options=None, functionTable=None, modules=None, degraded=None):
+    # Rules rewrite function bodies in place, so the table of the index
+    # stays valid and only the functions they changed need re-indexing
+    globalFunctionTable = index.functionTable if functionTable is None else functionTable
+    # Module-level names resolve to top-level definitions only
+    module = index if functionTable is None else functionTable
+    budget = options.budget if options is not None else None
+
+    if options is not None and options.liveness:
+        # Liveness removes chains of dead stores in a single pass
+        removal = lambda: [DeadStoreElimination(globalFunctionTable, edits), BlockCleanup(globalFunctionTable, edits)]
+        propagation = [ConstantValuePropagation(globalFunctionTable, edits, modules, budget)]
+        passes = [removal(), propagation, removal()]
+    else:
+        t1 = RemoveUnusedDefinitions(globalFunctionTable, edits, modules, budget)
+        removal = lambda: [RemoveUnusedDefinitions(globalFunctionTable, edits, modules, budget), BlockCleanup(globalFunctionTable, edits)]
+        propagation = [ConstantValuePropagation(globalFunctionTable, edits, modules, budget)]
+        passes = [[t1, ReplaceWithUnderScore(t1, edits)], propagation, removal()]
+    if options is not None and options.inline is not None:
+        # Inlined code is optimized by the passes after it together with
+        # the code around the calls
+        passes.insert(0, [FunctionInlining(globalFunctionTable, module, edits, options.inline)])
+    if options is not None and options.branches:
+        # Tests are evaluated as constants are substituted into them, the
+        # join of the removed branches is gone from the analysis of the
+        # simplified functions, so they are propagated into once more
+        branches = DeadBranchElimination(globalFunctionTable, edits)
+        propagation.append(branches)
+        passes.append(Rerun(branches, [[ConstantValuePropagation(globalFunctionTable, edits, modules, budget)], removal()]))
+    if options is not None and options.peephole:
+        # Constants substituted by the propagation are simplified, and the
+        # removal after it sees the simplified expressions
+        passes.insert(passes.index(propagation) + 1, [ArithmeticPeephole(globalFunctionTable, edits)])
+    if options is not None and options.licm:
+        passes.append([LoopInvariantCodeMotion(globalFunctionTable, edits)])
+    if options is not None and options.unroll is not None:
+        # The copies get lines of their own, constants are propagated into
+        # them and the definitions they made unused are removed
+        unrolling = LoopUnrolling(globalFunctionTable, edits, options.unroll)
+        passes.append([unrolling])
+        passes.append(Rerun(unrolling, [[ConstantValuePropagation(globalFunctionTable, edits, modules, budget)], removal()]))
+    if options is not None and options.comprehensions:
+        passes.append([AccumulationToComprehension(globalFunctionTable, edits)])
+    if options is not None and options.tailCalls:
+        # The loop shares the lines of the body, so the analysis-based
+        # passes run on the function before it is rewritten
+        passes.append([TailCallElimination(globalFunctionTable, module, edits)])
+    if options is not None and options.cse:
+        passes.append([CommonSubexpressionElimination(globalFunctionTable, edits, modules, budget)])
+
+    manager = PassManager(globalFunctionTable, passes)
+    tree = manager.run(tree)
+    if options is not None and options.memoize is not None:
+        # Purity is decided on the optimized bodies
+        manager.changedFunctions.update(memoizePureFunctions(tree, module, edits, options.memoize))
+    if options is not None and options.localize:
+        # Builtins are recognized by name until here
+        manager.changedFunctions.update(localizeGlobals(tree, globalFunctionTable, edits))
+    refreshFunctions(index, manager.changedFunctions)
+    if degraded is not None:
+        degraded.update(manager.degraded)
+    return tree
+
+
+"""
+Find the variables that do not affect the return of each given function
+
+@param functionTable: mapping from function names to definitions
+@param functions: names of the functions to check
+@param modules: ModuleScope of the imports of the module, None to not resolve imports
+@param budget: AnalysisBudget of each function, None for no limits
+@param degraded: if given, functions whose analysis went over the budget
+                 are recorded in it with the reason
+"""
+def collectUnimportantVariables(functionTable, functions, modules=None, budget=None, degraded=None):
+    deadcode = DeadCodeElim(functionTable, modules, budget)
+    res = ({}, {}, {})
+    for func in functions:
+        try:
+            deadcode.findDeadCodeInFunction(func, res[0], res[1], res[2])
+        except BudgetExceeded as e:
+            # Every variable may affect the return
+            res[2][func] = []
+            if degraded is not None:
+                degraded[func] = str(e)
+    return res[2]
+
+def printUnimportantVariables(mayRemove):
+    if mayRemove:
+        for i in mayRemove:
+            if mayRemove[i]:
+                print("These variables do not affect return in function:", i)
+                print(mayRemove[i])
+
+def printDegradedFunctions(degraded):
+    for func in degraded:
+        print("Analysis went over budget, results are conservative in function:", func)
+        print(degraded[func])
+
+
+"""
+Transform the file and print the dead-code report and the transformed program
+
+@param filePath: file path to the tested program
+@param options: TransformOptions, defaults are used when None
+"""
+def transformLoop(filePath, options=None):
+
     file = open(filePath, "r")
 
     tree = ast.parse(file.read())
 
     # print(ast.dump(tree, indent=4))
 
-    while True:
-        globalFunctionTable = collectFunctions(tree)
-        t1 = RemoveTransformer(globalFunctionTable)
-        t2 = CleanUpTransformer()
-        t3 = ReplaceWithUnderScore(globalFunctionTable)
-        newTree = t1.visit(tree)
-        newTree = t2.visit(newTree)
-        newTree = t3.visit(newTree)
-        globalFunctionTable = collectFunctions(newTree)
-        t4 = ConstantValuePropagation(globalFunctionTable)
-        newTree = t4.visit(newTree)
-        globalFunctionTable = collectFunctions(newTree)
-        t1 = RemoveTransformer(globalFunctionTable)
-        t2 = CleanUpTransformer()
-        newTree = t1.visit(newTree)
-        newTree = t2.visit(newTree)
-        if tree == newTree:
-            break
-        tree = newTree
-
-    globalFunctionTable = collectFunctions(tree)
-    deadcode = DeadCodeElim(globalFunctionTable)
-    res = deadcode.findDeadCode()
-    if res[2]:
-        for i in res[2]:
-            if res[2][i]:
-                print("These variables do not affect return in function:", i)
-                print(res[2][i])
+    index = ModuleIndex(tree)
+    modules = options.moduleScope(filePath, tree.body) if options is not None else None
+    budget = options.budget if options is not None else None
+    degraded = {}
+    tree = transformTree(tree, index, options=options, modules=modules, degraded=degraded)
 
+    printUnimportantVariables(collectUnimportantVariables(index.functionTable, index.functionTable, modules, budget, degraded))
+    printDegradedFunctions(degraded)
 
     print(ast.unparse(tree))
@@ -0,0 +1,190 @@
+import ast
+import copy
+from licm import storeCounts, readCounts
+from liveness import pinnedNames
+from passes import RewriteRule
+
+
+"""
+Check whether a break or continue statement in a loop body belongs to
+the loop, statements of nested loops and definitions are not looked into
+"""
+def hasLoopExit(body):
+    for node in body:
+        match node:
+            case ast.Break() | ast.Continue():
+                return True
+            case ast.For() | ast.AsyncFor() | ast.While():
+                if hasLoopExit(node.orelse):
+                    return True
+            case ast.FunctionDef() | ast.AsyncFunctionDef() | ast.ClassDef():
+                pass
+            case _:
+                for field in ("body", "orelse", "finalbody"):
+                    if hasLoopExit(getattr(node, field, [])):
+                        return True
+                for item in getattr(node, "handlers", []) + getattr(node, "cases", []):
+                    if hasLoopExit(item.body):
+                        return True
+    return False
+
+
+"""
+Values of the loop variable of a for loop over range with constant
+arguments, None for other loops
+"""
+def constantRange(node):
+    match node.iter:
+        case ast.Call(ast.Name("range"), args, []) if 1 <= len(args) <= 3:
+            values = []
+            for arg in args:
+                if not isinstance(arg, ast.Constant) or type(arg.value) is not int:
+                    return None
+                values.append(arg.value)
+            if len(values) == 3 and values[2] == 0:
+                return None
+            return range(*values)
+    return None
+
+
+"""
+Replace reads of a variable with an expression, except inside nested scopes
+"""
+class SubstituteName(ast.NodeTransformer):
+    def __init__(self, name, value) -> None:
+        self.name = name
+        self.value = value
+
+    def visit_Name(self, node):
+        if node.id == self.name and isinstance(node.ctx, ast.Load):
+            return ast.copy_location(copy.deepcopy(self.value), node)
+        return node
+
+    def visit_FunctionDef(self, node):
+        return node
+
+    visit_AsyncFunctionDef = visit_ClassDef = visit_Lambda = visit_FunctionDef
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = visit_FunctionDef
+
+
+"""
+Give statements made from a loop body lines of their own after the first
+line of the loop, in order, so the analyses of the passes after the
+unrolling tell the copies apart. Every node of a statement gets its line,
+like moved statements of LoopInvariantCodeMotion
+
+@param line: first line of the loop
+"""
+def spreadLines(statements, line):
+    for idx, stmt in enumerate(statements):
+        current = line + (idx + 1) / (2 * (len(statements) + 1))
+        for nd in ast.walk(stmt):
+            if "lineno" in nd._attributes:
+                nd.lineno = nd.end_lineno = current
+                nd.col_offset = nd.end_col_offset = 0
+
+
+"""
+Rule unrolling for loops over range with constant arguments. The body is
+repeated once for every value of the loop variable, with the value in
+place of the variable, and the else block follows. When the variable is
+read outside the loop, its last value is assigned after the copies.
+Loops are unrolled innermost first, and only while the statements of
+the copies stay within the limit.
+
+A loop with too many values to unroll fully is unrolled partially when
+the number of values has a divisor whose copies stay within the limit:
+the loop steps over that many values at once, and its body holds one
+copy for each of them, reading the variable plus a constant.
+
+Loops whose body can leave them early, holds other blocks, stores to the
+loop variable, or uses it in nested functions, lambdas or comprehensions
+are kept. The copies get dummy lines, so constant propagation and the
+removal of unused definitions can run on the function again after it
+"""
+class LoopUnrolling(RewriteRule):
+    def __init__(self, functionTable, edits=None, limit=32) -> None:
+        super().__init__(functionTable, edits)
+        self.limit = limit
+        self.function = None
+        self.pinned = set()
+
+    def startFunction(self, node):
+        self.function = node
+        self.pinned = pinnedNames(node)
+
+    def finishStatement(self, node):
+        if not isinstance(node, ast.For) or not isinstance(node.target, ast.Name):
+            return node
+        values = constantRange(node)
+        name = node.target.id
+        if values is None or name in self.pinned or storeCounts(self.function)["range"] or "range" in self.functionTable:
+            return node
+        if all(isinstance(stmt, ast.Pass) for stmt in node.body):
+            return node
+        if any(hasattr(stmt, "body") for stmt in node.body):
+            # Blocks in the copies would need lines for their joins
+            return node
+        if storeCounts(ast.Module(node.body, []))[name] or hasLoopExit(node.body):
+            return node
+        for nd in ast.walk(ast.Module(node.body, [])):
+            if isinstance(nd, (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)) and name in readCounts([nd]):
+                return node
+
+        size = sum(isinstance(nd, ast.stmt) for stmt in node.body for nd in ast.walk(stmt))
+        # Huge ranges have no length, only the values up to the limit are counted
+        count = len(values[:self.limit + 1])
+        if count > 1 and count * size > self.limit:
+            return self.unrollPartially(node, values, size)
+
+        replacement = []
+        for value in values:
+            for stmt in node.body:
+                replacement.append(SubstituteName(name, ast.Constant(value)).visit(copy.deepcopy(stmt)))
+        if values and readCounts([self.function])[name] > readCounts(node.body)[name]:
+            replacement.append(ast.Assign([ast.Name(name, ast.Store())], ast.Constant(values[-1])))
+        spreadLines(replacement, node.lineno)
+        replacement += node.orelse
+        if not replacement:
+            replacement.append(ast.copy_location(ast.Pass(), node))
+        self.record(node, ast.Module(replacement, []))
+        return replacement
+
+    """
+    Unroll a loop over a range by the largest divisor of its number of
+    values whose copies stay within the limit, the loop is kept when
+    there is none
+    """
+    def unrollPartially(self, node, values, size):
+        factor = self.limit // size
+        # Counted from the last value, huge ranges have no length
+        count = (values[-1] - values.start) // values.step + 1
+        while factor > 1 and count % factor:
+            factor -= 1
+        if factor < 2:
+            return node
+        name = node.target.id
+        body = []
+        for idx in range(factor):
+            for stmt in node.body:
+                if idx == 0:
+                    body.append(copy.deepcopy(stmt))
+                    continue
+                offset = ast.BinOp(ast.Name(name, ast.Load()), ast.Add(), ast.Constant(idx * values.step))
+                body.append(SubstituteName(name, offset).visit(copy.deepcopy(stmt)))
+        spreadLines(body, node.lineno)
+        iter = ast.Call(ast.Name("range", ast.Load()),
+                        [ast.Constant(values.start), ast.Constant(values.stop), ast.Constant(values.step * factor)], [])
+        loop = ast.For(copy.deepcopy(node.target), ast.copy_location(iter, node.iter), body, [])
+        ast.copy_location(loop, node)
+        ast.fix_missing_locations(loop)
+        # The copies and the join of the loop come before the next line
+        loop.end_lineno = node.lineno
+        replacement = [loop]
+        if readCounts([self.function])[name] > readCounts(node.body)[name]:
+            # The variable holds the first value of the last step
+            replacement.append(ast.Assign([ast.Name(name, ast.Store())], ast.Constant(values[-1])))
+            spreadLines(replacement[1:], node.lineno + 0.5)
+        replacement += node.orelse
+        self.record(node, ast.Module(replacement, []))
+        return replacement
@@ -0,0 +1,167 @@
+import ast
+import os
+import time
+from symbols import ModuleIndex
+from transform import transformTree, collectUnimportantVariables, printUnimportantVariables, printDegradedFunctions
+
+
+"""
+Transformed code and dead-code report of one top-level statement of the
+watched file
+
+@param code: unparsed code of the transformed statement
+@param mayRemove: mapping from each function defined in the statement to
+                  the variables that do not affect its return
+@param degraded: mapping from the functions whose analysis went over the
+                 budget to the reason
+"""
+class UnitResult:
+    def __init__(self, code, mayRemove, degraded):
+        self.code = code
+        self.mayRemove = mayRemove
+        self.degraded = degraded
+
+
+"""
+Keeps the results of transforming a file between runs. Every top-level
+statement is cached under its source text, so after an edit only the
+statements whose text changed are analyzed and transformed again. The
+whole cache is dropped when the set of function names, the names bound at
+the top level or the imports of the module change, since the analysis
+and the inlining treat those names specially. With inlining, a statement
+is also cached under the source of the top-level functions it calls,
+directly or through them, so editing a function transforms its callers
+again
+
+@param filePath: file path to the watched program
+@param options: TransformOptions, defaults are used when None
+"""
+class WatchSession:
+    def __init__(self, filePath, options=None):
+        self.filePath = filePath
+        self.options = options
+        self.units = {}
+        self.functionNames = None
+        self.lastModified = None
+
+    """
+    Source text of a top-level statement, including its decorators
+    """
+    def unitSource(self, lines, node):
+        start = node.lineno
+        for decorator in getattr(node, "decorator_list", []):
+            start = min(start, decorator.lineno)
+        return "".join(lines[start - 1:node.end_lineno])
+
+    """
+    Source text of the top-level functions a statement calls, directly or
+    through other such functions, the code that can be inlined into it
+    """
+    def calleeSource(self, lines, index, node):
+        moduleFunctions = index.moduleFunctions
+        called = set()
+        stack = [node]
+        while stack:
+            for nd in ast.walk(stack.pop()):
+                if isinstance(nd, ast.Name) and nd.id in moduleFunctions and nd.id not in called:
+                    called.add(nd.id)
+                    stack.append(moduleFunctions[nd.id])
+        return "".join(self.unitSource(lines, moduleFunctions[name]) for name in sorted(called))
+
+    """
+    Re-read the file and bring every cached result up to date.
+    Returns the names of the functions that had to be analyzed again
+    """
+    def update(self):
+        file = open(self.filePath, "r")
+        source = file.read()
+        file.close()
+        tree = ast.parse(source)
+        index = ModuleIndex(tree)
+        imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+        names = (frozenset(index.functionTable), frozenset(index.moduleStores.items()), ast.dump(ast.Module(imports, [])))
+        if names != self.functionNames:
+            self.units = {}
+            self.functionNames = names
+
+        lines = source.splitlines(keepends=True)
+        modules = self.options.moduleScope(self.filePath, imports) if self.options is not None else None
+        inline = self.options is not None and self.options.inline is not None
+        # Keys are taken before any statement is transformed in place
+        keys = [(self.unitSource(lines, node), self.calleeSource(lines, index, node) if inline else "") for node in tree.body]
+        units = {}
+        order = []
+        reanalyzed = []
+        for node, key in zip(tree.body, keys):
+            if key not in units:
+                if key in self.units:
+                    units[key] = self.units[key]
+                else:
+                    functions = [name for name in index.functionTable
+                                 if node.lineno <= index.functionTable[name].lineno <= node.end_lineno]
+                    budget = self.options.budget if self.options is not None else None
+                    degraded = {}
+                    # Statements can be added in front of the transformed one
+                    unit = ast.Module([node], [])
+                    transformTree(unit, index, options=self.options, modules=modules, degraded=degraded)
+                    mayRemove = collectUnimportantVariables(index.functionTable, functions, modules, budget, degraded)
+                    units[key] = UnitResult(ast.unparse(unit), mayRemove, degraded)
+                    reanalyzed += functions
+            order.append((node, units[key]))
+
+        self.units = units
+        self.order = order
+        return reanalyzed
+
+    """
+    Print the same output as transformLoop from the cached results
+    """
+    def printResults(self):
+        mayRemove = {}
+        degraded = {}
+        code = ""
+        for node, result in self.order:
+            mayRemove.update(result.mayRemove)
+            degraded.update(result.degraded)
+            if code:
+                code += "\n"
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    code += "\n"
+            code += result.code
+
+        printUnimportantVariables(mayRemove)
+        printDegradedFunctions(degraded)
+        print(code)
+
+    """
+    Poll the file and print updated results whenever it changes
+
+    @param interval: seconds between checks of the modification time
+    """
+    def run(self, interval):
+        try:
+            while True:
+                modified = os.stat(self.filePath).st_mtime_ns
+                if modified != self.lastModified:
+                    self.lastModified = modified
+                    try:
+                        reanalyzed = self.update()
+                    except SyntaxError as e:
+                        print("Syntax error, keeping previous results:", e)
+                    else:
+                        print("Re-analyzed functions:", reanalyzed)
+                        self.printResults()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+
+"""
+Run the transformation every time the file changes
+
+@param filePath: file path to the tested program
+@param interval: seconds between checks of the modification time
+@param options: TransformOptions, defaults are used when None
+"""
+def watchTransform(filePath, interval=0.5, options=None):
+    WatchSession(filePath, options).run(interval)